@@ -0,0 +1,47 @@
+#!/usr/bin/python
+"""
+Benchmark of compiled codecs (see compilecodec) against the interpreted codecs they were compiled from, on
+1000 JSON records (median of interleaved runs, CPU time). The interpreted codecs are called through
+CodecSet.decode and CodecSet.encode, so that the json module backend of jsoncodec is not measured.
+
+Usage: python benchmarks/bench_compiler.py [number of runs, default 15]
+"""
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from codecfactory import CodecSet, compilecodec
+from codecfactory.jsoncodec import jsoncodec, jsoncodecsl
+
+def main(repeat):
+    records = [{"id": i, "name": "item %d" % i, "vals": [i, i*0.5, None, True], "tags": {"a": "x", "b": "y"}}
+               for i in range(1000)]
+    multiline = jsoncodec.encode(records)
+    singleline = jsoncodecsl.encode(records)
+    compiled = compilecodec(jsoncodec)
+    compiledsl = compilecodec(jsoncodecsl)
+
+    tasks = [("decode multiline", lambda decode, encode: decode(multiline), jsoncodec, compiled),
+             ("decode singleline", lambda decode, encode: decode(singleline), jsoncodecsl, compiledsl),
+             ("decode from file", lambda decode, encode: decode(io.StringIO(singleline)), jsoncodecsl, compiledsl),
+             ("encode multiline", lambda decode, encode: encode(records), jsoncodec, compiled),
+             ("encode singleline", lambda decode, encode: encode(records), jsoncodecsl, compiledsl)]
+
+    for name, task, interpreted, compiledcodec in tasks:
+        methods = ((lambda data: CodecSet.decode(interpreted, data), lambda obj: CodecSet.encode(interpreted, obj)),
+                   (compiledcodec.decode, compiledcodec.encode))
+        assert task(*methods[0]) == task(*methods[1])
+        times = ([], [])
+        for k in range(repeat):
+            for (decode, encode), result in zip(methods, times):
+                start = time.process_time()
+                task(decode, encode)
+                result.append(time.process_time() - start)
+        a, b = (sorted(result)[repeat//2] for result in times)
+        print("%-18s interpreted %.4fs  compiled %.4fs  (%.0f%% faster)" % (name, a, b, 100*(1 - b/a)))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 15)
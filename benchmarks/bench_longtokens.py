@@ -0,0 +1,40 @@
+#!/usr/bin/python
+"""
+Benchmark for the scanning of long tokens read from a file object (see ReadBuffer.regex_op and
+ReadBuffer.readatleast): decodes a single number token and a single string token of growing size from
+io.StringIO, and reports the time per million characters, which stays flat if scanning is linear.
+
+Usage: python benchmarks/bench_longtokens.py [max size in millions of characters, default 32]
+"""
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from codecfactory import RegExCodec
+from codecfactory.jsoncodec import jsoncodecsl
+import regex
+
+digits = RegExCodec(regex.compile(r"\d+"), name="digits")
+
+def timed(f):
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+def main(maxsize):
+    size = 1
+    print("%12s %22s %22s" % ("chars", "number token", "string token"))
+    while size <= maxsize:
+        n = size*1000000
+        number = "1"*n
+        string = '["' + "x"*n + '"]'
+        a = timed(lambda: digits.decode(io.StringIO(number)))
+        b = timed(lambda: jsoncodecsl.decode(io.StringIO(string)))
+        print("%12d %8.3fs (%.3fs/M) %8.3fs (%.3fs/M)" % (n, a, a/size, b, b/size))
+        size *= 2
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 32)
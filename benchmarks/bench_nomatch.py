@@ -0,0 +1,54 @@
+#!/usr/bin/python
+"""
+Benchmark for the NO_MATCH protocol (see BaseCodec._trydecodeone): counts the NoMatch exceptions raised
+while decoding a JSON corpus, and times decoding it (median of several runs, CPU time). CodecSet.decode is
+called directly, so that the codecs rather than the json module backend of jsoncodec are measured.
+
+Run it on a checkout from before the protocol was introduced to compare.
+
+Usage: python benchmarks/bench_nomatch.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from codecfactory import exc, CodecSet
+from codecfactory.jsoncodec import jsoncodec, jsoncodecsl
+
+def median(f, repeat=9):
+    times = []
+    for k in range(repeat):
+        start = time.process_time()
+        f()
+        times.append(time.process_time() - start)
+    return sorted(times)[repeat//2]
+
+def main():
+    records = [{"id": i, "name": "item %d" % i, "vals": [i, i*0.5, None, True], "tags": {"a": "x", "b": "y"}}
+               for i in range(500)]
+    multiline = jsoncodec.encode(records)
+    singleline = jsoncodecsl.encode(records)
+    ints = "[" + ", ".join(str(i) for i in range(20000)) + "]"
+
+    raised = [0]
+    init = exc.NoMatch.__init__
+
+    def counting(self, codec):
+        raised[0] += 1
+        init(self, codec)
+
+    exc.NoMatch.__init__ = counting
+    try:
+        CodecSet.decode(jsoncodec, multiline)
+    finally:
+        exc.NoMatch.__init__ = init
+    print("NoMatch raised while decoding 500 records: %d" % raised[0])
+
+    print("500 records, multiline:  %.3fs" % median(lambda: CodecSet.decode(jsoncodec, multiline)))
+    print("500 records, singleline: %.3fs" % median(lambda: CodecSet.decode(jsoncodecsl, singleline)))
+    print("20000 integers:          %.3fs" % median(lambda: CodecSet.decode(jsoncodec, ints)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+#!/usr/bin/python
+"""
+Benchmark of string decoding (see StringCodec._trydecode) on short strings, long strings and strings with
+escape sequences, in text and binary mode, through the CodecSet engine (median of several runs, CPU time).
+
+Usage: python benchmarks/bench_strings.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from codecfactory import CodecSet, pystringcodec
+from codecfactory.jsoncodec import jsoncodecsl
+
+def median(f, repeat=5):
+    times = []
+    for k in range(repeat):
+        start = time.process_time()
+        f()
+        times.append(time.process_time() - start)
+    return sorted(times)[repeat//2]
+
+def main():
+    corpora = [("3000 short strings", ["name %d" % i for i in range(3000)]),
+               ("40 strings of 20000 chars", ["x"*20000 + str(i) for i in range(40)]),
+               ("3000 strings with escapes", ["line %d\n\ttab \"q\"" % i for i in range(3000)])]
+
+    for label, strings in corpora:
+        text = CodecSet.encode(jsoncodecsl, strings)
+        data = text.encode("utf-8")
+        assert CodecSet.decode(jsoncodecsl, text) == strings == CodecSet.decode(jsoncodecsl, data)
+        print("%-26s str %.3fs  bytes %.3fs" % (label, median(lambda: CodecSet.decode(jsoncodecsl, text)),
+                                                 median(lambda: CodecSet.decode(jsoncodecsl, data))))
+
+    one = pystringcodec.encode("x"*20000)
+    print("%-26s %.3fs" % ("1000 x one 20000-char string",
+                           median(lambda: [pystringcodec.decode(one) for k in range(1000)])))
+
+if __name__ == "__main__":
+    main()
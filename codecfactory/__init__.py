@@ -1,9 +1,18 @@
 #!/usr/bin/python
-from codecfactory.exc import DecodeError, NoMatch, UnexpectedEndOfData, ExcessData, EncodeError, EncodeMatchError
+from codecfactory.exc import (DecodeError, NoMatch, UnexpectedEndOfData, ExcessData, BufferLimitExceeded,
+                              EncodeError, EncodeMatchError)
+from codecfactory.readbuffer import ReadBuffer, MmapReadBuffer, AsyncReadBuffer, ReadPolicy
+from codecfactory.writebuffer import WriteBuffer, FragmentWriter
 from codecfactory.basecodec import BaseCodec, NOHOOK, SINGLE, ARGS, KWARGS
-from codecfactory.stringcodec import StringCodec, pystringcodec
+from codecfactory.stringcodec import StringCodec, EscapeTable, makepystringcodec, pystringcodec
 from codecfactory.codecset import CodecSet
 from codecfactory.numeralcodecs import (uintcodec, intcodec, floatcodec, rationalcodec, realcodec)
 from codecfactory.regexcodec import RegExCodec
-from codecfactory.listcodec import ListCodec
+from codecfactory.listcodec import ListCodec, resetinitplans
 from codecfactory.dictcodec import DictCodec
+from codecfactory.compiler import CompiledCodec, compilecodec
+from codecfactory.structindex import StructIndex
+from codecfactory.parallel import paralleldecode
+from codecfactory.lazy import LazyList, LazyDict, lazydecode
+from codecfactory.query import ANY, iterquery, query
+from codecfactory.aio import adecodeone, aiterdecode, aencode
@@ -0,0 +1,257 @@
+#!/usr/bin/python
+from codecfactory.basecodec import skip_whitespace
+from codecfactory.exc import DecodeError
+from codecfactory.readbuffer import AsyncReadBuffer, _MoreData
+from codecfactory.structindex import delimiters
+from codecfactory.writebuffer import WriteBuffer, FragmentWriter
+import asyncio
+import regex
+
+__all__ = ["adecodeone", "aiterdecode", "aencode"]
+
+class _Nesting(object):
+    """
+    Follows the nesting of the delimiters of the containers and strings reachable from codec (see
+    structindex.delimiters) over the data of an object as it arrives, to tell when the object may be complete.
+    Objects that start with anything else, and codecs whose delimiters are not single ASCII characters, are not
+    followed.
+    """
+    def __init__(self, codec):
+        self.done = True
+        found = delimiters(codec)
+        if found is None:
+            return
+        brackets, quotes, separators = found
+        if any(begin_delim != end_delim for begin_delim, end_delim in quotes):
+            return
+        if any(begin_delim == end_delim for begin_delim, end_delim in brackets):
+            return
+        if not all(len(delim) == 1 and delim < "\x80" for pair in brackets | quotes for delim in pair):
+            return
+
+        self.opening = frozenset(ord(begin_delim) for begin_delim, end_delim in brackets)
+        self.closing = frozenset(ord(end_delim) for begin_delim, end_delim in brackets)
+        self.quotes = frozenset(ord(begin_delim) for begin_delim, end_delim in quotes)
+        if (self.opening | self.closing) & self.quotes or ord("\\") in self.opening | self.closing | self.quotes:
+            return
+
+        specials = bytes(sorted(self.opening | self.closing | self.quotes))
+        self.outside = regex.compile(b"[%s]" % regex.escape(specials))
+        self.inside = dict((quote, regex.compile(b"[%s\\\\]" % regex.escape(bytes((quote,)))))
+                           for quote in self.quotes)
+        self.started = False
+        self.depth = 0
+        self.quote = None
+        self.escaped = False
+        self.done = False
+
+    def feed(self, data):
+        """
+        Follows the nesting over the data that has arrived since the last call, and returns True if the object
+        may be complete (always, if the object is not followed).
+        """
+        if self.done:
+            return True
+        pos = 0
+        if not self.started:
+            match = _nonspace.search(data)
+            if match is None:
+                return False
+            pos = match.start()
+            self.started = True
+            if data[pos] not in self.opening and data[pos] not in self.quotes:
+                self.done = True
+                return True
+
+        while True:
+            if self.quote is not None:
+                if self.escaped:
+                    if pos >= len(data):
+                        return False
+                    pos += 1
+                    self.escaped = False
+                match = self.inside[self.quote].search(data, pos)
+                if match is None:
+                    return False
+                pos = match.end()
+                if data[match.start()] == self.quote:
+                    self.quote = None
+                else:
+                    self.escaped = True
+                    continue
+            else:
+                match = self.outside.search(data, pos)
+                if match is None:
+                    return False
+                pos = match.end()
+                char = data[match.start()]
+                if char in self.quotes:
+                    self.quote = char
+                    continue
+                elif char in self.opening:
+                    self.depth += 1
+                    continue
+                self.depth -= 1
+
+            if self.depth <= 0:
+                self.done = True
+                return True
+
+_nonspace = regex.compile(rb"\S")
+
+async def _attempt(readbuf, complete, codec, offset, method, *args):
+    """
+    Calls method(*args), which decodes from readbuf, from a checkpoint, awaiting more data and starting over
+    whenever it runs out of data (see AsyncReadBuffer).
+
+    Codecs read ahead of the end of a token that they cannot otherwise tell is complete, so before more data is
+    awaited after such a readahead, the call is tried once more as though the stream ended with the data received
+    so far, and its result is kept if complete(result) is True, i.e., if it cannot be changed by the data still to
+    come. This lets an object be decoded as soon as it and the character that follows it (such as the newline
+    after a newline-delimited record) have arrived.
+
+    If 'codec' is not None, the object it decodes at offset is followed as its data arrives (see _Nesting): the
+    call is only tried as though the stream ended, or started over, once the object may be complete, or once the
+    data has doubled in size since the last try, so that the total work stays linear in the size of the object
+    however little data each read brings.
+    """
+    nesting = None
+    while True:
+        state = readbuf.checkpoint()
+        try:
+            result = method(*args)
+        except _MoreData as more:
+            readbuf.rollback(state)
+            count = more.count
+            readahead = more.readahead
+        except BaseException:
+            readbuf.commit()
+            raise
+        else:
+            readbuf.commit()
+            return result
+
+        if codec is not None and nesting is None:
+            nesting = _Nesting(codec)
+            nesting.feed(readbuf[offset:])
+
+        if complete is not None and readahead and (nesting is None or nesting.done):
+            state = readbuf.checkpoint()
+            readbuf._tentative = True
+            try:
+                result = method(*args)
+            except DecodeError:
+                result = None
+            except BaseException:
+                readbuf.commit()
+                raise
+            finally:
+                readbuf._tentative = False
+            if result is not None and complete(result):
+                readbuf.commit()
+                return result
+            readbuf.rollback(state)
+
+        size = len(readbuf)
+        while True:
+            data = await readbuf.fill(count)
+            if not data or nesting is None or nesting.feed(data) or len(readbuf) >= 2*size:
+                break
+
+def _nextobject(codec, readbuf):
+    """
+    Returns the offset at which the next object in readbuf starts, or None at the end of the stream (or, when
+    called tentatively, of the data received so far).
+    """
+    offset = 0
+    if codec.strip_whitespace:
+        offset = skip_whitespace(readbuf, offset)
+    if readbuf.atend(offset):
+        return None
+    return offset
+
+async def adecodeone(codec, readbuf, offset=0, discardbufferdata=None):
+    """
+    Same as codec.decodeone, for an AsyncReadBuffer: whenever the data that has arrived is not enough to decode
+    the object, more is awaited and decoding starts over from offset. A list, dict or string is only decoded
+    again once its closing delimiter may have arrived, or once the data has doubled in size, so that it is
+    decoded a number of times logarithmic in its size (and once if its end arrives in the same read as the data
+    it follows). Hooks may therefore be applied more than once to parts of the object.
+
+    An object is returned as soon as it can be told apart from a longer one: if a codec reads ahead of the data
+    that has arrived, this takes the character that follows the object, or the end of the stream.
+    """
+    # The object is complete if it is followed by data that the codec did not take.
+    return await _attempt(readbuf, lambda result: result[1] < len(readbuf), codec, offset,
+                          codec.decodeone, readbuf, offset, discardbufferdata)
+
+async def aiterdecode(codec, source, spans=False):
+    """
+    Same as codec.iterdecode, as an asynchronous generator over an asyncio.StreamReader (or an AsyncReadBuffer),
+    which yields each object as soon as it has arrived (see adecodeone), so that one event loop can decode any
+    number of streams.
+    """
+    readbuf = source if isinstance(source, AsyncReadBuffer) else AsyncReadBuffer(source)
+
+    while True:
+        offset = await _attempt(readbuf, lambda offset: offset is not None, None, 0, _nextobject, codec, readbuf)
+        if offset is None:
+            return
+
+        start = readbuf.absoffset(offset)
+        obj, offset = await adecodeone(codec, readbuf, offset)
+        end = readbuf.absoffset(offset)
+        readbuf.discard(offset)
+
+        if spans:
+            yield obj, (start, end)
+        else:
+            yield obj
+
+class _BlockSender(object):
+    """
+    File object that aencode encodes to from a helper thread. Each block written to it is handed to the event
+    loop, which writes it to writer in slices of at most 'blocksize' bytes, awaiting writer.drain() after each,
+    and the thread waits until that is done before it encodes any further.
+    """
+    def __init__(self, writer, blocksize, loop):
+        self.writer = writer
+        self.blocksize = blocksize
+        self.loop = loop
+        self.closed = False
+
+    def write(self, block):
+        if self.closed:
+            raise asyncio.CancelledError()
+        asyncio.run_coroutine_threadsafe(self._send(block), self.loop).result()
+        return len(block)
+
+    async def _send(self, block):
+        for start in range(0, len(block), self.blocksize):
+            self.writer.write(block[start:start + self.blocksize])
+            await self.writer.drain()
+
+def _encode(codec, obj, file, indent, indentlevel, indentfirstline):
+    codec.encode(obj, file, indent, indentlevel, indentfirstline)
+    file.flush()
+
+async def aencode(codec, obj, writer, indent="    ", indentlevel=0, indentfirstline=True, encoding="utf-8"):
+    """
+    Same as codec.encode, for an asyncio.StreamWriter. Codecs encode synchronously, so obj is encoded (in
+    'encoding') in a helper thread of the default executor of the event loop, which hands each block of about
+    FragmentWriter.blocksize bytes to the loop as soon as it is complete, and waits until the block has been
+    written to writer and writer.drain() has returned before encoding the next: the loop is free while obj is
+    encoded, and at most one block is held besides what writer itself buffers, so that a producer that encodes
+    faster than the peer reads is held back. Hooks of the codecs therefore run in that thread.
+
+    If obj cannot be encoded, the exception is raised once the blocks encoded before the error have been
+    written. If aencode is cancelled, encoding stops at the next block. (The json module backend of jsoncodec
+    encodes an object in a single piece, which is then written in blocks.)
+    """
+    loop = asyncio.get_running_loop()
+    sender = _BlockSender(writer, FragmentWriter.blocksize, loop)
+    file = FragmentWriter(WriteBuffer(sender, encoding))
+    try:
+        await loop.run_in_executor(None, _encode, codec, obj, file, indent, indentlevel, indentfirstline)
+    finally:
+        sender.closed = True
@@ -3,9 +3,12 @@ from codecfactory.exc import DecodeError, NoMatch, UnexpectedEndOfData, ExcessDa
 import regex as re
 import sys
 import io
-from codecfactory.readbuffer import ReadBuffer
+import mmap
+from codecfactory.readbuffer import ReadBuffer, MmapReadBuffer, isbinaryfile
+from codecfactory.writebuffer import WriteBuffer, fragmentwriter
 
-__all__ = ["BaseCodec", "ws_match", "skip_whitespace", "NOHOOK", "SINGLE", "ARGS", "KWARGS", "ALLATONCE", "PIECEBYPIECE"]
+__all__ = ["BaseCodec", "ws_match", "ws_chars", "skip_whitespace", "NO_MATCH",
+           "NOHOOK", "SINGLE", "ARGS", "KWARGS", "ALLATONCE", "PIECEBYPIECE"]
 
 if sys.version_info.major >= 3:
     strtype = str
@@ -13,10 +16,16 @@ else:
     strtype = (str, unicode)
 
 ws_match = re.compile(r'[ \t\n\r]*', flags=re.VERBOSE | re.MULTILINE | re.DOTALL)
+ws_chars = frozenset(" \t\n\r")
+
+_ws_nonmatch = frozenset(chr(k) for k in range(128)) - ws_chars
+_ws_nonmatch |= frozenset(ord(c) for c in _ws_nonmatch)
 
 def skip_whitespace(readbuf, offset=0, discarddata=True):
     """Function used to skip over whitespace in data."""
-    offset = readbuf.regex_op(ws_match.match, pos=offset).end()
+    if readbuf.charat(offset) not in _ws_nonmatch:
+        # Most tokens are not preceded by whitespace, which needs no regular expression.
+        offset = readbuf.regex_op(ws_match.match, pos=offset).end()
 
     if discarddata:
         readbuf.discard(offset)
@@ -24,6 +33,16 @@ def skip_whitespace(readbuf, offset=0, discarddata=True):
 
     return offset
 
+class _NoMatchType(object):
+    def __repr__(self):
+        return "NO_MATCH"
+
+NO_MATCH = _NoMatchType()
+"""
+Returned instead of raising NoMatch by _trydecode and _trydecodeone. Built-in codecs use these with each
+other, so that backtracking does not need to raise and catch an exception.
+"""
+
 NOHOOK = 0
 SINGLE = 1
 ARGS = 2
@@ -41,6 +60,9 @@ class BaseCodec(object):
     The methods _encode_to_file and _decode_to_file may be optionally be reimplemented.
     
     For similar reasons, one may wish to reimplement _decode_to_file as well.
+
+    Instead of _decode, a subclass may implement _trydecode, which returns NO_MATCH rather than raising
+    NoMatch. A subclass that reimplements only one of the two is given the other automatically.
     """
     name = "BaseCodec"
 
@@ -53,6 +75,27 @@ class BaseCodec(object):
     discardbufferdata = True
     strip_whitespace = True
 
+    def __init_subclass__(cls, **kwargs):
+        super(BaseCodec, cls).__init_subclass__(**kwargs)
+        if "_decode" in cls.__dict__ and "_trydecode" not in cls.__dict__:
+            # Make sure a reimplemented _decode is not bypassed by an inherited _trydecode.
+            cls._trydecode = BaseCodec._trydecode
+
+        elif "_trydecode" in cls.__dict__ and "_decode" not in cls.__dict__:
+            trydecode = cls.__dict__["_trydecode"]
+
+            def _decode(self, readbuf, offset=0, discardbufferdata=None):
+                result = trydecode(self, readbuf, offset, discardbufferdata=discardbufferdata)
+                if result is NO_MATCH:
+                    raise NoMatch(self)
+                return result
+
+            cls._decode = _decode
+
+        if ("_decode" in cls.__dict__ or "_trydecode" in cls.__dict__) and "_skip" not in cls.__dict__:
+            # An inherited _skip would not know about the reimplemented decoding.
+            cls._skip = None
+
     def __init__(self, hook=None, unhook=None, hook_mode=None, allowedtype=None,
                  discardbufferdata=None, strip_whitespace=None, name=None):
         if hook is None and hasattr(self, "_hook"):
@@ -115,8 +158,42 @@ class BaseCodec(object):
         """
         raise DecodeError(self, "Not implemented: Please implement the '_decode' method.")
 
+    def _trydecode(self, readbuf, offset=0, discardbufferdata=None):
+        """
+        Same as _decode, except that NO_MATCH is returned where _decode would raise NoMatch.
+        """
+        try:
+            return self._decode(readbuf, offset, discardbufferdata=discardbufferdata)
+        except NoMatch:
+            return NO_MATCH
+
+    def _firstchars(self):
+        """
+        Returns a set of the characters that encoded data may begin with (not counting whitespace
+        stripped by decodeone), or None if this is not known. Returning a superset is always safe.
+
+        This may be reimplemented in subclasses so that CodecSet can skip over codecs that cannot
+        possibly match.
+        """
+        return None
+
+    def _children(self):
+        """
+        Returns the codecs that this codec decodes and encodes parts of its data with, so that tables built
+        from the codecs reachable from a codec can be rebuilt when one of them changes (see CodecSet).
+        """
+        return ()
+
+    def firstchars(self):
+        """
+        Wraps around _firstchars, adding whitespace characters if self.strip_whitespace == True.
+        """
+        chars = self._firstchars()
+        if chars is not None and self.strip_whitespace:
+            chars = chars | ws_chars
+        return chars
+
     def decodeone(self, readbuf, offset=0, discardbufferdata=None):
-        startabsoffset = readbuf.absoffset(offset)
         """
         Wraps around _decode, and automatically reads more data in from readbuf whenever
         needed, so that this does not need to be done when reimplementing _decode.
@@ -126,6 +203,17 @@ class BaseCodec(object):
         Decodes one object from data, returns the object and offset of the end of the match.
         Use this method if you wish to decode an object, but expect to decode more afterwards.
         """
+        result = self._trydecodeone(readbuf, offset, discardbufferdata=discardbufferdata)
+        if result is NO_MATCH:
+            raise NoMatch(self)
+        return result
+
+    def _trydecodeone(self, readbuf, offset=0, discardbufferdata=None):
+        """
+        Same as decodeone, except that NO_MATCH is returned instead of raising NoMatch. Codecs should use
+        this when decoding their child codecs.
+        """
+        startabsoffset = readbuf.absoffset(offset)
 
         discardbufferdata = discardbufferdata if discardbufferdata is not None else self.discardbufferdata
 
@@ -135,14 +223,23 @@ class BaseCodec(object):
 
         while True:
             try:
-                (obj, offset) = self._decode(readbuf, offset, discardbufferdata=discardbufferdata)
+                result = self._trydecode(readbuf, offset, discardbufferdata=discardbufferdata)
             except UnexpectedEndOfData:
-                if readbuf._file.closed or readbuf.readdata() == 0:
+                # _decode starts over from offset, so read at least as much as it has already seen.
+                if readbuf.closed or readbuf.readatleast(len(readbuf) - offset) == 0:
                     raise
                 continue
+            except NoMatch:
+                # Raised by a codec further down that is only called through decodeone.
+                return NO_MATCH
             else:
                 break
 
+        if result is NO_MATCH:
+            return result
+
+        obj, offset = result
+
         if discardbufferdata:
             readbuf.discard(offset)
             offset = 0
@@ -157,26 +254,108 @@ class BaseCodec(object):
 
         return obj, offset
 
+    _skip = None
+    """
+    If not None, a method _skip(readbuf, offset) that returns the offset of the end of the data that _trydecode
+    would match at offset (or NO_MATCH), validating it without building the decoded object where possible.
+    """
+
+    def _tryskip(self, readbuf, offset=0):
+        """
+        Skims over the object at offset (see _skip), returning the offset of its end, or NO_MATCH. Leading
+        whitespace is skipped as in _trydecodeone, but no data is discarded and no hook is applied. Codecs that
+        do not implement _skip decode the object instead.
+        """
+        if self._skip is None:
+            result = self._trydecodeone(readbuf, offset, discardbufferdata=False)
+            if result is NO_MATCH:
+                return result
+            return result[1]
+
+        if self.strip_whitespace:
+            offset = skip_whitespace(readbuf, offset, False)
+
+        while True:
+            try:
+                return self._skip(readbuf, offset)
+            except UnexpectedEndOfData:
+                if readbuf.closed or readbuf.readatleast(len(readbuf) - offset) == 0:
+                    raise
+            except NoMatch:
+                return NO_MATCH
+
+    def _readbuffer(self, data):
+        """
+        'data' may be a string, a bytes-like object, a file-like object, an mmap object, or a
+        ReadBuffer (such as a MmapReadBuffer). Bytes-like objects, mmap objects and binary files are
+        decoded in binary mode (see ReadBuffer).
+        """
+        if isinstance(data, ReadBuffer):
+            return data
+        elif isinstance(data, (strtype, bytes)):
+            return ReadBuffer(None, data)
+        elif isinstance(data, (bytearray, memoryview)):
+            return ReadBuffer(None, bytes(data))
+        elif isinstance(data, mmap.mmap):
+            return MmapReadBuffer(data, binary=True)
+        return ReadBuffer(data)
+
     def decode(self, data):
         """
         Wraps around self.decodeone, and detects if there is excess data after the match.
         Strips leading and trailing whitespace if self.strip_whitespace == True.
         An exception will be raised if excess data is detected.
+
+        'data' may be a string, a bytes-like object, a file-like object, an mmap object, or a
+        ReadBuffer (such as a MmapReadBuffer). Bytes-like objects, mmap objects and binary files are
+        decoded in binary mode (see ReadBuffer).
         """
-        if isinstance(data, strtype):
-            readbuf = ReadBuffer(io.StringIO(data))
-        else:
-            readbuf = ReadBuffer(data)
+        readbuf = self._readbuffer(data)
 
         obj, offset = self.decodeone(readbuf)
         # Trim trailing whitespace.
         if self.strip_whitespace:
             offset = skip_whitespace(readbuf, offset, self.discardbufferdata)
 
-        if len(readbuf.data) > offset or (not readbuf._file.closed and readbuf.readdata() > 0):
-            raise ExcessData(self, readbuf.discarded + offset)
+        if not readbuf.atend(offset):
+            raise ExcessData(self, readbuf.absoffset(offset))
         return obj
 
+    def iterdecode(self, data, spans=False):
+        """
+        Generator that decodes a sequence of concatenated objects (such as newline-delimited records)
+        from data, yielding each object as soon as it has been decoded. Whitespace between objects is
+        skipped if self.strip_whitespace == True.
+
+        Data is discarded from the buffer once each object has been decoded, so memory use is bounded by
+        the size of the largest object rather than the size of the input.
+
+        If spans is True, pairs (obj, (start, end)) are yielded instead, where start and end are the
+        absolute offsets of the object in the input (bytes in binary mode, characters otherwise). In
+        binary mode, decoding can be resumed from a checkpoint by seeking the file to 'end'.
+
+        'data' is accepted in the same forms as for self.decode.
+        """
+        readbuf = self._readbuffer(data)
+
+        while True:
+            offset = 0
+            if self.strip_whitespace:
+                offset = skip_whitespace(readbuf, offset)
+
+            if readbuf.atend(offset):
+                return
+
+            start = readbuf.absoffset(offset)
+            obj, offset = self.decodeone(readbuf, offset)
+            end = readbuf.absoffset(offset)
+            readbuf.discard(offset)
+
+            if spans:
+                yield obj, (start, end)
+            else:
+                yield obj
+
     def _encode(self, obj, file, indent="    ", indentlevel=0):
         """
         Actual encoding goes on in this method, and is written to file.
@@ -205,30 +384,30 @@ class BaseCodec(object):
         If file is specified, encoded data is written to file. Otherwise, it is implied that the encoded
         data is returned as a string.
 
-        If file is not specified, then a temporary StringIO object is created to write to, and then the
-        results are read back and returned.
+        Data is written through a FragmentWriter, which collects the fragments written by _encode (and
+        by the encode methods of child codecs, which are passed the same FragmentWriter) and writes
+        them to file in blocks. If file is not specified, the fragments are joined and returned.
 
-        Note: In Python 3, some file objects will only accept 'bytes'-type data in their write methods.
-        The remedy to this is to wrap such file objects in io.TextIOWrapper.
+        If file is a binary file object (or a bytearray), the encoded data is written to it as UTF-8
+        through a WriteBuffer.
         """
         if not self.validate_for_encode(obj):
             raise EncodeMatchError(self, obj, "Expected %s, got %s instead." % (self.allowedtype, type(obj)))
         obj = self.reversehook(obj)
 
-        if file is None:
-            returnstring = True
-            file = io.StringIO()
-        else:
-            returnstring = False
+        writer = fragmentwriter(file)
 
-        if indentfirstline:
-            file.write(indent*indentlevel)
+        try:
+            if indentfirstline:
+                writer.write(indent*indentlevel)
 
-        ret = self._encode(obj, file, indent, indentlevel)
+            ret = self._encode(obj, writer, indent, indentlevel)
+        finally:
+            if writer is not file:
+                writer.flush()
 
-        if returnstring:
-            file.seek(0)
-            return file.read()
+        if file is None:
+            return writer.getvalue()
 
         return ret
 
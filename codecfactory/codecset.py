@@ -1,8 +1,106 @@
-from codecfactory.basecodec import BaseCodec, ReadBuffer, skip_whitespace
+from codecfactory.basecodec import BaseCodec, ReadBuffer, skip_whitespace, NO_MATCH
 from codecfactory.exc import DecodeError, NoMatch, UnexpectedEndOfData, ExcessData, EncodeError, EncodeMatchError
+import abc
+import weakref
 
 __all__ = ["CodecSet"]
 
+def _typebased(codec, visiting=()):
+    """
+    Returns True if codec.validate_for_encode(obj) is known to depend on type(obj) alone, i.e., if it is
+    BaseCodec.validate_for_encode with an allowedtype made up of ordinary classes (or classes with ABCMeta
+    as their metaclass), or CodecSet.validate_for_encode with only such codecs as its children.
+    """
+    cls = type(codec)
+    if cls.validate_for_encode is BaseCodec.validate_for_encode:
+        allowedtype = codec.allowedtype
+        if allowedtype is None:
+            return True
+        if not isinstance(allowedtype, tuple):
+            allowedtype = (allowedtype,)
+        return all(type(t) is type or type(t) is abc.ABCMeta for t in allowedtype)
+
+    if cls.validate_for_encode is CodecSet.validate_for_encode:
+        if any(codec is other for other in visiting):
+            return False
+        visiting += (codec,)
+        return all(_typebased(child, visiting) for child in codec.codecs)
+
+    return False
+
+class _EncodePlans(dict):
+    """
+    Maps types to the codecs that must be tried to encode an object of that type, so that a CodecSet finds the
+    codec for an object by a single lookup instead of by validating it against each child in turn.
+
+    'entries': Sequence of (validate, value) pairs, one per child codec, in order, where validate is
+        equivalent to the child's validate_for_encode.
+    'typebased': Sequence of booleans (see _typebased), one per child codec.
+
+    The plan for a type is a pair (checks, match): 'match' is the entry of the first type-based child that
+    accepts objects of that type (or None), and 'checks' are the entries of the children before it whose
+    validation is not type-based, which still need to be tried for each object. Plans are discarded if a
+    class is registered with an abstract base class (see abc.get_cache_token).
+    """
+    maxsize = 1024
+
+    def __init__(self, entries, typebased):
+        dict.__init__(self)
+        self.entries = tuple(entries)
+        self.typebased = tuple(typebased)
+        self.token = abc.get_cache_token()
+
+    def lookup(self, obj):
+        if self.token != abc.get_cache_token():
+            self.clear()
+            self.token = abc.get_cache_token()
+
+        try:
+            return self[type(obj)]
+        except KeyError:
+            pass
+
+        objtype = type(obj)
+        if any("__class__" in vars(base) for base in objtype.__mro__ if base is not object):
+            # isinstance also looks at obj.__class__, which may then depend on obj itself.
+            return self.entries, None
+
+        checks = []
+        for entry, typebased in zip(self.entries, self.typebased):
+            if not typebased:
+                checks.append(entry)
+            elif entry[0](obj):
+                plan = tuple(checks), entry
+                break
+        else:
+            plan = tuple(checks), None
+
+        if len(self) >= self.maxsize:
+            self.clear()
+        self[objtype] = plan
+        return plan
+
+_dependents = weakref.WeakSet()
+
+def _listen(codec):
+    """
+    Subscribes codec, which is about to build tables from the codecs reachable from it, to the CodecSets among
+    them (codec included), so that a change to any of them increments codec._generation (see CodecSet).
+    """
+    _dependents.add(codec)
+    seen = set()
+    stack = [codec]
+    while stack:
+        child = stack.pop()
+        if id(child) in seen:
+            continue
+        seen.add(id(child))
+        if isinstance(child, CodecSet):
+            if child._listeners is None:
+                child._listeners = weakref.WeakSet()
+            child._listeners.add(codec)
+        stack.extend(child._children())
+
 class CodecSet(BaseCodec):
     """
     Matches any one codec in a provided list of codecs.
@@ -11,36 +109,134 @@ class CodecSet(BaseCodec):
     to capture and handle it's child's NoMatch exceptions so that CodecSet only sees
     NoMatch exceptions raised by its immediate children. If CodecSet sees any NoMatch
     exception from any of its grandchildren, then this may hide actual decoding errors.]
+
+    When decoding, only the codecs that may begin with the next character in the data (see
+    BaseCodec.firstchars) are tried, in their original order. This dispatch table is rebuilt
+    whenever this CodecSet, or a CodecSet reachable from it, is modified through appendCodec,
+    insertCodec, or removeCodec; other CodecSets keep theirs. If codecs are modified in any other
+    way (such as by changing their delimiters), call resetdispatch.
+
+    When encoding, the codec to use for an object is looked up by its type, for as long as the validation
+    of the codecs before it depends on nothing else (see _EncodePlans). This table is rebuilt along with the
+    dispatch table, so call resetdispatch after changing the allowedtype of a child codec as well.
     """
+    _generation = 0
+    _listeners = None
+    _dispatch = None
+    _dispatch_generation = None
+    _encodeplans = None
+    _encodeplans_generation = None
+    _visiting = False
+
     def __init__(self, codecs=[], name="CodecSet"):
         self.codecs = list(codecs)
         self.name = name
 
-    def _decode(self, readbuf, offset=0, discardbufferdata=None):
-        for codec in self.codecs:
-            try:
-                return codec.decodeone(readbuf, offset, discardbufferdata=discardbufferdata)
-            except NoMatch:
-                continue
-        else:
-            raise NoMatch(self)
+    def _firstchars(self):
+        if self._visiting:
+            # CodecSet contains itself (directly or indirectly) as a leading codec.
+            return None
+
+        self._visiting = True
+        try:
+            chars = frozenset()
+            for codec in self.codecs:
+                codecchars = codec.firstchars()
+                if codecchars is None:
+                    return None
+                chars |= codecchars
+            return chars
+        finally:
+            self._visiting = False
+
+    def _makedispatch(self):
+        """
+        Builds a table mapping each ASCII character (and its ordinal, for binary data) to the codecs that
+        may match data beginning with that character. Other characters are not in the table, and all
+        codecs are tried for those.
+        """
+        codecs = tuple(self.codecs)
+        firstchars = [codec.firstchars() for codec in codecs]
+        candidates = {}
+        dispatch = {}
+        for k in range(128):
+            c = chr(k)
+            matches = tuple(codec for codec, chars in zip(codecs, firstchars) if chars is None or c in chars)
+            dispatch[c] = dispatch[k] = candidates.setdefault(matches, matches)
+        _listen(self)
+        self._dispatch = dispatch
+        self._dispatch_generation = self._generation
+
+    def _changed(self):
+        """Forces the tables of this CodecSet, and of the codecs that depend on it, to be rebuilt."""
+        self._generation += 1
+        if self._listeners is not None:
+            for codec in list(self._listeners):
+                if codec is not self:
+                    codec._generation += 1
+
+    def resetdispatch(self):
+        """Forces all CodecSet dispatch tables to be rebuilt the next time they are used."""
+        for codec in list(_dependents):
+            codec._generation += 1
+
+    def _trydecode(self, readbuf, offset=0, discardbufferdata=None):
+        if self._dispatch_generation != self._generation:
+            self._makedispatch()
+
+        codecs = self._dispatch.get(readbuf.charat(offset), self.codecs)
+        for codec in codecs:
+            result = codec._trydecodeone(readbuf, offset, discardbufferdata=discardbufferdata)
+            if result is not NO_MATCH:
+                return result
+        return NO_MATCH
+
+    def _skip(self, readbuf, offset=0):
+        if self._dispatch_generation != self._generation:
+            self._makedispatch()
+
+        codecs = self._dispatch.get(readbuf.charat(offset), self.codecs)
+        for codec in codecs:
+            end = codec._tryskip(readbuf, offset)
+            if end is not NO_MATCH:
+                return end
+        return NO_MATCH
+
+    def _encodeplan(self, obj):
+        if self._encodeplans_generation != self._generation:
+            _listen(self)
+            self._encodeplans = _EncodePlans([(codec.validate_for_encode, codec) for codec in self.codecs],
+                                             [_typebased(codec) for codec in self.codecs])
+            self._encodeplans_generation = self._generation
+        return self._encodeplans.lookup(obj)
 
     def validate_for_encode(self, obj):
-        for codec in self.codecs:
-            if codec.validate_for_encode(obj):
+        checks, match = self._encodeplan(obj)
+        if match is not None:
+            return True
+        for validate, codec in checks:
+            if validate(obj):
                 return True
         return False
 
     def _encode(self, obj, file, indent="    ", indentlevel=0):
-        for codec in self.codecs:
-            if codec.validate_for_encode(obj):
+        checks, match = self._encodeplan(obj)
+        for validate, codec in checks:
+            if validate(obj):
                 return codec.encode(obj, file, indent, indentlevel, indentfirstline=False)
-        else:
-            raise EncodeMatchError(self, obj, "No codec found for '%s' object." % type(obj).__name__)
+        if match is not None:
+            return match[1].encode(obj, file, indent, indentlevel, indentfirstline=False)
+        raise EncodeMatchError(self, obj, "No codec found for '%s' object." % type(obj).__name__)
+
+    def _children(self):
+        return tuple(self.codecs)
 
     def appendCodec(self, codec):
         self.codecs.append(codec)
+        self._changed()
     def insertCodec(self, index, codec):
         self.codecs.insert(index, codec)
+        self._changed()
     def removeCodec(self, codec):
         self.codecs.remove(codec)
+        self._changed()
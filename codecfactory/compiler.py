@@ -0,0 +1,951 @@
+#!/usr/bin/python
+from codecfactory.basecodec import BaseCodec, skip_whitespace, ws_chars, NO_MATCH, SINGLE, ARGS, KWARGS
+from codecfactory.exc import DecodeError, NoMatch, UnexpectedEndOfData, ExcessData, EncodeMatchError
+from codecfactory.codecset import CodecSet, _EncodePlans, _typebased
+from codecfactory.regexcodec import RegExCodec
+from codecfactory.listcodec import ListCodec, initplan
+from codecfactory.dictcodec import DictCodec
+from codecfactory.stringcodec import StringCodec, pystringcodec
+from codecfactory.jsoncodec import JSONCodecSet
+from codecfactory.readbuffer import bytespattern
+from codecfactory.writebuffer import fragmentwriter
+from collections import OrderedDict
+import regex
+
+__all__ = ["CompiledCodec", "compilecodec"]
+
+_MISSING = object()
+
+_ws_keys = ws_chars | frozenset(ord(c) for c in ws_chars)
+
+def _skip_whitespace(readbuf, offset, discarddata=True):
+    """Same as skip_whitespace, but does not run the regular expression if there is no whitespace at offset."""
+    c = readbuf.charat(offset)
+    if c is None or c in _ws_keys:
+        return skip_whitespace(readbuf, offset, discarddata)
+
+    if discarddata:
+        readbuf.discard(offset)
+        return 0
+
+    return offset
+
+# Patterns whose meaning depends on their group numbers or that set flags for the whole pattern cannot
+# be combined with others into a single alternation.
+_unfusable = regex.compile(r"\\[1-9]|\\g<|\(\?P[=>]|\(\?[R&0-9+-]|\(\?[a-zA-Z-]*\)")
+
+def compilecodec(codec, lexer=False):
+    """Returns a CompiledCodec for 'codec'. See CompiledCodec for 'lexer'."""
+    return CompiledCodec(codec, lexer)
+
+class CompiledCodec(BaseCodec):
+    """
+    Wraps around a codec, decoding and encoding through closures that are generated by walking the graph of
+    codecs reachable from it (cycles, such as jsoncodec <-> listcodec, included). Configuration such as
+    delimiters, strip_whitespace, hooks and child codecs is looked up once at compile time instead of on
+    every call, and the dispatch between CodecSet, ListCodec, DictCodec and their children bypasses the
+    decodeone/_decode method layers.
+
+    Results and exceptions are the same as for the original codec. Only instances of CodecSet, RegExCodec,
+    ListCodec and DictCodec themselves are specialized: the exact class is looked at, so a subclass of one of
+    them is never compiled as its base class. A JSONCodecSet is compiled as a CodecSet (without its json module
+    backend). Any other codec keeps its own methods: if its class reimplements _trydecodeone (or encode or
+    reversehook), that method is called as is, and otherwise only the wrapping done by
+    BaseCodec._trydecodeone (and encode) is compiled around its own _trydecode (and _encode), with its own
+    applyhook and validate_for_encode. The methods that a subclass inherits (such as ListCodec._decode_from
+    and DictCodec._decode_item) thus run unchanged along with those it reimplements, and call the codecs
+    under it directly, so that these are not compiled when they are reached only through it.
+
+    A DictCodec (not a subclass) with a schema (see DictCodec.addArgument) whose hook is a class, with
+    hook_mode KWARGS, is compiled to decode each value into the slot of the corresponding argument of the
+    class's __init__, and to construct the class by passing the arguments by position, without building a
+    dict first.
+
+    The compiled codec is a snapshot: changes made to the original codecs afterwards (such as
+    CodecSet.appendCodec) are not seen by it. Compile again after modifying them.
+
+    'lexer': If True, the terminal children of each CodecSet (RegExCodec and StringCodec instances without
+    hookmatch, and CodecSets made up of only those, such as realcodec) are fused into one regular
+    expression per run of consecutive terminals, with one group per alternative. A token is then
+    recognized by a single match instead of by trying each terminal in turn. Alternatives are tried in the
+    same order as the children, and a StringCodec always ends a run, so that a malformed string is
+    reported by the StringCodec itself.
+    """
+    def __init__(self, codec, lexer=False):
+        self.codec = codec
+        compiler = _Compiler(lexer)
+        self._decodeone = compiler.decoder(codec)
+        self._encodeinto = compiler.encoder(codec)
+        BaseCodec.__init__(self, discardbufferdata=codec.discardbufferdata,
+                           strip_whitespace=codec.strip_whitespace, name=codec.name)
+
+    def _trydecodeone(self, readbuf, offset=0, discardbufferdata=None):
+        return self._decodeone(readbuf, offset, discardbufferdata)
+
+    def decodeone(self, readbuf, offset=0, discardbufferdata=None):
+        result = self._decodeone(readbuf, offset, discardbufferdata)
+        if result is NO_MATCH:
+            raise NoMatch(self.codec)
+        return result
+
+    def decode(self, data):
+        try:
+            return BaseCodec.decode(self, data)
+        except ExcessData as exc:
+            exc.codec = self.codec
+            raise
+
+    def _firstchars(self):
+        return self.codec._firstchars()
+
+    def _children(self):
+        return (self.codec,)
+
+    def validate_for_encode(self, obj):
+        return self.codec.validate_for_encode(obj)
+
+    def encode(self, obj, file=None, indent="    ", indentlevel=0, indentfirstline=True):
+        writer = fragmentwriter(file)
+
+        try:
+            ret = self._encodeinto(obj, writer, indent, indentlevel, indentfirstline)
+        finally:
+            if writer is not file:
+                writer.flush()
+
+        if file is None:
+            return writer.getvalue()
+
+        return ret
+
+class _Compiler(object):
+    """
+    Generates the closures used by CompiledCodec. Each codec is compiled once; a codec that is reached
+    again while it is still being compiled (i.e., through a cycle) is called through a forwarding function.
+    """
+    def __init__(self, lexer=False):
+        self.lexer = lexer
+        self._decoders = {}
+        self._encoders = {}
+        self._validators = {}
+        self._encodeplans = {}
+
+    def _memoize(self, table, codec, make):
+        if codec in table:
+            return table[codec]
+
+        cell = []
+        table[codec] = lambda *args: cell[0](*args)
+        func = make(codec)
+        cell.append(func)
+        table[codec] = func
+        return func
+
+    def decoder(self, codec):
+        """Returns a function equivalent to codec._trydecodeone."""
+        return self._memoize(self._decoders, codec, self._makedecoder)
+
+    def encoder(self, codec):
+        """Returns a function equivalent to codec.encode, for use with a file that is not None."""
+        return self._memoize(self._encoders, codec, self._makeencoder)
+
+    def validator(self, codec):
+        """Returns a function equivalent to codec.validate_for_encode."""
+        return self._memoize(self._validators, codec, self._makevalidator)
+
+    # Decoding
+
+    def _makedecoder(self, codec):
+        cls = type(codec)
+        if cls._trydecodeone is not BaseCodec._trydecodeone:
+            return codec._trydecodeone
+
+        if cls is CodecSet or cls is JSONCodecSet:
+            trydecode = self._codecset_trydecode(codec)
+        elif cls is RegExCodec:
+            trydecode = self._regexcodec_trydecode(codec)
+        elif cls is ListCodec:
+            trydecode = self._listcodec_trydecode(codec)
+        elif cls is DictCodec:
+            plan = self._dictcodec_schema(codec)
+            if plan is not None:
+                return self._trydecodeone(codec, self._dictcodec_trydecode(codec, plan),
+                                          self._dictcodec_construct(codec, plan))
+            trydecode = self._dictcodec_trydecode(codec)
+        else:
+            trydecode = codec._trydecode
+
+        return self._trydecodeone(codec, trydecode)
+
+    def _hook(self, codec):
+        """Returns a function equivalent to codec.applyhook, or None if it has no effect."""
+        if type(codec).applyhook is not BaseCodec.applyhook:
+            return codec.applyhook
+
+        hook = codec.hook
+        if codec.hook_mode == SINGLE:
+            if callable(hook):
+                return hook
+            return lambda obj: hook(obj)
+        elif codec.hook_mode == ARGS:
+            return lambda obj: hook(*obj)
+        elif codec.hook_mode == KWARGS:
+            return lambda obj: hook(**obj)
+        return None
+
+    def _trydecodeone(self, codec, trydecode, hook=None):
+        """
+        Returns a function equivalent to codec._trydecodeone, given a function equivalent to codec._trydecode.
+        'hook' replaces codec.applyhook, if given.
+        """
+        strip_whitespace = codec.strip_whitespace
+        default_discardbufferdata = codec.discardbufferdata
+        if hook is None:
+            hook = self._hook(codec)
+
+        def trydecodeone(readbuf, offset=0, discardbufferdata=None):
+            if hook is not None:
+                startabsoffset = readbuf.absoffset(offset)
+
+            if discardbufferdata is None:
+                discardbufferdata = default_discardbufferdata
+
+            if strip_whitespace:
+                offset = _skip_whitespace(readbuf, offset, discardbufferdata)
+
+            while True:
+                try:
+                    result = trydecode(readbuf, offset, discardbufferdata)
+                except UnexpectedEndOfData:
+                    if readbuf.closed or readbuf.readatleast(len(readbuf) - offset) == 0:
+                        raise
+                    continue
+                except NoMatch:
+                    return NO_MATCH
+                else:
+                    break
+
+            if result is NO_MATCH:
+                return result
+
+            obj, offset = result
+
+            if discardbufferdata:
+                readbuf.discard(offset)
+                offset = 0
+
+            if hook is None:
+                return obj, offset
+
+            endabsoffset = readbuf.absoffset(offset)
+
+            try:
+                obj = hook(obj)
+            except BaseException as exc:
+                raise DecodeError(codec, "Exception encountered while applying hook.",
+                                  (startabsoffset, endabsoffset), exc)
+
+            return obj, offset
+
+        return trydecodeone
+
+    def _codecset_trydecode(self, codec):
+        decoders = dict((child, self.decoder(child)) for child in codec.codecs)
+
+        if self.lexer and codec.strip_whitespace:
+            # Whitespace has already been skipped by the time the children are called.
+            plan = lambda children: self._lexplan(children, decoders)
+        else:
+            plan = lambda children: tuple(decoders[child] for child in children)
+
+        alldecoders = plan(codec.codecs)
+
+        codec._makedispatch()
+        dispatch = {}
+        candidates = {}
+        for key, children in codec._dispatch.items():
+            if children not in candidates:
+                candidates[children] = plan(children)
+            dispatch[key] = candidates[children]
+
+        def trydecode(readbuf, offset, discardbufferdata):
+            for decodeone in dispatch.get(readbuf.charat(offset), alldecoders):
+                result = decodeone(readbuf, offset, discardbufferdata)
+                if result is not NO_MATCH:
+                    return result
+            return NO_MATCH
+
+        return trydecode
+
+    # Lexer
+
+    def _alternatives(self, codec, visiting=frozenset()):
+        """
+        Returns the tokens recognized by 'codec' as a list of (codec, source, bytessource, flags, groups,
+        isstring) tuples, to be tried in that order, or None if codec is not a terminal that can be fused.
+        'bytessource' is None if the token cannot be fused for use on binary data.
+        """
+        cls = type(codec)
+        if cls is RegExCodec:
+            pattern = codec.regex
+            if codec.hookmatch or not isinstance(pattern.pattern, str) or _unfusable.search(pattern.pattern):
+                return None
+            try:
+                bytessource = bytespattern(pattern).pattern
+            except TypeError:
+                bytessource = None
+            return [(codec, pattern.pattern, bytessource, pattern.flags, pattern.groups, False)]
+
+        elif cls is StringCodec:
+            pattern = codec.decode_string_match
+            if (not len(codec.begin_delim) or not len(codec.end_delim) or not isinstance(pattern.pattern, str)
+                    or _unfusable.search(pattern.pattern)):
+                return None
+            source = "%s((?:%s)*+)%s" % (regex.escape(codec.begin_delim), pattern.pattern, regex.escape(codec.end_delim))
+            try:
+                bytespatt = codec.decode_string_match_bytes or bytespattern(pattern)
+                bytessource = b"%s((?:%s)*+)%s" % (regex.escape(codec.begin_delim.encode("utf-8")), bytespatt.pattern,
+                                                   regex.escape(codec.end_delim.encode("utf-8")))
+            except (TypeError, UnicodeEncodeError):
+                bytessource = None
+            return [(codec, source, bytessource, pattern.flags, pattern.groups + 1, True)]
+
+        elif cls is CodecSet and self._hook(codec) is None and codec not in visiting:
+            alternatives = []
+            for child in codec.codecs:
+                if alternatives and alternatives[-1][5]:
+                    return None
+                childalternatives = self._alternatives(child, visiting | {codec})
+                if childalternatives is None:
+                    return None
+                alternatives.extend(childalternatives)
+            if len(set(alternative[3] for alternative in alternatives)) > 1:
+                return None
+            return alternatives
+
+        return None
+
+    def _lexplan(self, children, decoders):
+        """Returns the functions to try, in order, to decode one of 'children', fusing runs of terminals."""
+        steps = []
+        run = []
+
+        for child in children:
+            alternatives = self._alternatives(child)
+            if alternatives is None or not alternatives or (run and run[-1][1][0][3] != alternatives[0][3]):
+                steps.extend(self._lexer(run, decoders))
+                run = []
+            if alternatives is None or not alternatives:
+                steps.append(decoders[child])
+                continue
+            run.append((child, alternatives))
+            if alternatives[-1][5]:
+                steps.extend(self._lexer(run, decoders))
+                run = []
+
+        steps.extend(self._lexer(run, decoders))
+        return tuple(steps)
+
+    def _lexer(self, run, decoders):
+        """
+        Returns a list of functions that decode the tokens of the terminals in 'run'. Unless there is
+        something to fuse, these are just the decoders of the terminals.
+        """
+        alternatives = [alternative for child, childalternatives in run for alternative in childalternatives]
+        if len(alternatives) < 2:
+            return [decoders[child] for child, childalternatives in run]
+
+        sources = []
+        bytessources = []
+        finishers = {}
+        group = 1
+        for codec, source, bytessource, flags, groups, isstring in alternatives:
+            sources.append("(%s)" % source)
+            if bytessource is not None:
+                bytessources.append(b"(" + bytessource + b")")
+            finishers[group] = self._finisher(codec, group + 1 if isstring else group, isstring)
+            group += groups + 1
+
+        try:
+            match = regex.compile("|".join(sources), flags).match
+        except regex.error:
+            return [decoders[child] for child, childalternatives in run]
+
+        try:
+            bytesmatch = regex.compile(b"|".join(bytessources), flags & ~(regex.UNICODE | regex.LOCALE)).match
+        except regex.error:
+            bytesmatch = None
+
+        if len(bytessources) < len(sources):
+            bytesmatch = None
+
+        # Only a StringCodec can fail with an error instead of NO_MATCH, and it is always the last alternative.
+        fallback = decoders[run[-1][0]] if alternatives[-1][5] else None
+        run_decoders = tuple(decoders[child] for child, childalternatives in run)
+
+        def lex(readbuf, offset, discardbufferdata):
+            if readbuf.binary:
+                if bytesmatch is None:
+                    for decodeone in run_decoders:
+                        result = decodeone(readbuf, offset, discardbufferdata)
+                        if result is not NO_MATCH:
+                            return result
+                    return NO_MATCH
+                result = readbuf.regex_op(bytesmatch, pos=offset)
+            else:
+                result = readbuf.regex_op(match, pos=offset)
+
+            if result is None:
+                if fallback is not None:
+                    return fallback(readbuf, offset, discardbufferdata)
+                return NO_MATCH
+
+            return finishers[result.lastindex](readbuf, result, offset, discardbufferdata)
+
+        return [lex]
+
+    def _finisher(self, codec, group, isstring):
+        """
+        Returns a function that completes the decoding of a token matched by a fused pattern, as
+        codec._trydecodeone would have (without the whitespace, which has already been skipped).
+        """
+        hook = self._hook(codec)
+        if isstring:
+            unescape = codec.unescape_char_match.sub
+            unescape_func = codec.unescape_func
+
+        def finish(readbuf, result, offset, discardbufferdata):
+            if hook is not None:
+                startabsoffset = readbuf.absoffset(offset)
+
+            obj = result.group(group)
+            if readbuf.binary:
+                obj = obj.decode("utf-8")
+            if isstring:
+                obj = unescape(unescape_func, obj)
+            offset = result.end()
+
+            if discardbufferdata:
+                readbuf.discard(offset)
+                offset = 0
+
+            if hook is None:
+                return obj, offset
+
+            endabsoffset = readbuf.absoffset(offset)
+
+            try:
+                obj = hook(obj)
+            except BaseException as exc:
+                raise DecodeError(codec, "Exception encountered while applying hook.",
+                                  (startabsoffset, endabsoffset), exc)
+
+            return obj, offset
+
+        return finish
+
+    def _regexcodec_trydecode(self, codec):
+        match = codec.regex.match
+        hookmatch = codec.hookmatch
+
+        def trydecode(readbuf, offset, discardbufferdata):
+            result = readbuf.regex_op(match, pos=offset)
+
+            if result is None:
+                return NO_MATCH
+
+            if hookmatch:
+                return result, result.end()
+
+            if readbuf.binary:
+                return result.group().decode("utf-8"), result.end()
+
+            return result.group(), result.end()
+
+        return trydecode
+
+    def _delimmatcher(self, codec, delim):
+        """Returns a function equivalent to codec._match_delim for a fixed delimiter."""
+        skip_whitespace_between_items = codec.skip_whitespace_between_items
+        length = len(delim)
+
+        def match_delim(readbuf, offset):
+            if skip_whitespace_between_items:
+                offset = _skip_whitespace(readbuf, offset, False)
+
+            while offset + length > len(readbuf) and not readbuf.closed:
+                readbuf.readdata()
+
+            if readbuf.string_match(delim, offset):
+                return offset + length
+
+            return NO_MATCH
+
+        return match_delim
+
+    def _listcodec_trydecode(self, codec):
+        match_begin_delim = self._delimmatcher(codec, codec.begin_delim)
+        match_item_delim = self._delimmatcher(codec, codec.item_delim)
+        match_end_delim = self._delimmatcher(codec, codec.end_delim)
+        has_end_delim = bool(len(codec.end_delim))
+        skip_whitespace_between_items = codec.skip_whitespace_between_items
+        notify_decode = codec.notify_decode if callable(codec.notify_decode) else None
+        item_decoder = self.decoder(codec.item_codec)
+        decoders_by_index = dict((k, self.decoder(child)) for (k, child) in codec.codecs_by_index.items())
+
+        def trydecode(readbuf, offset, discardbufferdata):
+            offset = match_begin_delim(readbuf, offset)
+            if offset is NO_MATCH:
+                return NO_MATCH
+
+            results = []
+            k = 0
+            while True:
+                if has_end_delim:
+                    end = match_end_delim(readbuf, offset)
+                    if end is not NO_MATCH:
+                        return results, end
+
+                if skip_whitespace_between_items:
+                    offset = _skip_whitespace(readbuf, offset)
+
+                if decoders_by_index:
+                    result = decoders_by_index.get(k, item_decoder)(readbuf, offset, discardbufferdata)
+                else:
+                    result = item_decoder(readbuf, offset, discardbufferdata)
+
+                if result is NO_MATCH:
+                    lineno, char = readbuf.abspos(offset)
+                    raise DecodeError(codec, "Unexpected character or item on line %d, character %d ('%s')." % (
+                        lineno, char, readbuf.peek(offset, 16)), readbuf.absoffset(offset))
+
+                item, offset = result
+                results.append(item)
+                k += 1
+
+                if notify_decode is not None:
+                    notify_decode(item)
+
+                end = match_item_delim(readbuf, offset)
+                if end is NO_MATCH:
+                    end = match_end_delim(readbuf, offset)
+                    if end is NO_MATCH:
+                        if offset < len(readbuf):
+                            lineno, char = readbuf.abspos(offset)
+                            raise DecodeError(codec, "Unexpected character on line %d, character %d ('%s')." % (
+                                lineno, char, readbuf.peek(offset, 16)), offset)
+                        raise UnexpectedEndOfData(codec, "Unexpected end of string while decoding list.")
+                    return results, end
+                offset = end
+
+        return trydecode
+
+    def _dictcodec_schema(self, codec):
+        """
+        Returns an InitPlan for the hook of a DictCodec with a schema (see DictCodec.addArgument), if the
+        hook is a class that can be constructed by passing each argument by position instead of by keyword,
+        or None.
+        """
+        hook = codec.hook
+        if (codec.hook_mode != KWARGS or type(codec).applyhook is not BaseCodec.applyhook or not codec.codecs_by_key
+                or codec.dicttype not in (dict, OrderedDict) or type(hook) is not type or hook.__new__ is not object.__new__):
+            return None
+
+        plan = initplan(hook)
+        if plan.error is not None or plan.posonly or plan.kwonly:
+            return None
+
+        if not set(plan.args).issuperset(set(codec.codecs_by_key) | codec.required_args | codec.optional_args):
+            return None
+
+        return plan
+
+    def _dictcodec_construct(self, codec, plan):
+        """
+        Returns a function equivalent to codec.applyhook, for the records (values, present, extra) decoded by
+        a DictCodec compiled with a schema: 'values' is the list of arguments of plan, in order, 'present' the
+        bitmask of the arguments that were decoded, and 'extra' a dict of any other entries (or None).
+        """
+        hook = codec.hook
+        init = plan.init
+        args = plan.args
+        complete = (1 << len(args)) - 1
+        defaults = tuple((index, 1 << index, plan.defaults.get(arg, _MISSING)) for (index, arg) in enumerate(args))
+
+        def construct(record):
+            values, present, extra = record
+            if extra is None and hook.__init__ is init:
+                if present == complete:
+                    return hook(*values)
+
+                for index, bit, default in defaults:
+                    if not present & bit:
+                        if default is _MISSING:
+                            break
+                        values[index] = default
+                else:
+                    return hook(*values)
+
+            # Let the class report what is wrong with the arguments.
+            kwargs = dict((arg, value) for (index, (arg, value)) in enumerate(zip(args, values)) if present & (1 << index))
+            if extra is not None:
+                kwargs.update(extra)
+            return hook(**kwargs)
+
+        return construct
+
+    def _dictcodec_trydecode(self, codec, plan=None):
+        """
+        If 'plan' is given (see _dictcodec_schema), each key is resolved to its slot in plan.args and its
+        decoder by a single lookup, and a record is returned for _dictcodec_construct instead of a dict.
+        """
+        match_begin_delim = self._delimmatcher(codec, codec.begin_delim)
+        match_item_delim = self._delimmatcher(codec, codec.item_delim)
+        match_key_delim = self._delimmatcher(codec, codec.key_delim)
+        match_end_delim = self._delimmatcher(codec, codec.end_delim)
+        end_delim = codec.end_delim
+        key_delim = codec.key_delim
+        item_delim = codec.item_delim
+        skip_whitespace_between_items = codec.skip_whitespace_between_items
+        required_args = tuple(codec.required_args)
+        dicttype = codec.dicttype
+        notify_decode = codec.notify_decode
+        key_decoder = self.decoder(codec.key_codec)
+        item_decoder = self.decoder(codec.item_codec)
+        class_decoder = self.decoder(pystringcodec)
+        decoders_by_key = dict((key, self.decoder(child)) for (key, child) in codec.codecs_by_key.items())
+        keep = None if codec.keep is None else codec.keep | frozenset(codec.required_args)
+        skip_value = codec._skip_value
+        check_key = codec._check_key
+        check_end = codec._check_end
+        check_required = codec._check_required
+
+        if plan is not None:
+            slots = dict((arg, (index, 1 << index, decoders_by_key.get(arg, item_decoder)))
+                         for (index, arg) in enumerate(plan.args))
+            nslots = len(slots)
+            required_mask = sum(slots[key][1] for key in required_args)
+
+        def trydecode(readbuf, offset, discardbufferdata):
+            offset = match_begin_delim(readbuf, offset)
+            if offset is NO_MATCH:
+                return NO_MATCH
+
+            if plan is None:
+                results = []
+            else:
+                values = [None]*nslots
+                present = 0
+                extra = None
+            keys = set()
+            classmatched = False
+            while True:
+                end = match_end_delim(readbuf, offset)
+                if end is not NO_MATCH:
+                    offset = end
+                    check_end(readbuf, offset)
+                    break
+
+                if skip_whitespace_between_items:
+                    offset = _skip_whitespace(readbuf, offset)
+
+                result = key_decoder(readbuf, offset, False)
+                if result is NO_MATCH:
+                    lineno, char = readbuf.abspos(offset)
+                    raise DecodeError(codec,
+                                      "Unexpected character while trying to decode key on line %d, character %d ('%s')." % (
+                        lineno, char, readbuf.peek(offset, 16)))
+                key, offset = result
+                isclass = check_key(readbuf, offset, key, keys, classmatched)
+
+                end = match_key_delim(readbuf, offset)
+                if end is NO_MATCH:
+                    lineno, char = readbuf.abspos(offset)
+                    raise DecodeError(codec, "Unexpected character on line %d, character %d (got '%s', expected '%s')." % (
+                        lineno, char, readbuf.peek(offset, 1), key_delim), readbuf.abspos(offset))
+                offset = end
+
+                if skip_whitespace_between_items:
+                    offset = _skip_whitespace(readbuf, offset)
+
+                slot = None
+                dropped = False
+                if isclass:
+                    result = class_decoder(readbuf, offset, False)
+                elif keep is not None and key not in keep:
+                    result = skip_value(readbuf, offset, key)
+                    if result is not NO_MATCH:
+                        result = None, result
+                    dropped = True
+                elif key == "class":
+                    result = class_decoder(readbuf, offset, False)
+                elif plan is None:
+                    result = decoders_by_key.get(key, item_decoder)(readbuf, offset, discardbufferdata)
+                else:
+                    slot = slots.get(key)
+                    if slot is None:
+                        result = decoders_by_key.get(key, item_decoder)(readbuf, offset, discardbufferdata)
+                    else:
+                        result = slot[2](readbuf, offset, discardbufferdata)
+
+                if result is NO_MATCH:
+                    lineno, char = readbuf.abspos(offset)
+                    raise DecodeError(codec, "Unexpected character or item on line %d, character %d ('%s')." % (
+                        lineno, char, readbuf.peek(offset, 16)), readbuf.absoffset(offset))
+                value, offset = result
+
+                if isclass:
+                    if not codec._match_class(value):
+                        return NO_MATCH
+                    classmatched = True
+                elif dropped:
+                    keys.add(key)
+                else:
+                    if plan is None:
+                        results.append((key, value))
+                    elif slot is not None:
+                        values[slot[0]] = value
+                        present |= slot[1]
+                    elif extra is None:
+                        extra = {key: value}
+                    else:
+                        extra[key] = value
+                    keys.add(key)
+
+                    if notify_decode is not None:
+                        notify_decode(key, value)
+
+                end = match_item_delim(readbuf, offset)
+                if end is NO_MATCH:
+                    end = match_end_delim(readbuf, offset)
+                    if end is NO_MATCH:
+                        lineno, char = readbuf.abspos(offset)
+                        raise DecodeError(codec, "Unexpected character on line %d, character %d (got '%s', expected '%s' or '%s')." % (
+                                lineno, char, readbuf.peek(offset, 1), item_delim, end_delim), readbuf.abspos(offset))
+                    offset = end
+                    break
+                offset = end
+
+            if plan is None:
+                check_required(readbuf, offset, keys)
+                return dicttype(results), offset
+
+            if present & required_mask != required_mask:
+                check_required(readbuf, offset, keys)
+
+            return (values, present, extra), offset
+
+        return trydecode
+
+    # Encoding
+
+    def _makevalidator(self, codec):
+        cls = type(codec)
+        if cls.validate_for_encode is CodecSet.validate_for_encode:
+            lookup = self._encodeplan(codec)
+
+            def validate(obj):
+                checks, match = lookup(obj)
+                if match is not None:
+                    return True
+                for validate_child, encodechild in checks:
+                    if validate_child(obj):
+                        return True
+                return False
+
+            return validate
+
+        if cls.validate_for_encode is not BaseCodec.validate_for_encode:
+            return codec.validate_for_encode
+
+        allowedtype = codec.allowedtype
+        if allowedtype is None:
+            return lambda obj: True
+        return lambda obj: isinstance(obj, allowedtype)
+
+    def _makeencoder(self, codec):
+        cls = type(codec)
+        if cls is JSONCodecSet:
+            cls = CodecSet
+
+        if cls.encode is not BaseCodec.encode or cls.reversehook is not BaseCodec.reversehook:
+            return codec.encode
+
+        if cls is CodecSet and not callable(codec.unhook):
+            return self._codecset_encoder(codec)
+        elif cls is CodecSet:
+            encode = self._codecset_encode(codec)
+        elif cls is ListCodec:
+            encode = self._listcodec_encode(codec)
+        elif cls is DictCodec:
+            encode = self._dictcodec_encode(codec)
+        else:
+            encode = codec._encode
+
+        return self._encodeinto(codec, encode)
+
+    def _encodeinto(self, codec, encode):
+        validate = self.validator(codec)
+        unhook = codec.unhook if callable(codec.unhook) else None
+
+        def encodeinto(obj, file, indent="    ", indentlevel=0, indentfirstline=True):
+            if not validate(obj):
+                raise EncodeMatchError(codec, obj, "Expected %s, got %s instead." % (codec.allowedtype, type(obj)))
+
+            if unhook is not None:
+                obj = unhook(obj)
+
+            if indentfirstline:
+                file.write(indent*indentlevel)
+
+            return encode(obj, file, indent, indentlevel)
+
+        return encodeinto
+
+    def _encodeplan(self, codec):
+        """
+        Returns a function equivalent to codec._encodeplan, with entries made up of the compiled validators and
+        encoders of the children of the CodecSet 'codec'.
+        """
+        if codec not in self._encodeplans:
+            self._encodeplans[codec] = _EncodePlans([(self.validator(child), self.encoder(child)) for child in codec.codecs],
+                                                    [_typebased(child) for child in codec.codecs]).lookup
+        return self._encodeplans[codec]
+
+    def _codecset_encode(self, codec):
+        lookup = self._encodeplan(codec)
+
+        def encode(obj, file, indent, indentlevel):
+            checks, match = lookup(obj)
+            for validate, encodeinto in checks:
+                if validate(obj):
+                    return encodeinto(obj, file, indent, indentlevel, False)
+            if match is not None:
+                return match[1](obj, file, indent, indentlevel, False)
+            raise EncodeMatchError(codec, obj, "No codec found for '%s' object." % type(obj).__name__)
+
+        return encode
+
+    def _codecset_encoder(self, codec):
+        """
+        Without an unhook, validating obj against the CodecSet and then finding the child codec to encode
+        it with can be done in a single lookup.
+        """
+        lookup = self._encodeplan(codec)
+
+        def encodeinto(obj, file, indent="    ", indentlevel=0, indentfirstline=True):
+            checks, match = lookup(obj)
+            for validate, encodechild in checks:
+                if validate(obj):
+                    break
+            else:
+                if match is None:
+                    raise EncodeMatchError(codec, obj, "Expected %s, got %s instead." % (codec.allowedtype, type(obj)))
+                encodechild = match[1]
+
+            if indentfirstline:
+                file.write(indent*indentlevel)
+            return encodechild(obj, file, indent, indentlevel, False)
+
+        return encodeinto
+
+    def _listcodec_encode(self, codec):
+        begin_delim = codec.begin_delim
+        end_delim = codec.end_delim
+        item_encoder = self.encoder(codec.item_codec)
+        encoders_by_index = dict((k, self.encoder(child)) for (k, child) in codec.codecs_by_index.items())
+
+        if codec.multiline and codec.skip_whitespace_between_items:
+            item_delim = codec.item_delim
+
+            def encode(obj, file, indent, indentlevel):
+                newline = "\n" + indent*(indentlevel + 1)
+                separator = item_delim + newline
+                if begin_delim:
+                    file.write(begin_delim)
+                for k, item in enumerate(obj):
+                    file.write(separator if k > 0 else newline)
+                    encoders_by_index.get(k, item_encoder)(item, file, indent, indentlevel+1, False)
+                file.write("\n" + indent*indentlevel + end_delim)
+
+            return encode
+
+        if codec.skip_whitespace_between_items:
+            separator = codec.item_delim + " "
+        else:
+            separator = codec.item_delim
+
+        def encode(obj, file, indent, indentlevel):
+            if begin_delim:
+                file.write(begin_delim)
+            for k, item in enumerate(obj):
+                if k > 0:
+                    file.write(separator)
+                encoders_by_index.get(k, item_encoder)(item, file, indent, indentlevel+1, False)
+            if end_delim:
+                file.write(end_delim)
+
+        return encode
+
+    def _dictcodec_encode(self, codec):
+        begin_delim = codec.begin_delim
+        end_delim = codec.end_delim
+        requireclasskey = codec.requireclasskey
+        key_encoder = self.encoder(codec.key_codec)
+        item_encoder = self.encoder(codec.item_codec)
+        class_encoder = self.encoder(pystringcodec)
+        encoders_by_key = dict((key, self.encoder(child)) for (key, child) in codec.codecs_by_key.items())
+        encoders_by_key["class"] = class_encoder
+
+        if codec.multiline and codec.skip_whitespace_between_items:
+            item_delim = codec.item_delim
+            key_separator = codec.key_delim + " "
+
+            def encode(obj, file, indent, indentlevel):
+                newline = "\n" + indent*(indentlevel + 1)
+                separator = item_delim + newline
+                if begin_delim:
+                    file.write(begin_delim)
+                K = 0
+                if requireclasskey:
+                    file.write(newline)
+                    key_encoder("class", file, indent, indentlevel + 1, False)
+                    file.write(key_separator)
+                    typestring = "%s.%s" % (codec.allowedtype.__module__, codec.allowedtype.__name__)
+                    class_encoder(typestring, file, indent, indentlevel + 1, False)
+                    K = 1
+                for k, (key, value) in enumerate(obj.items(), K):
+                    file.write(separator if k > 0 else newline)
+                    key_encoder(key, file, indent, indentlevel + 1, False)
+                    file.write(key_separator)
+                    encoders_by_key.get(key, item_encoder)(value, file, indent, indentlevel+1, False)
+                file.write("\n" + indent*indentlevel + end_delim)
+
+            return encode
+
+        if codec.skip_whitespace_between_items:
+            separator = codec.item_delim + " "
+            key_separator = codec.key_delim + " "
+        else:
+            separator = codec.item_delim
+            key_separator = codec.key_delim
+
+        def encode(obj, file, indent, indentlevel):
+            if begin_delim:
+                file.write(begin_delim)
+            K = 0
+            if requireclasskey:
+                key_encoder("class", file, indent, indentlevel + 1, False)
+                file.write(key_separator)
+                typestring = "%s.%s" % (codec.allowedtype.__module__, codec.allowedtype.__name__)
+                class_encoder(typestring, file, indent, indentlevel + 1, False)
+                K = 1
+            for k, (key, value) in enumerate(obj.items(), K):
+                if k > 0:
+                    file.write(separator)
+                key_encoder(key, file, indent, indentlevel + 1, False)
+                file.write(key_separator)
+                encoders_by_key.get(key, item_encoder)(value, file, indent, indentlevel+1, False)
+            file.write(end_delim)
+
+        return encode
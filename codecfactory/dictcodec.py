@@ -1,15 +1,79 @@
-from codecfactory.basecodec import (BaseCodec, ReadBuffer, skip_whitespace,
+from codecfactory.basecodec import (BaseCodec, ReadBuffer, skip_whitespace, NO_MATCH,
                                     NOHOOK, SINGLE, ARGS, KWARGS)
 from codecfactory.exc import (DecodeError, NoMatch, UnexpectedEndOfData, ExcessData,
                  EncodeError, EncodeMatchError)
-import inspect
-import types
 from collections import OrderedDict
-from codecfactory.listcodec import ListCodec
-from codecfactory.stringcodec import pystringcodec
+from codecfactory.listcodec import ListCodec, initplan
+from codecfactory.codecset import CodecSet, _listen
+from codecfactory.stringcodec import StringCodec, pystringcodec
+from codecfactory.regexcodec import RegExCodec
+import regex
 
 __all__ = ["DictCodec"]
 
+def _valuepattern(codec):
+    """
+    Returns a regular expression that matches a value of an entry of the DictCodec 'codec' that is a list, dict
+    or string, by only tracking the nesting of the lists, dicts and strings in it, or None if that cannot be
+    done reliably: every codec reachable from codec must be a ListCodec, DictCodec, CodecSet, StringCodec
+    (escaping with a backslash) or RegExCodec (whose regex matches none of their delimiters) that does not
+    reimplement decoding, with delimiters that are single ASCII characters.
+    """
+    found = []
+    stack = [codec]
+    while stack:
+        child = stack.pop()
+        if any(child is other for other in found):
+            continue
+        found.append(child)
+        if isinstance(child, CodecSet) and child._skip is not None:
+            stack.extend(child.codecs)
+        elif type(child) in (ListCodec, DictCodec):
+            stack.append(child.item_codec)
+            stack.extend(child.codecs_by_index.values())
+            if type(child) is DictCodec:
+                stack.extend((child.key_codec, pystringcodec))
+                stack.extend(child.codecs_by_key.values())
+        elif not isinstance(child, (StringCodec, RegExCodec)) or child._skip is None:
+            return None
+
+    brackets = set()
+    quotes = set()
+    for child in found:
+        if isinstance(child, StringCodec):
+            if not child.unescape_char_match.pattern.startswith("\\\\") or child.begin_delim != child.end_delim:
+                return None
+            quotes.add(child.begin_delim)
+        elif isinstance(child, ListCodec):
+            brackets.add((child.begin_delim, child.end_delim))
+
+    inner = set(quotes)
+    for begin_delim, end_delim in brackets:
+        inner.update((begin_delim, end_delim))
+    outer = inner | set([codec.item_delim, codec.end_delim])
+    if (any(len(char) != 1 or ord(char) > 127 for char in outer) or "\\" in outer
+            or any(begin_delim == end_delim for begin_delim, end_delim in brackets)):
+        return None
+
+    for child in found:
+        if isinstance(child, RegExCodec) and (not isinstance(child.regex.pattern, str)
+                                              or any(child.regex.search(char) for char in outer)):
+            return None
+
+    escape = regex.escape
+    strings = "".join("|%s(?:[^%s\\\\]++|\\\\[\\s\\S])*+%s" % (escape(quote), escape(quote), escape(quote))
+                      for quote in sorted(quotes))
+    if not strings and not brackets:
+        return None
+    nested = "|".join("%s(?:[^%s]++%s|(?&nested))*+%s" % (escape(begin_delim), escape("".join(sorted(inner))),
+                                                          strings, escape(end_delim))
+                      for begin_delim, end_delim in sorted(brackets))
+    # Anything else (a number, say) is left to the codecs, so that the value is a single token or group.
+    pattern = "(?:%s)" % strings[1:]
+    if nested:
+        pattern = "(?(DEFINE)(?P<nested>%s))(?:(?&nested)%s)" % (nested, strings)
+    return regex.compile(pattern)
+
 class DictCodec(ListCodec):
     def __init__(self,
                  key_codec, item_codec, codecs_by_key=OrderedDict(),
@@ -20,9 +84,21 @@ class DictCodec(ListCodec):
                  notify_encode=None, notify_decode=None,
                  allowedtype=None, multiline=True,
                  skip_whitespace_between_items=True,
-                 discardbufferdata=True,
+                 discardbufferdata=True, keep=None,
                  name="DictCodec"
                  ):
+        """
+        'keep': If not None, a collection of the keys whose entries are decoded. The values of all other keys
+            (except for those in required_args, which are always kept) are skipped over without being decoded
+            (see _skip_value), and are seen by neither notify_decode nor the hook. Keys are still checked for
+            repetitions and against required_args, optional_args and allow_unknown, and a skipped value must
+            still be a single value followed by item_delim or end_delim: other values are skimmed over by the
+            codec of their key, but lists, dicts and strings are, where possible, only checked for balanced
+            delimiters and terminated strings, so that invalid data inside of them (or a value of a type that
+            the codec of the key does not decode) is not reported.
+
+        The other parameters retain their meaning from ListCodec.
+        """
         self.key_codec = key_codec
         self.codecs_by_key = codecs_by_key.copy()
         self.required_args = set(required_args)
@@ -30,6 +106,7 @@ class DictCodec(ListCodec):
         self.dicttype = dicttype
         self.requireclasskey = bool(requireclasskey)
         self.allow_unknown = allow_unknown
+        self.keep = None if keep is None else frozenset(keep)
 
         self.key_delim = key_delim
 
@@ -42,113 +119,222 @@ class DictCodec(ListCodec):
                  multiline=multiline, skip_whitespace_between_items=skip_whitespace_between_items,
                  discardbufferdata=discardbufferdata, name=name)
 
+    def _children(self):
+        return ListCodec._children(self) + (self.key_codec,) + tuple(self.codecs_by_key.values())
+
     def _decode_key(self, readbuf, offset=0, discardbufferdata=None):
-        try:
-            return self.key_codec.decodeone(readbuf, offset, discardbufferdata=discardbufferdata)
-        except NoMatch:
+        result = self.key_codec._trydecodeone(readbuf, offset, discardbufferdata=discardbufferdata)
+        if result is NO_MATCH:
             lineno, char = readbuf.abspos(offset)
             raise DecodeError(self,
                               "Unexpected character while trying to decode key on line %d, character %d ('%s')." % (
-                lineno, char, readbuf.data[offset:offset+16]))
+                lineno, char, readbuf.peek(offset, 16)))
+        return result
 
     def _match_key_delim(self, readbuf, offset=0):
         offset = self._match_delim(readbuf, self.key_delim, offset)
         return offset
 
     def _match_class(self, string):
-        if string != "%s.%s" % (self.allowedtype.__module__, self.allowedtype.__name__):
-            raise NoMatch(self)
-        return True
+        return string == "%s.%s" % (self.allowedtype.__module__, self.allowedtype.__name__)
+
+    def _check_key(self, readbuf, offset, key, keys, classmatched):
+        """
+        Checks the key that was decoded just before offset, given the set of the keys decoded before it and
+        whether the class entry has been matched, raising DecodeError if the key is not allowed. Returns True
+        if the entry is the class entry (see requireclasskey), whose value must be checked with _match_class.
+
+        Every decoder of DictCodec entries (_decode_from, the compiled decoder and iterquery) validates keys
+        with _check_key, _check_end and _check_required.
+        """
+        isclass = self.requireclasskey and not classmatched and not keys
+        if isclass and key != "class":
+            lineno, char = readbuf.abspos(offset)
+            raise DecodeError(self, "Expected class keyword on line %d, character %d (got '%s' instead)." %
+                              (lineno, char, key), readbuf.abspos(offset))
+
+        elif key in keys:
+            lineno, char = readbuf.abspos(offset)
+            raise DecodeError(self, "Keyword argument '%s' repeated on line %d, character %d." %
+                              (key, lineno, char), readbuf.abspos(offset))
+
+        elif not (key in self.required_args or key in self.optional_args or self.allow_unknown):
+            lineno, char = readbuf.abspos(offset)
+            raise DecodeError(self, "Unexpected keyword argument '%s' on line %d, character %d." %
+                              (key, lineno, char), readbuf.abspos(offset))
+
+        return isclass
+
+    def _check_end(self, readbuf, offset):
+        """
+        Checks the end_delim that was matched just before offset where a key could have started, raising
+        DecodeError if a class entry is required (see requireclasskey).
+        """
+        if self.requireclasskey:
+            lineno, char = readbuf.abspos(offset - len(self.end_delim))
+            raise DecodeError(self, "Expected class keyword on line %d, character %d (got '%s' instead)." %
+                              (lineno, char, self.end_delim), readbuf.abspos(offset - len(self.end_delim)))
+
+    def _check_required(self, readbuf, offset, keys):
+        """Checks that the set 'keys' of the keys of a dict that ends at offset holds every key in required_args."""
+        for key in self.required_args:
+            if key not in keys:
+                raise DecodeError(self, "Required key '%s' missing." % key, readbuf.abspos(offset))
 
     def _decode_item(self, readbuf, offset=0, key=None, discardbufferdata=None):
         if key == "class":
             codec = pystringcodec
-            return codec.decodeone(readbuf, offset, discardbufferdata=False)
+            return codec._trydecodeone(readbuf, offset, discardbufferdata=False)
         else:
             codec = self.codecs_by_key.get(key, self.item_codec)
-            return codec.decodeone(readbuf, offset, discardbufferdata=discardbufferdata)
+            return codec._trydecodeone(readbuf, offset, discardbufferdata=discardbufferdata)
 
-    def _decode(self, readbuf, offset=0, discardbufferdata=None):
+    def _skip_item(self, readbuf, offset=0, key=None):
+        if key == "class":
+            codec = pystringcodec
+        else:
+            codec = self.codecs_by_key.get(key, self.item_codec)
+        if codec.strip_whitespace:
+            offset = skip_whitespace(readbuf, offset, False)
+        start = readbuf.absoffset(offset)
+        end = codec._tryskip(readbuf, offset)
+        if end is NO_MATCH:
+            return end
+        return (start, readbuf.absoffset(end)), end
+
+    _generation = 0
+    _valuescanner = None
+    _valuescanner_generation = None
+
+    def _skip_value(self, readbuf, offset=0, key=None):
+        """
+        Skips over the value of a key that is not kept (see 'keep'), returning the offset of its end, or NO_MATCH.
+        Lists, dicts and strings are matched by a single regular expression (see _valuepattern) where possible,
+        which is rebuilt when a CodecSet reachable from this codec is modified (see CodecSet.resetdispatch).
+        Other values are skimmed over by the codec of the key (see _skip_item), and thus validated.
+        """
+        if self._valuescanner_generation != self._generation:
+            _listen(self)
+            self._valuescanner = _valuepattern(self)
+            self._valuescanner_generation = self._generation
+
+        if self._valuescanner is not None:
+            match = readbuf.regex_op(self._valuescanner.match, pos=offset)
+            if match is not None and match.end() > offset:
+                return match.end()
+
+        # Let the codecs report what is wrong with the value.
+        result = self._skip_item(readbuf, offset, key)
+        if result is NO_MATCH:
+            return result
+        return result[1]
+
+    def _decode_items(self, readbuf, offset=0, discardbufferdata=None, lazy=False):
+        """
+        Generator that decodes the dict one entry at a time, yielding (key, value) pairs as they are
+        decoded. The class entry (if self.requireclasskey) is checked, but not yielded. The offset of
+        the end of the dict is returned once end_delim is matched and required_args are checked, or
+        NO_MATCH if begin_delim (or the class entry) is not matched.
+
+        'lazy': If True, values are skimmed over instead of being decoded, and (key, (start, end)) pairs are
+            yielded (see ListCodec._decode_items). Keys, and the class entry, are still decoded.
+        """
         offset = self._match_begin_delim(readbuf, offset)
-        keys = []
-        results = []
+        if offset is NO_MATCH:
+            return NO_MATCH
+
+        keys = set()
+        offset = yield from self._decode_from(readbuf, offset, discardbufferdata, keys=keys, lazy=lazy)
+        if offset is NO_MATCH:
+            return NO_MATCH
+
+        self._check_required(readbuf, offset, keys)
+        return offset
+
+    def _decode_from(self, readbuf, offset, discardbufferdata=None, stop=None, keys=None, lazy=False):
+        """
+        Same as _decode_items, but starts at offset, just past begin_delim or an item_delim, and does not check
+        for required_args.
+
+        'stop': If not None, an absolute offset at which an item_delim is expected. The offset past the
+            first item_delim that starts at or after stop is returned instead of continuing past it.
+        'keys': Set of the keys decoded so far, to which each key is added.
+        """
+        if keys is None:
+            keys = set()
         classmatched = False
         while True:
-            try:
-                offset = self._match_end_delim(readbuf, offset)
-            except NoMatch:
-                pass
-            else:
-                if self.requireclasskey:
-                    lineno, char = readbuf.abspos(offset - len(self.end_delim))
-                    raise DecodeError(self, "Expected class keyword on line %d, character %d (got '%s' instead)." %
-                                    (lineno, char, self.end_delim), readbuf.abspos(offset - len(self.end_delim)))
-                break
+            end = self._match_end_delim(readbuf, offset)
+            if end is not NO_MATCH:
+                self._check_end(readbuf, end)
+                return end
 
             if self.skip_whitespace_between_items:
                 offset = skip_whitespace(readbuf, offset)
 
             key, offset = self._decode_key(readbuf, offset, discardbufferdata=False)
+            isclass = self._check_key(readbuf, offset, key, keys, classmatched)
 
-            if not classmatched and len(results) == 0 and self.requireclasskey and key != "class":
-                lineno, char = readbuf.abspos(offset)
-                raise DecodeError(self, "Expected class keyword on line %d, character %d (got '%s' instead)." %
-                                  (lineno, char, key), readbuf.abspos(offset))
-
-            elif key in keys:
-                lineno, char = readbuf.abspos(offset)
-                raise DecodeError(self, "Keyword argument '%s' repeated on line %d, character %d." %
-                                  (key, lineno, char), readbuf.abspos(offset))
-
-            elif not (key in self.required_args or key in self.optional_args or self.allow_unknown):
-                lineno, char = readbuf.abspos(offset)
-                raise DecodeError(self, "Unexpected keyword argument '%s' on line %d, character %d." %
-                                  (key, lineno, char), readbuf.abspos(offset))
-
-            try:
-                offset = self._match_key_delim(readbuf, offset)
-            except NoMatch:
+            end = self._match_key_delim(readbuf, offset)
+            if end is NO_MATCH:
                 lineno, char = readbuf.abspos(offset)
                 raise DecodeError(self, "Unexpected character on line %d, character %d (got '%s', expected '%s')." % (
-                    lineno, char, readbuf.data[offset], self.key_delim), readbuf.abspos(offset))
+                    lineno, char, readbuf.peek(offset, 1), self.key_delim), readbuf.abspos(offset))
+            offset = end
 
             if self.skip_whitespace_between_items:
                 offset = skip_whitespace(readbuf, offset)
 
-            try:
-                value, offset = self._decode_item(readbuf, offset, key, discardbufferdata=discardbufferdata)
-            except NoMatch:
+            dropped = (not isclass and self.keep is not None and key not in self.keep
+                       and key not in self.required_args)
+            if dropped:
+                result = self._skip_value(readbuf, offset, key)
+                if result is not NO_MATCH:
+                    result = None, result
+            elif lazy and not isclass:
+                result = self._skip_item(readbuf, offset, key)
+            else:
+                result = self._decode_item(readbuf, offset, key, discardbufferdata=discardbufferdata)
+            if result is NO_MATCH:
                 lineno, char = readbuf.abspos(offset)
                 raise DecodeError(self, "Unexpected character or item on line %d, character %d ('%s')." % (
-                    lineno, char, readbuf.data[offset:offset+16]), readbuf.absoffset(offset))
+                    lineno, char, readbuf.peek(offset, 16)), readbuf.absoffset(offset))
+            value, offset = result
 
-            #if not classmatched and self.requireclasskey and len(results) == 0:
-            if not classmatched and self.requireclasskey and len(results) == 0:
-                classmatched = self._match_class(value)
+            if isclass:
+                if not self._match_class(value):
+                    return NO_MATCH
+                classmatched = True
             else:
-                results.append((key, value))
-                keys.append(key)
-
-                if self.notify_decode is not None:
-                    self.notify_decode(key, value)
-
-            try:
-                offset = self._match_item_delim(readbuf, offset)
-            except NoMatch:
-                try:
-                    offset = self._match_end_delim(readbuf, offset)
-                except NoMatch:
+                keys.add(key)
+
+                if not dropped:
+                    if not lazy and self.notify_decode is not None:
+                        self.notify_decode(key, value)
+
+                    yield key, value
+
+            end = self._match_item_delim(readbuf, offset)
+            if end is NO_MATCH:
+                end = self._match_end_delim(readbuf, offset)
+                if end is NO_MATCH:
                     lineno, char = readbuf.abspos(offset)
                     raise DecodeError(self, "Unexpected character on line %d, character %d (got '%s', expected '%s' or '%s')." % (
-                            lineno, char, readbuf.data[offset], self.item_delim, self.end_delim), readbuf.abspos(offset))
-                else:
-                    break
-        for key in self.required_args:
-            if key not in keys:
-                raise DecodeError(self, "Required key '%s' missing." % key, readbuf.abspos(offset))
-
-        results = self.dicttype(results)
-        return results, offset
+                            lineno, char, readbuf.peek(offset, 1), self.item_delim, self.end_delim), readbuf.abspos(offset))
+                return end
+            if stop is not None and readbuf.absoffset(end) - len(self.item_delim) >= stop:
+                return end
+            offset = end
+
+    def _trydecode(self, readbuf, offset=0, discardbufferdata=None):
+        result = ListCodec._trydecode(self, readbuf, offset, discardbufferdata=discardbufferdata)
+        if result is NO_MATCH:
+            return result
+        results, offset = result
+        return self.dicttype(results), offset
+
+    # Reinstated, since _trydecode is reimplemented (see BaseCodec.__init_subclass__).
+    _skip = ListCodec._skip
 
     def _encode_key(self, key, file=None, indent="    ", indentlevel=0, indentfirstline=True):
         return self.key_codec.encode(key, file, indent, indentlevel, indentfirstline)
@@ -161,50 +347,48 @@ class DictCodec(ListCodec):
         return codec.encode(obj, file, indent, indentlevel, indentfirstline=False)
 
     def _encode_multiline(self, obj, file, indent="    ", indentlevel=0):
+        # Each key's line break and indentation are written along with the preceding delimiter.
+        newline = "\n" + indent*(indentlevel + 1)
+        separator = self.item_delim + newline
+        key_separator = self.key_delim + " "
         if len(self.begin_delim):
             file.write(self.begin_delim)
         K = 0
         if self.requireclasskey:
-            file.write("\n")
-            self._encode_key("class", file, indent, indentlevel=indentlevel + 1, indentfirstline=True)
-            file.write(self.key_delim + " ")
+            file.write(newline)
+            self._encode_key("class", file, indent, indentlevel=indentlevel + 1, indentfirstline=False)
+            file.write(key_separator)
             typestring = "%s.%s" % (self.allowedtype.__module__, self.allowedtype.__name__)
             pystringcodec.encode(typestring, file, indent, indentlevel=indentlevel + 1, indentfirstline=False)
             K = 1
         for k, (key, value) in enumerate(obj.items(), K):
-            if k > 0:
-                file.write(self.item_delim + "\n")
-            else:
-                file.write("\n")
-            self._encode_key(key, file, indent, indentlevel=indentlevel + 1, indentfirstline=True)
-            file.write(self.key_delim + " ")
+            file.write(separator if k > 0 else newline)
+            self._encode_key(key, file, indent, indentlevel=indentlevel + 1, indentfirstline=False)
+            file.write(key_separator)
             self._encode_item(value, file=file, indent=indent, indentlevel=indentlevel+1, key=key)
         file.write("\n" + indent*indentlevel + self.end_delim)
 
     def _encode_singleline(self, obj, file, indent="    ", indentlevel=0):
+        if self.skip_whitespace_between_items:
+            separator = self.item_delim + " "
+            key_separator = self.key_delim + " "
+        else:
+            separator = self.item_delim
+            key_separator = self.key_delim
         if len(self.begin_delim):
             file.write(self.begin_delim)
         K = 0
         if self.requireclasskey:
             self._encode_key("class", file, indent, indentlevel=indentlevel + 1, indentfirstline=False)
-            if self.skip_whitespace_between_items:
-                file.write(self.key_delim + " ")
-            else:
-                file.write(self.key_delim)
+            file.write(key_separator)
             typestring = "%s.%s" % (self.allowedtype.__module__, self.allowedtype.__name__)
             pystringcodec.encode(typestring, file, indent, indentlevel=indentlevel + 1, indentfirstline=False)
             K = 1
         for k, (key, value) in enumerate(obj.items(), K):
             if k > 0:
-                if self.skip_whitespace_between_items:
-                    file.write(self.item_delim + " ")
-                else:
-                    file.write(self.item_delim)
+                file.write(separator)
             self._encode_key(key, file, indent, indentlevel=indentlevel + 1, indentfirstline=False)
-            if self.skip_whitespace_between_items:
-                file.write(self.key_delim + " ")
-            else:
-                file.write(self.key_delim)
+            file.write(key_separator)
             self._encode_item(value, file=file, indent=indent, indentlevel=indentlevel+1, key=key)
         file.write(self.end_delim)
 
@@ -228,37 +412,21 @@ class DictCodec(ListCodec):
                 raise EncodeError(self, obj, "Do not know how to work with 'getinitargs' object for '%s' object." % obj.__class__.__name__)
         elif isinstance(obj, dict):
             return self.dicttype(obj)
-        elif hasattr(obj, "__init__") and isinstance(obj.__init__, types.MethodType):
-            try:
-                argspec = inspect.getargspec(obj.__init__)
-            except:
-                raise EncodeError(self, obj,
-                        "Unable to determine initialization arguments for '%s' object. %s" %
-                        obj.__class__.__name__, suggestion)
-
-            if argspec.varargs is not None:
-                raise EncodeError(self, obj,
-                        "Cowardly refusing to unhook '%s' object containing 'varargs' in its initialization arguments. %s" %
-                        obj.__class__.__name__, suggestion)
-
-            if argspec.keywords is not None:
-                raise EncodeError(self, obj,
-                        "Cowardly refusing to unhook '%s' object containing 'keywords' in its initialization arguments. %s" %
-                        obj.__class__.__name__, suggestion)
-
-            if hasattr(obj, "getinitkwargs") and isinstance(obj.getinitkwargs, (list, tuple)):
-                args = obj.getinitkwargs
-            else:
-                args = argspec.args[1:]
 
-            if argspec.defaults is not None:
-                args_with_defaults = dict(zip(argspec.args[-len(argspec.defaults):], argspec.defaults))
-            else:
-                args_with_defaults = {}
-
-            pairs = [(arg, getattr(obj, arg)) for arg in args]
-            pairs = [(arg, value) for (arg, value) in pairs if arg not in args_with_defaults or value is not args_with_defaults.get(arg)]
-            return OrderedDict(pairs)
-        raise EncodeError(self, obj,
-                "Unable to determine initialization arguments for '%s' object. %s" %
-                obj.__class__.__name__, suggestion)
+        plan = initplan(type(obj))
+        if plan.error is not None:
+            raise EncodeError(self, obj, "%s %s" % (plan.error % obj.__class__.__name__, suggestion))
+
+        if hasattr(obj, "getinitkwargs"):
+            args = obj.getinitkwargs
+            values = [getattr(obj, arg) for arg in args]
+        else:
+            args = plan.args
+            values = plan.getargs(obj)
+            if plan.kwonly:
+                args += plan.kwonly
+                values += tuple(getattr(obj, arg) for arg in plan.kwonly)
+
+        defaults = plan.defaults
+        return OrderedDict((arg, value) for (arg, value) in zip(args, values)
+                           if arg not in defaults or value is not defaults[arg])
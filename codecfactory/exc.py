@@ -17,6 +17,12 @@ class UnexpectedEndOfData(DecodeError):
     def __init__(self, codec, message="Unexpected end of data."):
         super(UnexpectedEndOfData, self).__init__(codec, message)
 
+class BufferLimitExceeded(DecodeError):
+    """Raised by a ReadBuffer when holding more data would exceed the 'maxbuffer' limit of its ReadPolicy."""
+    def __init__(self, limit, offset=None):
+        self.limit = limit
+        super(BufferLimitExceeded, self).__init__(None, "Read buffer limit of %d exceeded." % limit, offset)
+
 class ExcessData(DecodeError):
     def __init__(self, codec, offset):
         super(ExcessData, self).__init__(codec, "Data continues past expected end.", offset)
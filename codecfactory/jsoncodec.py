@@ -6,9 +6,14 @@ from codecfactory.numeralcodecs import (uintcodec, intcodec, floatcodec, rationa
 from codecfactory.listcodec import ListCodec
 from codecfactory.dictcodec import DictCodec
 from codecfactory.regexcodec import RegExCodec
+from codecfactory.basecodec import NOHOOK
+from codecfactory.readbuffer import isbinaryfile
+from codecfactory.writebuffer import WriteBuffer
 import regex
+import json
+import math
 
-__all__ = ["jsoncodec"]
+__all__ = ["JSONCodecSet", "jsoncodec"]
 
 boolcodec = RegExCodec(regex.compile(r"(?:true|false)\b"),
                        hook={"true": True, "false": False}.__getitem__,
@@ -19,13 +24,234 @@ nonecodec = RegExCodec(regex.compile(r"null\b"),
                        unhook={None: "null"}.__getitem__,
                        allowedtype=type(None))
 
-jsoncodec = CodecSet([boolcodec, nonecodec, pystringcodec, realcodec])
+class _Fallback(ValueError):
+    pass
+
+def _parse_float(string):
+    # Floats without a decimal point (e.g., 1e5) are not matched by floatcodec.
+    if "." not in string:
+        raise _Fallback(string)
+    return float(string)
+
+def _parse_constant(string):
+    raise _Fallback(string)
+
+def _object_pairs_hook(pairs):
+    obj = dict(pairs)
+    # DictCodec rejects repeated keys, and decodes the value of a "class" key with pystringcodec.
+    if len(obj) < len(pairs) or type(obj.get("class", "")) is not str:
+        raise _Fallback(pairs)
+    return obj
+
+_jsondecoder = json.JSONDecoder(parse_float=_parse_float, parse_constant=_parse_constant,
+                                object_pairs_hook=_object_pairs_hook)
+
+# Input that the json module reads differently than the codecs do (or not at all): characters outside of
+# printable ASCII (which pystringcodec only accepts escaped), escaped slashes, and escaped surrogates
+# (which the json module combines into a single character).
+_unsafe_input = regex.compile(r"[^\x00-\x7e]|\\/|\\u[dD][89a-fA-F]")
+_unsafe_input_bytes = regex.compile(br"[^\x00-\x7e]|\\/|\\u[dD][89a-fA-F]")
+
+# Whitespace before a delimiter, which is not skipped if skip_whitespace_between_items is False.
+_ws_before_delim = regex.compile(r"[ \t\n\r][,:\]}]")
+_ws_before_delim_bytes = regex.compile(br"[ \t\n\r][,:\]}]")
+
+_ws = regex.compile(r"[ \t\n\r]*")
+
+# Output of the json module that pystringcodec would have escaped differently.
+_unsafe_output = regex.compile(r"\\u|\x7f")
+
+def _jsonsafe(obj, multiline):
+    """
+    Returns True if the json module encodes 'obj' the same way as jsoncodec (jsoncodecsl if multiline is
+    False) does, except possibly for the escaping of strings, which is checked on the output.
+    """
+    t = type(obj)
+    if t is str or t is int or t is bool or obj is None:
+        return True
+    elif t is float:
+        return math.isfinite(obj)
+    elif t is list or t is tuple:
+        items = obj
+    elif t is dict:
+        for key in obj:
+            if type(key) is not str:
+                return False
+        if type(obj.get("class", "")) is not str:
+            return False
+        items = obj.values()
+    else:
+        return False
+
+    # Empty lists and dicts are written as "[\n]" and "{\n}" by ListCodec and DictCodec.
+    if multiline and not len(obj):
+        return False
+
+    for item in items:
+        if not _jsonsafe(item, multiline):
+            return False
+    return True
+
+_terminals = (boolcodec, nonecodec, pystringcodec, realcodec, floatcodec, rationalcodec, intcodec)
+_stateattrs = ("hook", "hook_mode", "unhook", "allowedtype", "strip_whitespace", "discardbufferdata",
+               "regex", "hookmatch", "decode_string_match", "decode_string_match_bytes", "unescape_char_match",
+               "unescape_func", "escape_char_match", "escape_func", "escape_table", "begin_delim", "end_delim")
+
+def _state(codec):
+    state = (type(codec),) + tuple(getattr(codec, attr, None) for attr in _stateattrs)
+    if isinstance(codec, CodecSet):
+        state += tuple(codec.codecs)
+    return state
+
+class JSONCodecSet(CodecSet):
+    """
+    CodecSet used for jsoncodec and jsoncodecsl. As long as these codecs, and the codecs they are built
+    from, keep the configuration they are given below, decode, iterdecode (on strings and bytes) and
+    encode hand the data to the json module, and its C scanner and encoder, instead of the codec engine.
+
+    The grammar of these codecs is not quite JSON (e.g., rationals such as 3/4 and escape sequences such
+    as \\x41 are accepted, and floats are required to have a decimal point). Data is only handed to the
+    json module when both are known to give the same results, and otherwise is decoded or encoded by
+    the codec engine, with the same results and exceptions as for a CodecSet.
+    """
+    def _jsonbackend(self):
+        """
+        Returns (multiline, skip_whitespace_between_items) for the ListCodec and DictCodec children if
+        the json module can be used in place of self, or None.
+        """
+        if (type(self) is not JSONCodecSet or self.hook_mode != NOHOOK or self.unhook is not None
+                or not self.strip_whitespace or len(self.codecs) != 6):
+            return None
+
+        if tuple(self.codecs[:4]) != _terminals[:4] or [_state(codec) for codec in _terminals] != _terminalstate:
+            return None
+
+        listcodec, dictcodec = self.codecs[4:]
+        if type(listcodec) is not ListCodec or type(dictcodec) is not DictCodec:
+            return None
+
+        for codec in (listcodec, dictcodec):
+            if (codec.item_codec is not self or codec.hook_mode != NOHOOK
+                    or getattr(codec.unhook, "__func__", None) is not type(codec)._unhook
+                    or codec.notify_decode is not None or codec.notify_encode is not None):
+                return None
+
+        if (listcodec.begin_delim != "[" or listcodec.item_delim != "," or listcodec.end_delim != "]" or listcodec.codecs_by_index
+                or listcodec.allowedtype != (list, tuple)):
+            return None
+
+        if (dictcodec.begin_delim != "{" or dictcodec.item_delim != "," or dictcodec.key_delim != ":"
+                or dictcodec.end_delim != "}" or dictcodec.key_codec is not pystringcodec or dictcodec.codecs_by_key
+                or dictcodec.required_args or not dictcodec.allow_unknown or dictcodec.requireclasskey
+                or dictcodec.dicttype is not dict or dictcodec.allowedtype is not None or dictcodec.keep is not None):
+            return None
+
+        multiline = listcodec.multiline and listcodec.skip_whitespace_between_items
+        if (multiline != (dictcodec.multiline and dictcodec.skip_whitespace_between_items)
+                or listcodec.skip_whitespace_between_items != dictcodec.skip_whitespace_between_items):
+            return None
+
+        return multiline, listcodec.skip_whitespace_between_items
+
+    def _jsoninput(self, data, skip_whitespace_between_items):
+        """Returns data as a str if the json module reads it the same way as self, or None."""
+        if isinstance(data, bytes):
+            if _unsafe_input_bytes.search(data) or (not skip_whitespace_between_items and
+                                                    _ws_before_delim_bytes.search(data)):
+                return None
+            return data.decode("ascii")
+
+        if _unsafe_input.search(data) or (not skip_whitespace_between_items and _ws_before_delim.search(data)):
+            return None
+        return data
+
+    def decode(self, data):
+        backend = self._jsonbackend() if isinstance(data, (str, bytes)) else None
+        if backend is not None:
+            text = self._jsoninput(data, backend[1])
+            if text is not None:
+                try:
+                    return _jsondecoder.decode(text)
+                except (ValueError, RecursionError):
+                    pass
+
+        return CodecSet.decode(self, data)
+
+    def iterdecode(self, data, spans=False):
+        backend = self._jsonbackend() if isinstance(data, (str, bytes)) else None
+        text = self._jsoninput(data, backend[1]) if backend is not None else None
+        if text is None:
+            for item in CodecSet.iterdecode(self, data, spans):
+                yield item
+            return
+
+        offset = 0
+        while True:
+            offset = _ws.match(text, offset).end()
+            if offset == len(text):
+                return
+
+            try:
+                obj, end = _jsondecoder.raw_decode(text, offset)
+            except (ValueError, RecursionError):
+                break
+
+            # A number, true, false or null must not run into the next object (e.g., the json module
+            # reads "1/2" as 1 followed by "/2").
+            if text[end - 1] not in "\"]}" and end < len(text) and text[end] not in " \t\n\r":
+                break
+
+            if spans:
+                yield obj, (offset, end)
+            else:
+                yield obj
+
+            offset = end
+
+        # Continue from the object that could not be decoded by the json module.
+        readbuf = self._readbuffer(data)
+        readbuf.discard(offset)
+        for item in CodecSet.iterdecode(self, readbuf, spans):
+            yield item
+
+    def encode(self, obj, file=None, indent="    ", indentlevel=0, indentfirstline=True):
+        backend = self._jsonbackend() if type(obj) in (list, tuple, dict) and indentlevel == 0 else None
+        if backend is not None:
+            multiline, skip_whitespace_between_items = backend
+            try:
+                if not _jsonsafe(obj, multiline):
+                    raise _Fallback(obj)
+
+                if multiline:
+                    string = json.dumps(obj, indent=indent, separators=(",", ": "), check_circular=False)
+                elif skip_whitespace_between_items:
+                    string = json.dumps(obj, separators=(", ", ": "), check_circular=False)
+                else:
+                    string = json.dumps(obj, separators=(",", ":"), check_circular=False)
+
+                if _unsafe_output.search(string):
+                    raise _Fallback(obj)
+            except (ValueError, RecursionError):
+                pass
+            else:
+                if file is None:
+                    return string
+                if isinstance(file, bytearray) or isbinaryfile(file):
+                    file = WriteBuffer(file)
+                file.write(string)
+                return None
+
+        return CodecSet.encode(self, obj, file, indent, indentlevel, indentfirstline)
+
+_terminalstate = [_state(codec) for codec in _terminals]
+
+jsoncodec = JSONCodecSet([boolcodec, nonecodec, pystringcodec, realcodec])
 listcodec = ListCodec(jsoncodec)
 dictcodec = DictCodec(pystringcodec, jsoncodec)
 jsoncodec.appendCodec(listcodec)
 jsoncodec.appendCodec(dictcodec)
 
-jsoncodecsl = CodecSet([boolcodec, nonecodec, pystringcodec, realcodec])
+jsoncodecsl = JSONCodecSet([boolcodec, nonecodec, pystringcodec, realcodec])
 listcodecsl = ListCodec(jsoncodecsl, multiline=False, skip_whitespace_between_items=False)
 dictcodecsl = DictCodec(pystringcodec, jsoncodecsl, multiline=False, skip_whitespace_between_items=False)
 jsoncodecsl.appendCodec(listcodecsl)
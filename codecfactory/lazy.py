@@ -0,0 +1,248 @@
+#!/usr/bin/python
+from codecfactory.basecodec import skip_whitespace, NO_MATCH
+from codecfactory.exc import NoMatch, ExcessData
+from codecfactory.readbuffer import _sharedreadbuffer, _opendata
+from codecfactory.codecset import CodecSet
+from codecfactory.listcodec import ListCodec
+from codecfactory.dictcodec import DictCodec
+from codecfactory.stringcodec import pystringcodec
+from codecfactory.compiler import CompiledCodec
+import array
+import collections.abc
+
+__all__ = ["LazyList", "LazyDict", "lazydecode"]
+
+def _container(codec, readbuf, offset):
+    """
+    Returns the ListCodec or DictCodec (not a subclass) that decodes the data at offset when decoding with
+    codec: codec itself, the codec wrapped by a CompiledCodec, or the child of a CodecSet that would be tried
+    first, provided that its begin_delim matches. Returns None otherwise.
+    """
+    while True:
+        if isinstance(codec, CompiledCodec):
+            codec = codec.codec
+        elif isinstance(codec, CodecSet):
+            if codec._dispatch_generation != codec._generation:
+                codec._makedispatch()
+            codecs = codec._dispatch.get(readbuf.charat(offset), codec.codecs)
+            if not codecs:
+                return None
+            codec = codecs[0]
+        elif type(codec) in (ListCodec, DictCodec):
+            if len(codec.begin_delim) and readbuf.string_match(codec.begin_delim, offset):
+                return codec
+            return None
+        else:
+            return None
+
+def _skim(codec, data, readbuf, offset):
+    """
+    Skims over the ListCodec or DictCodec at offset in readbuf (a ReadBuffer over data), and returns its proxy
+    (a LazyList or LazyDict) and the offset of its end, or NO_MATCH.
+    """
+    if codec.strip_whitespace:
+        offset = skip_whitespace(readbuf, offset, False)
+
+    items = codec._decode_items(readbuf, offset, discardbufferdata=False, lazy=True)
+    keys = []
+    starts = array.array("q")
+    ends = array.array("q")
+    isdict = isinstance(codec, DictCodec)
+    while True:
+        try:
+            item = next(items)
+        except StopIteration as stop:
+            offset = stop.value
+            break
+        if isdict:
+            key, item = item
+            keys.append(key)
+        starts.append(item[0])
+        ends.append(item[1])
+
+    if offset is NO_MATCH:
+        return NO_MATCH
+
+    if isdict:
+        return LazyDict(codec, data, readbuf.index, starts, ends, keys), offset
+    return LazyList(codec, data, readbuf.index, starts, ends), offset
+
+class _LazyContainer(object):
+    def __init__(self, codec, data, index, starts, ends):
+        """
+        'codec': The ListCodec or DictCodec the container was skimmed with.
+        'data': The entire input (a str, bytes or mmap object), which is referenced, not copied.
+        'index': A StructIndex of data, or None.
+        'starts', 'ends': Arrays of the absolute offsets of the items in data.
+        """
+        self.codec = codec
+        self._data = data
+        self._index = index
+        self._starts = starts
+        self._ends = ends
+        self._items = {}
+
+    def _readbuffer(self, k):
+        readbuf = _sharedreadbuffer(self._data, self._index)
+        readbuf.discard(self._starts[k])
+        return readbuf
+
+    def _decodeitem(self, codec, k):
+        try:
+            return self._items[k]
+        except KeyError:
+            pass
+        result = codec._trydecodeone(self._readbuffer(k), 0, discardbufferdata=False)
+        if result is NO_MATCH:
+            raise NoMatch(codec)
+        item = self._items[k] = result[0]
+        return item
+
+    def _lazyitem(self, codec, k):
+        readbuf = self._readbuffer(k)
+        container = _container(codec, readbuf, 0)
+        if container is None:
+            return self._decodeitem(codec, k)
+        result = _skim(container, self._data, readbuf, 0)
+        if result is NO_MATCH:
+            raise NoMatch(container)
+        return result[0]
+
+    @property
+    def decoded(self):
+        """Number of items that have been decoded so far."""
+        return len(self._items)
+
+class LazyList(_LazyContainer, collections.abc.Sequence):
+    """
+    Read-only list returned by lazydecode, which holds the span of each item in the input, and decodes (and
+    caches) an item with its codec (item_codec, or its entry in codecs_by_index) the first time it is accessed.
+    The hook of the ListCodec itself is only applied by materialize.
+    """
+    def __len__(self):
+        return len(self._starts)
+
+    def _position(self, k):
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError("LazyList index out of range")
+        return k
+
+    def _codec(self, k):
+        return self.codec.codecs_by_index.get(k, self.codec.item_codec)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self[j] for j in range(*k.indices(len(self)))]
+        k = self._position(k)
+        return self._decodeitem(self._codec(k), k)
+
+    def lazy(self, k):
+        """
+        Returns item k as a LazyList or LazyDict if it is decoded by a ListCodec or DictCodec (see lazydecode),
+        or as self[k] otherwise. Proxies are not cached.
+        """
+        k = self._position(k)
+        return self._lazyitem(self._codec(k), k)
+
+    def span(self, k):
+        """Returns the absolute offsets (start, end) of item k in the input."""
+        k = self._position(k)
+        return (self._starts[k], self._ends[k])
+
+    def materialize(self):
+        """Decodes all items, and returns the list as decoding with the ListCodec would (hook included)."""
+        return self.codec.applyhook([self[k] for k in range(len(self))])
+
+    def __repr__(self):
+        return "<%s of %d items (%d decoded)>" % (self.__class__.__name__, len(self), self.decoded)
+
+class LazyDict(_LazyContainer, collections.abc.Mapping):
+    """
+    Read-only dict returned by lazydecode. Keys are decoded up front, and each value is decoded (and cached)
+    with its codec (item_codec, or its entry in codecs_by_key) the first time it is accessed. The hook of the
+    DictCodec itself is only applied by materialize.
+    """
+    def __init__(self, codec, data, index, starts, ends, keys):
+        _LazyContainer.__init__(self, codec, data, index, starts, ends)
+        self._keys = dict((key, k) for (k, key) in enumerate(keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def _codec(self, key):
+        if key == "class":
+            return pystringcodec
+        return self.codec.codecs_by_key.get(key, self.codec.item_codec)
+
+    def __getitem__(self, key):
+        return self._decodeitem(self._codec(key), self._keys[key])
+
+    def lazy(self, key):
+        """
+        Returns the value of key as a LazyList or LazyDict if it is decoded by a ListCodec or DictCodec (see
+        lazydecode), or as self[key] otherwise. Proxies are not cached.
+        """
+        return self._lazyitem(self._codec(key), self._keys[key])
+
+    def span(self, key):
+        """Returns the absolute offsets (start, end) of the value of key in the input."""
+        k = self._keys[key]
+        return (self._starts[k], self._ends[k])
+
+    def materialize(self):
+        """Decodes all values, and returns the dict as decoding with the DictCodec would (hook included)."""
+        return self.codec.applyhook(self.codec.dicttype((key, self[key]) for key in self._keys))
+
+    def __repr__(self):
+        return "<%s of %d items (%d decoded)>" % (self.__class__.__name__, len(self), self.decoded)
+
+def lazydecode(codec, source, index=None):
+    """
+    Same as codec.decode(source), but if the top-level object is decoded by a ListCodec or DictCodec (codec
+    itself, or a child of a CodecSet such as jsoncodec), its structure is validated by skimming over its items
+    without decoding them, and a LazyList or LazyDict that decodes each item on first access is returned.
+
+    Skimming checks the delimiters of every nested list and dict, and the keys of dicts (including required_args
+    and requireclasskey), but builds no containers and applies no hooks: nested containers are only skimmed,
+    and other values are decoded and dropped. Use the lazy method of a proxy to access a nested container as a
+    proxy of its own.
+
+    'source' may be a str, a bytes-like object, an mmap object, a path (os.PathLike), or a file object; binary
+    files are memory-mapped (and decoded in binary mode), and the memory map is kept open for as long as the
+    proxies are. Other file objects are read into memory.
+
+    'index': A StructIndex of the input, which is then used to look up line numbers (see ReadBuffer).
+    """
+    data, owned = _opendata(source)
+    if data is None:
+        if not hasattr(source, "read"):
+            raise TypeError("Cannot decode '%s' object lazily." % type(source).__name__)
+        data = source.read()
+
+    readbuf = _sharedreadbuffer(data, index)
+    offset = 0
+    if codec.strip_whitespace:
+        offset = skip_whitespace(readbuf, offset, False)
+
+    container = _container(codec, readbuf, offset)
+    if container is None:
+        return codec.decode(readbuf)
+
+    result = _skim(container, data, readbuf, offset)
+    if result is NO_MATCH:
+        raise NoMatch(codec)
+    obj, offset = result
+
+    if codec.strip_whitespace:
+        offset = skip_whitespace(readbuf, offset, False)
+    if not readbuf.atend(offset):
+        raise ExcessData(codec, readbuf.absoffset(offset))
+    return obj
@@ -1,11 +1,95 @@
-from codecfactory.basecodec import (BaseCodec, ReadBuffer, skip_whitespace,
+from codecfactory.basecodec import (BaseCodec, ReadBuffer, skip_whitespace, NO_MATCH,
                                     NOHOOK, SINGLE, ARGS, KWARGS)
 from codecfactory.exc import (DecodeError, NoMatch, UnexpectedEndOfData, ExcessData,
                  EncodeError, EncodeMatchError)
 import inspect
+import operator
 import types
 from collections import OrderedDict
 
+__all__ = ["ListCodec", "initplan", "resetinitplans"]
+
+class InitPlan(object):
+    def __init__(self, cls):
+        """
+        The arguments of cls.__init__, as used by ListCodec._unhook and DictCodec._unhook to recover
+        the initialization arguments of an instance of cls from its attributes.
+
+        'args': Names of the positional arguments (excluding self).
+        'posonly': Names of the positional-only arguments (a prefix of args).
+        'kwonly': Names of the keyword-only arguments.
+        'defaults': Dict mapping arguments with default values to their default values.
+        'getargs': Function returning the values of the attributes named in args, as a tuple.
+        'error': If the arguments cannot be recovered this way, a message saying why (with a '%s' for
+            the name of the class), otherwise None.
+        """
+        self.init = cls.__init__
+        self.args = ()
+        self.posonly = ()
+        self.kwonly = ()
+        self.defaults = {}
+        self.getargs = None
+        self.error = None
+
+        if not isinstance(self.init, types.FunctionType):
+            self.error = "Unable to determine initialization arguments for '%s' object."
+            return
+
+        try:
+            parameters = list(inspect.signature(self.init).parameters.values())[1:]
+        except (TypeError, ValueError):
+            self.error = "Unable to determine initialization arguments for '%s' object."
+            return
+
+        kinds = set(parameter.kind for parameter in parameters)
+        if inspect.Parameter.VAR_POSITIONAL in kinds:
+            self.error = "Cowardly refusing to unhook '%s' object containing 'varargs' in its initialization arguments."
+            return
+        if inspect.Parameter.VAR_KEYWORD in kinds:
+            self.error = "Cowardly refusing to unhook '%s' object containing 'keywords' in its initialization arguments."
+            return
+
+        self.args = tuple(parameter.name for parameter in parameters if parameter.kind in
+                          (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD))
+        self.posonly = tuple(parameter.name for parameter in parameters if parameter.kind == inspect.Parameter.POSITIONAL_ONLY)
+        self.kwonly = tuple(parameter.name for parameter in parameters if parameter.kind == inspect.Parameter.KEYWORD_ONLY)
+        self.defaults = dict((parameter.name, parameter.default) for parameter in parameters
+                             if parameter.default is not inspect.Parameter.empty)
+
+        if len(self.args) == 0:
+            self.getargs = lambda obj: ()
+        elif len(self.args) == 1:
+            getarg = operator.attrgetter(self.args[0])
+            self.getargs = lambda obj: (getarg(obj),)
+        else:
+            self.getargs = operator.attrgetter(*self.args)
+
+_initplans = OrderedDict()
+initplans_maxsize = 1024
+
+def initplan(cls):
+    """
+    Returns the InitPlan for cls. Plans are cached per class (up to initplans_maxsize of them, dropping
+    the oldest first), and recomputed if cls.__init__ has been replaced since.
+    """
+    try:
+        plan = _initplans[cls]
+    except KeyError:
+        pass
+    else:
+        if plan.init is cls.__init__:
+            return plan
+
+    plan = InitPlan(cls)
+    _initplans[cls] = plan
+    while len(_initplans) > initplans_maxsize:
+        _initplans.popitem(last=False)
+    return plan
+
+def resetinitplans():
+    """Discards all cached InitPlans."""
+    _initplans.clear()
+
 class ListCodec(BaseCodec):
     def __init__(self,
                  item_codec, codecs_by_index={},
@@ -61,20 +145,28 @@ class ListCodec(BaseCodec):
                            allowedtype=allowedtype, discardbufferdata=discardbufferdata,
                            name=name)
 
+    def _firstchars(self):
+        if len(self.begin_delim):
+            return frozenset(self.begin_delim[0])
+        return None
+
+    def _children(self):
+        return (self.item_codec,) + tuple(self.codecs_by_index.values())
+
     def _match_delim(self, readbuf, delim, offset=0):
         if self.skip_whitespace_between_items:
             offset = skip_whitespace(readbuf, offset, False)
 
-        while offset + len(delim) > len(readbuf.data) and not readbuf._file.closed:
+        while offset + len(delim) > len(readbuf) and not readbuf.closed:
             readbuf.readdata()
 
-        #if offset >= len(readbuf.data):
+        #if offset >= len(readbuf):
             #raise UnexpectedEndOfData(self, "Unexpected end of string while decoding list.")
 
         if readbuf.string_match(delim, offset):
             return offset + len(delim)
 
-        raise NoMatch(self)
+        return NO_MATCH
 
     def _match_begin_delim(self, readbuf, offset=0):
         offset = self._match_delim(readbuf, self.begin_delim, offset)
@@ -90,77 +182,166 @@ class ListCodec(BaseCodec):
 
     def _decode_item(self, readbuf, offset=0, k=None, discardbufferdata=None):
         codec = self.codecs_by_index.get(k, self.item_codec)
-        return codec.decodeone(readbuf, offset, discardbufferdata=discardbufferdata)
+        return codec._trydecodeone(readbuf, offset, discardbufferdata=discardbufferdata)
+
+    def _skip_item(self, readbuf, offset=0, k=None):
+        """
+        Same as _decode_item, but skims over the item (see BaseCodec._tryskip), returning the pair ((start, end),
+        offset), where start and end are the absolute offsets of the item without its leading whitespace.
+        """
+        codec = self.codecs_by_index.get(k, self.item_codec)
+        if codec.strip_whitespace:
+            offset = skip_whitespace(readbuf, offset, False)
+        start = readbuf.absoffset(offset)
+        end = codec._tryskip(readbuf, offset)
+        if end is NO_MATCH:
+            return end
+        return (start, readbuf.absoffset(end)), end
 
-    def _decode(self, readbuf, offset=0, discardbufferdata=None):
+    def _decode_items(self, readbuf, offset=0, discardbufferdata=None, lazy=False):
+        """
+        Generator that decodes the list one item at a time, yielding each item as it is decoded. The
+        offset of the end of the list is returned (i.e., as StopIteration.value) once end_delim is
+        matched, or NO_MATCH if begin_delim is not matched.
+
+        'lazy': If True, items are skimmed over instead of being decoded (see _skip_item), and the absolute
+            offsets (start, end) of each item are yielded in its place. notify_decode is not called.
+        """
         offset = self._match_begin_delim(readbuf, offset)
+        if offset is NO_MATCH:
+            return NO_MATCH
 
-        results = []
-        k = 0
+        return (yield from self._decode_from(readbuf, offset, discardbufferdata, lazy=lazy))
+
+    def _decode_from(self, readbuf, offset, discardbufferdata=None, stop=None, k=0, lazy=False):
+        """
+        Same as _decode_items, but starts at offset, just past begin_delim or an item_delim, with item k.
+
+        'stop': If not None, an absolute offset at which an item_delim is expected. The offset past the
+            first item_delim that starts at or after stop is returned instead of continuing past it.
+        """
         while True:
             if len(self.end_delim):
                 """If list is empty, we expect to find end_delim next."""
-                try:
-                    offset = self._match_end_delim(readbuf, offset)
-                except NoMatch:
-                    pass
-                else:
-                    return results, offset
+                end = self._match_end_delim(readbuf, offset)
+                if end is not NO_MATCH:
+                    return end
 
             if self.skip_whitespace_between_items:
                 offset = skip_whitespace(readbuf, offset)
 
-            try:
-                item, offset = self._decode_item(readbuf, offset, k, discardbufferdata=discardbufferdata)
-            except NoMatch:
+            if lazy:
+                result = self._skip_item(readbuf, offset, k)
+            else:
+                result = self._decode_item(readbuf, offset, k, discardbufferdata=discardbufferdata)
+            if result is NO_MATCH:
                 lineno, char = readbuf.abspos(offset)
                 raise DecodeError(self, "Unexpected character or item on line %d, character %d ('%s')." % (
-                    lineno, char, readbuf.data[offset:offset+16]), readbuf.absoffset(offset))
+                    lineno, char, readbuf.peek(offset, 16)), readbuf.absoffset(offset))
 
-            results.append(item)
+            item, offset = result
             k += 1
 
-            if callable(self.notify_decode):
+            if not lazy and callable(self.notify_decode):
                 self.notify_decode(item)
 
-            try:
-                offset = self._match_item_delim(readbuf, offset)
-            except NoMatch:
-                try:
-                    offset = self._match_end_delim(readbuf, offset)
-                except NoMatch:
-                    if offset < len(readbuf.data):
+            yield item
+
+            end = self._match_item_delim(readbuf, offset)
+            if end is NO_MATCH:
+                end = self._match_end_delim(readbuf, offset)
+                if end is NO_MATCH:
+                    if offset < len(readbuf):
                         lineno, char = readbuf.abspos(offset)
                         raise DecodeError(self, "Unexpected character on line %d, character %d ('%s')." % (
-                            lineno, char, readbuf.data[offset:offset+16]), offset)
+                            lineno, char, readbuf.peek(offset, 16)), offset)
                     raise UnexpectedEndOfData(self, "Unexpected end of string while decoding list.")
-                return results, offset
+                return end
+            if stop is not None and readbuf.absoffset(end) - len(self.item_delim) >= stop:
+                return end
+            offset = end
+
+    def _trydecode(self, readbuf, offset=0, discardbufferdata=None):
+        items = self._decode_items(readbuf, offset, discardbufferdata=discardbufferdata)
+        results = []
+        while True:
+            try:
+                results.append(next(items))
+            except StopIteration as stop:
+                if stop.value is NO_MATCH:
+                    return NO_MATCH
+                return results, stop.value
+
+    def _skip(self, readbuf, offset=0):
+        items = self._decode_items(readbuf, offset, discardbufferdata=False, lazy=True)
+        while True:
+            try:
+                next(items)
+            except StopIteration as stop:
+                return stop.value
+
+    def iterdecodeitems(self, data):
+        """
+        Generator that decodes a single list from data, yielding each item as soon as it has been decoded
+        rather than building the whole list, so that only one item needs to be kept in memory at a time.
+        Delimiters are validated as decoding proceeds, and an exception is raised (after the items
+        preceding the error have been yielded) if the data is malformed or followed by excess data.
+
+        Items are yielded in the form returned by the container's _decode_items generator (i.e., (key,
+        value) pairs for DictCodec). The container's own hook is not applied, but item hooks and
+        notify_decode are.
+
+        'data' is accepted in the same forms as for self.decode.
+        """
+        readbuf = self._readbuffer(data)
+        offset = 0
+        if self.strip_whitespace:
+            offset = skip_whitespace(readbuf, offset, self.discardbufferdata)
+
+        items = self._decode_items(readbuf, offset, discardbufferdata=self.discardbufferdata)
+        while True:
+            try:
+                item = next(items)
+            except StopIteration as stop:
+                offset = stop.value
+                break
+            yield item
+
+        if offset is NO_MATCH:
+            raise NoMatch(self)
+
+        if self.strip_whitespace:
+            offset = skip_whitespace(readbuf, offset, self.discardbufferdata)
+
+        if not readbuf.atend(offset):
+            raise ExcessData(self, readbuf.absoffset(offset))
 
     def _encode_item(self, obj, file=None, indent="    ", indentlevel=0, indentfirstline=True, k=None):
         codec = self.codecs_by_index.get(k, self.item_codec)
         return codec.encode(obj, file, indent, indentlevel, indentfirstline)
 
     def _encode_multiline(self, obj, file, indent="    ", indentlevel=0):
+        # Each item's line break and indentation are written along with the preceding delimiter.
+        newline = "\n" + indent*(indentlevel + 1)
+        separator = self.item_delim + newline
         if len(self.begin_delim):
             file.write(self.begin_delim)
         for k, item in enumerate(obj):
-            if k > 0:
-                file.write(self.item_delim + "\n")
-            else:
-                file.write("\n")
+            file.write(separator if k > 0 else newline)
             self._encode_item(item, file=file, indent=indent, indentlevel=indentlevel+1,
-                                                 indentfirstline=True, k=k)
+                                                 indentfirstline=False, k=k)
         file.write("\n" + indent*indentlevel + self.end_delim)
 
     def _encode_singleline(self, obj, file, indent="    ", indentlevel=0):
+        if self.skip_whitespace_between_items:
+            separator = self.item_delim + " "
+        else:
+            separator = self.item_delim
         if len(self.begin_delim):
             file.write(self.begin_delim)
         for k, item in enumerate(obj):
             if k > 0:
-                if self.skip_whitespace_between_items:
-                    file.write(self.item_delim + " ")
-                else:
-                    file.write(self.item_delim)
+                file.write(separator)
             self._encode_item(item, file=file, indent=indent, indentlevel=indentlevel+1,
                                                  indentfirstline=False, k=k)
         if len(self.end_delim):
@@ -189,22 +370,12 @@ class ListCodec(BaseCodec):
                 raise EncodeError(self, obj, "Do not know how to work with 'getinitargs' object for '%s' object." % obj.__class__.__name__)
         elif isinstance(obj, (list, tuple)):
             return list(obj)
-        elif hasattr(obj, "__init__") and isinstance(obj.__init__, types.MethodType):
-            try:
-                argspec = inspect.getargspec(obj.__init__)
-            except:
-                raise EncodeError(self, obj,
-                        "Unable to determine initialization arguments for '%s' object. %s" %
-                        obj.__class__.__name__, suggestion)
-            if argspec.varargs is not None:
-                raise EncodeError(self, obj,
-                        "Cowardly refusing to unhook '%s' object containing 'varargs' in its initialization arguments. %s" %
-                        obj.__class__.__name__, suggestion)
-            if argspec.keywords is not None:
-                raise EncodeError(self, obj,
-                        "Cowardly refusing to unhook '%s' object containing 'keywords' in its initialization arguments. %s" %
-                        obj.__class__.__name__, suggestion)
-            return [getattr(obj, attr) for attr in argspec.args[1:]]
-        raise EncodeError(self, obj,
-                "Unable to determine initialization arguments for '%s' object. %s" %
-                obj.__class__.__name__, suggestion)
+
+        plan = initplan(type(obj))
+        if plan.error is not None:
+            raise EncodeError(self, obj, "%s %s" % (plan.error % obj.__class__.__name__, suggestion))
+        if plan.kwonly:
+            raise EncodeError(self, obj,
+                    "Cowardly refusing to unhook '%s' object containing keyword-only initialization arguments. %s" %
+                    (obj.__class__.__name__, suggestion))
+        return list(plan.getargs(obj))
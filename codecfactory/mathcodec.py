@@ -1,5 +1,5 @@
 #!/usr/bin/python
-from codecfactory.basecodec import (BaseCodec, ReadBuffer, skip_whitespace,
+from codecfactory.basecodec import (BaseCodec, ReadBuffer, skip_whitespace, NO_MATCH,
                                     NOHOOK, SINGLE, ARGS, KWARGS)
 from codecfactory.exc import DecodeError, NoMatch, UnexpectedEndOfData, ExcessData, EncodeError, EncodeMatchError
 from codecfactory.stringcodec import pystringcodec
@@ -31,33 +31,36 @@ class VarArgOpDecoder(BaseCodec):
 
         BaseCodec.__init__(self, hook=hook, name=name)
 
-    def _decode(self, readbuf, offset=0, discardbufferdata=None):
+    def _trydecode(self, readbuf, offset=0, discardbufferdata=None):
         results = []
-        item, offset = self.operand_decoder.decodeone(readbuf, offset, discardbufferdata)
+        result = self.operand_decoder._trydecodeone(readbuf, offset, discardbufferdata)
+        if result is NO_MATCH:
+            return NO_MATCH
+        item, offset = result
         results.append(item)
         while True:
             offset = skip_whitespace(readbuf, offset, False)
             if readbuf.string_match(self.operator, offset):
-                try:
-                    item, offset = self.operand_decoder.decodeone(readbuf, offset+len(self.operator), discardbufferdata)
-                except NoMatch:
-                    if offset < len(readbuf.data):
+                result = self.operand_decoder._trydecodeone(readbuf, offset+len(self.operator), discardbufferdata)
+                if result is NO_MATCH:
+                    if offset < len(readbuf):
                         lineno, char = readbuf.abspos(offset)
                         raise DecodeError(self,
                                 "Unexpected character while trying to decode operand on line %d, character %d (expecting an operand, got '%s')." % (
-                                lineno, char, readbuf.data[offset:offset+16]), readbuf.absoffset(offset))
+                                lineno, char, readbuf.peek(offset, 16)), readbuf.absoffset(offset))
                     raise UnexpectedEndOfData(self, "Unexpected end of data (expecting an operand).")
+                item, offset = result
                 results.append(item)
             elif self.invoperator is not None and readbuf.string_match(self.invoperator, offset):
-                try:
-                    item, offset = self.operand_decoder.decodeone(readbuf, offset+len(self.invoperator), discardbufferdata)
-                except NoMatch:
-                    if offset < len(readbuf.data):
+                result = self.operand_decoder._trydecodeone(readbuf, offset+len(self.invoperator), discardbufferdata)
+                if result is NO_MATCH:
+                    if offset < len(readbuf):
                         lineno, char = readbuf.abspos(offset)
                         raise DecodeError(self,
                                 "Unexpected character while trying to decode operand on line %d, character %d (expecting an operand, got '%s')." % (
-                                lineno, char, readbuf.data[offset:offset+16]), readbuf.absoffset(offset))
+                                lineno, char, readbuf.peek(offset, 16)), readbuf.absoffset(offset))
                     raise UnexpectedEndOfData(self, "Unexpected end of data (expecting an operand).")
+                item, offset = result
                 results.append(self.invhook(item))
             else:
                 return results, offset
@@ -77,19 +80,19 @@ class UnaryOpDecoder(BaseCodec):
         self.vararg = vararg
         self.name = name
 
-    def _decode(self, readbuf, offset=0, discardbufferdata=None):
+    def _trydecode(self, readbuf, offset=0, discardbufferdata=None):
         offset = skip_whitespace(readbuf, offset, False)
         if readbuf.string_match(self.operator, offset):
-            try:
-                return self.operand_decoder.decodeone(readbuf, offset+len(self.operator), discardbufferdata)
-            except NoMatch:
-                if offset < len(readbuf.data):
+            result = self.operand_decoder._trydecodeone(readbuf, offset+len(self.operator), discardbufferdata)
+            if result is NO_MATCH:
+                if offset < len(readbuf):
                     lineno, char = readbuf.abspos(offset)
                     raise DecodeError(self,
                             "Unexpected character while trying to decode operand on line %d, character %d ('%s')." % (
-                            lineno, char, readbuf.data[offset:offset+16]))
+                            lineno, char, readbuf.peek(offset, 16)))
                 raise UnexpectedEndOfData(self)
-        raise NoMatch(self)
+            return result
+        return NO_MATCH
 
 
 class RelationDecoder(BaseCodec):
@@ -102,20 +105,23 @@ class RelationDecoder(BaseCodec):
 
         BaseCodec.__init__(self, name=name)
 
-    def _decode(self, readbuf, offset=0, discardbufferdata=None):
-        lhs, offset = self.operand_decoder.decodeone(readbuf, offset)
+    def _trydecode(self, readbuf, offset=0, discardbufferdata=None):
+        result = self.operand_decoder._trydecodeone(readbuf, offset)
+        if result is NO_MATCH:
+            return NO_MATCH
+        lhs, offset = result
         offset = skip_whitespace(readbuf, offset, False)
         for rel in sorted(self.relations.keys(), key=len, reverse=True):
             if readbuf.string_match(rel, offset):
-                try:
-                    rhs, offset = self.operand_decoder.decodeone(readbuf, offset+len(rel))
-                except NoMatch:
-                    if offset < len(readbuf.data):
+                result = self.operand_decoder._trydecodeone(readbuf, offset+len(rel))
+                if result is NO_MATCH:
+                    if offset < len(readbuf):
                         lineno, char = readbuf.abspos(offset)
                         raise DecodeError(self,
                                 "Unexpected character while trying to decode operand on line %d, character %d ('%s')." % (
-                                lineno, char, readbuf.data[offset:offset+16]))
+                                lineno, char, readbuf.peek(offset, 16)))
                     raise UnexpectedEndOfData(self)
+                rhs, offset = result
                 return [lhs, rel, rhs], offset
         else:
             return [lhs], offset
@@ -172,13 +178,16 @@ class FunctionCallDecoder(BaseCodec):
         BaseCodec.__init__(self, name=name)
 
 
-    def _decode(self, readbuf, offset=0, discardbufferdata=None):
+    def _trydecode(self, readbuf, offset=0, discardbufferdata=None):
         offset = skip_whitespace(readbuf, offset, False)
-        name, offset = self.name_decoder.decodeone(readbuf, offset)
-        try:
-            args, offset = self.args_decoder.decodeone(readbuf, offset)
-        except NoMatch:
+        result = self.name_decoder._trydecodeone(readbuf, offset)
+        if result is NO_MATCH:
+            return NO_MATCH
+        name, offset = result
+        result = self.args_decoder._trydecodeone(readbuf, offset)
+        if result is NO_MATCH:
             return [name], offset
+        args, offset = result
         return [name, args], offset
 
     def _hook(self, f, x=None):
@@ -0,0 +1,259 @@
+#!/usr/bin/python
+from codecfactory.basecodec import skip_whitespace, NO_MATCH
+from codecfactory.exc import DecodeError, ExcessData
+from codecfactory.readbuffer import bytespattern, _sharedreadbuffer, _opendata
+from codecfactory.listcodec import ListCodec
+from codecfactory.dictcodec import DictCodec
+from codecfactory.structindex import delimiters
+import multiprocessing
+from multiprocessing.pool import MaybeEncodingError
+import os
+import regex
+
+__all__ = ["paralleldecode"]
+
+def _scanner(codec, binary):
+    """
+    Returns a regular expression that matches a run of complete items (or entries) of the ListCodec (or
+    DictCodec) 'codec', each followed by its item_delim, by tracking the nesting of the delimiters of the
+    containers and strings that may occur in them. Returns None if these are not all single characters.
+    """
+    found = delimiters(codec)
+    if found is None:
+        return None
+    brackets, quotes, separators = found
+
+    specials = set()
+    for begin_delim, end_delim in brackets | quotes:
+        if len(begin_delim) != 1 or len(end_delim) != 1:
+            return None
+        specials.update((begin_delim, end_delim))
+
+    if any(begin_delim != end_delim for begin_delim, end_delim in quotes):
+        return None
+    if any(begin_delim == end_delim for begin_delim, end_delim in brackets):
+        return None
+    if len(codec.item_delim) != 1 or codec.item_delim in specials or "\\" in specials:
+        return None
+
+    escape = regex.escape
+    strings = "|".join(r"%s(?:[^%s\\]++|\\[\s\S])*+%s" % (escape(quote), escape(quote), escape(quote))
+                       for quote, _ in sorted(quotes))
+    inner = "[^%s]++" % escape("".join(sorted(specials)))
+    if strings:
+        inner += "|" + strings
+    nested = "|".join("%s(?:%s|(?&nested))*+%s" % (escape(begin_delim), inner, escape(end_delim))
+                      for begin_delim, end_delim in sorted(brackets))
+    outer = "[^%s]++" % escape("".join(sorted(specials | set(codec.item_delim))))
+    if strings:
+        outer += "|" + strings
+    if nested:
+        outer += "|(?&nested)"
+        define = "(?(DEFINE)(?P<nested>%s))" % nested
+    else:
+        define = ""
+
+    try:
+        pattern = regex.compile("%s(?:(?:%s)*+%s)*+" % (define, outer, escape(codec.item_delim)))
+        if binary:
+            pattern = bytespattern(pattern)
+    except (TypeError, regex.error):
+        return None
+    return pattern
+
+def _spans(scanner, data, start, end, chunksize):
+    """
+    Splits data[start:end] at item delimiters found by 'scanner' into spans of about chunksize, returning a
+    list of (start, stop) pairs, where stop is the offset of the delimiter that ends the span (None for the
+    last span).
+    """
+    spans = []
+    window = chunksize
+    while start + chunksize < end:
+        match = scanner.match(data, start, min(end, start + window))
+        if match is None or match.end() == start:
+            if start + window >= end:
+                break
+            window *= 2
+            continue
+        spans.append((start, match.end() - 1))
+        start = match.end()
+        window = chunksize
+    spans.append((start, None))
+    return spans
+
+def _indexspans(index, delim, start, chunksize):
+    """Same as _spans, using the top-level item delimiters found by a StructIndex."""
+    delims = index.toplevel(delim, start)
+    spans = []
+    while True:
+        k = int(delims.searchsorted(start + chunksize))
+        if k >= len(delims):
+            break
+        stop = int(delims[k])
+        spans.append((start, stop))
+        start = stop + len(delim)
+    spans.append((start, None))
+    return spans
+
+def _decodespan(codec, readbuf, stop, keys=None):
+    """
+    Decodes the items of 'codec' from readbuf, which is positioned at the start of an item, up to the item
+    delimiter at absolute offset 'stop' (or up to end_delim, if stop is None). Returns the items and the
+    absolute offset where decoding stopped.
+    """
+    if isinstance(codec, DictCodec):
+        items = codec._decode_from(readbuf, 0, codec.discardbufferdata, stop, keys)
+    else:
+        items = codec._decode_from(readbuf, 0, codec.discardbufferdata, stop)
+
+    results = []
+    while True:
+        try:
+            results.append(next(items))
+        except StopIteration as exc:
+            return results, readbuf.absoffset(exc.value)
+
+_job = None
+
+def _decodechunk(span):
+    codec, data, index = _job
+    start, stop = span
+    readbuf = _sharedreadbuffer(data, index)
+    readbuf.discard(start)
+    try:
+        return _decodespan(codec, readbuf, stop, set())
+    except (Exception, DecodeError):
+        # The parent decodes this span again to raise the exception.
+        return None
+
+def paralleldecode(codec, source, workers=None, chunksize=None, index=None):
+    """
+    Same as codec.decode(source), where codec is a ListCodec or DictCodec, but decodes the items (or entries) of
+    the top-level list (or dict) in a pool of 'workers' processes (os.cpu_count() by default).
+
+    The data is first split into spans of about 'chunksize' characters (bytes in binary mode) at top-level item
+    delimiters, found by a scan that only tracks the nesting of the delimiters of the containers and strings
+    reachable from codec. Each worker decodes its spans with the item codec, checking that decoding ends exactly
+    at the end of the span, and the items are reassembled in order. If a span does not decode, or does not end
+    where the scan found it to, decoding continues from that span in this process, so that results, exceptions,
+    and the absolute line and character positions they report are the same as for codec.decode.
+
+    The data is shared with the workers by forking, and never copied. 'source' may be a str, a bytes-like object,
+    an mmap object, a path (os.PathLike), or a binary file object with a fileno method; files are memory-mapped and
+    decoded in binary mode, as codec.decode would decode a binary file.
+
+    The items decoded by the workers are sent back to this process by pickling them, so hooks of the item codecs
+    (but not the hook of codec itself, which is applied here) must return objects that can be pickled. If they
+    do not, decoding continues in this process from the first span whose items could not be sent, which gives
+    the same result as codec.decode, without the speedup.
+
+    'index': A StructIndex of the data, built for codec, whose top-level item delimiters are then used to split it
+    (in place of the scan) and which is used to look up line numbers (see ReadBuffer).
+
+    codec.decode is used instead if forking is not available, or for codecs that the workers cannot decode on their
+    own: subclasses of ListCodec and DictCodec, and codecs with notify_decode, codecs_by_index, or requireclasskey.
+    """
+    data, owned = _opendata(source)
+    try:
+        if data is None:
+            return codec.decode(source)
+        return _paralleldecode(codec, data, workers, chunksize, index)
+    finally:
+        if owned:
+            data.close()
+
+def _paralleldecode(codec, data, workers, chunksize, index):
+    global _job
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    try:
+        context = multiprocessing.get_context("fork")
+    except ValueError:
+        context = None
+
+    binary = not isinstance(data, str)
+    if (workers < 2 or context is None or type(codec) not in (ListCodec, DictCodec) or codec.notify_decode is not None
+            or codec.codecs_by_index or getattr(codec, "requireclasskey", False)):
+        return codec.decode(_sharedreadbuffer(data, index))
+
+    if index is None:
+        scanner = _scanner(codec, binary)
+        if scanner is None:
+            return codec.decode(_sharedreadbuffer(data))
+
+    readbuf = _sharedreadbuffer(data, index)
+    offset = 0
+    if codec.strip_whitespace:
+        offset = skip_whitespace(readbuf, offset, False)
+    offset = codec._match_begin_delim(readbuf, offset)
+    if offset is NO_MATCH:
+        return codec.decode(readbuf)
+
+    if chunksize is None:
+        chunksize = max(len(data)//(4*workers), 65536)
+    if index is not None:
+        spans = _indexspans(index, codec.item_delim, offset, chunksize)
+    else:
+        spans = _spans(scanner, data, offset, len(data), chunksize)
+    if len(spans) < 2:
+        return codec.decode(readbuf)
+
+    isdict = isinstance(codec, DictCodec)
+    keys = set()
+    results = []
+
+    _job = codec, data, index
+    try:
+        with context.Pool(min(workers, len(spans))) as pool:
+            chunks = pool.imap(_decodechunk, spans)
+            for start, stop in spans:
+                try:
+                    result = next(chunks)
+                except MaybeEncodingError:
+                    # The items cannot be sent back from the worker (hooks that return objects that cannot be
+                    # pickled).
+                    result = None
+                if result is not None and stop is not None and result[1] != stop + len(codec.item_delim):
+                    result = None
+                if result is not None and isdict:
+                    if any(key in keys for (key, value) in result[0]):
+                        result = None
+                    else:
+                        keys.update(key for (key, value) in result[0])
+                if result is None:
+                    break
+                results.extend(result[0])
+    finally:
+        _job = None
+
+    if result is None:
+        # Continue from here in this process, once the workers are stopped.
+        readbuf.discard(start - readbuf.absoffset(0))
+        result = _decodespan(codec, readbuf, None, keys)
+        results.extend(result[0])
+
+    end = result[1]
+    readbuf.discard(end - readbuf.absoffset(0))
+    offset = 0
+
+    if isdict:
+        for key in codec.required_args:
+            if key not in keys:
+                raise DecodeError(codec, "Required key '%s' missing." % key, readbuf.abspos(offset))
+        obj = codec.dicttype(results)
+    else:
+        obj = results
+
+    try:
+        obj = codec.applyhook(obj)
+    except BaseException as exc:
+        raise DecodeError(codec, "Exception encountered while applying hook.", (0, end), exc)
+
+    if codec.strip_whitespace:
+        offset = skip_whitespace(readbuf, offset, False)
+    if not readbuf.atend(offset):
+        raise ExcessData(codec, readbuf.absoffset(offset))
+    return obj
@@ -0,0 +1,177 @@
+#!/usr/bin/python
+from codecfactory.basecodec import skip_whitespace, NO_MATCH
+from codecfactory.exc import DecodeError, NoMatch, UnexpectedEndOfData, ExcessData
+from codecfactory.dictcodec import DictCodec
+from codecfactory.stringcodec import pystringcodec
+from codecfactory.lazy import _container
+
+__all__ = ["ANY", "iterquery", "query"]
+
+class _AnyType(object):
+    def __repr__(self):
+        return "ANY"
+
+ANY = _AnyType()
+"""Path element that matches every item of a list, and every value of a dict (see iterquery)."""
+
+class _DoneType(object):
+    def __repr__(self):
+        return "_DONE"
+
+_DONE = _DoneType()
+
+_MISSING = object()
+
+def _select(codec, readbuf, offset, path, exhaustive):
+    """
+    Generator that yields the values at 'path' in the object at offset, decoded with codec, and returns the
+    offset of the end of the object, NO_MATCH if codec does not match, or _DONE if it stopped once it was
+    known that nothing more could be found. If 'exhaustive' is True, the object is always read to its end (so
+    that the items following it can be searched as well).
+    """
+    if not path:
+        result = codec._trydecodeone(readbuf, offset, discardbufferdata=False)
+        if result is NO_MATCH:
+            return NO_MATCH
+        value, offset = result
+        yield value
+        return offset if exhaustive else _DONE
+
+    if codec.strip_whitespace:
+        offset = skip_whitespace(readbuf, offset, False)
+
+    container = _container(codec, readbuf, offset)
+    key = path[0]
+    isdict = isinstance(container, DictCodec)
+    if container is None or not (key is ANY or isdict or isinstance(key, int)):
+        # Nothing to look for in here.
+        return codec._tryskip(readbuf, offset)
+
+    offset = container._match_begin_delim(readbuf, offset)
+    if offset is NO_MATCH:
+        return NO_MATCH
+
+    deeper = exhaustive or key is ANY
+    keys = set()
+    classmatched = False
+    k = 0
+    while True:
+        end = container._match_end_delim(readbuf, offset)
+        if end is not NO_MATCH:
+            if isdict:
+                container._check_end(readbuf, end)
+            break
+
+        if container.skip_whitespace_between_items:
+            offset = skip_whitespace(readbuf, offset)
+
+        result = None
+        if isdict:
+            itemkey, offset = container._decode_key(readbuf, offset, discardbufferdata=False)
+            isclass = container._check_key(readbuf, offset, itemkey, keys, classmatched)
+
+            end = container._match_key_delim(readbuf, offset)
+            if end is NO_MATCH:
+                lineno, char = readbuf.abspos(offset)
+                raise DecodeError(container, "Unexpected character on line %d, character %d (got '%s', expected '%s')." % (
+                    lineno, char, readbuf.peek(offset, 1), container.key_delim), readbuf.abspos(offset))
+            offset = end
+
+            if container.skip_whitespace_between_items:
+                offset = skip_whitespace(readbuf, offset)
+
+            if isclass:
+                # The class entry is checked as DictCodec checks it, but is never selected.
+                result = container._decode_item(readbuf, offset, "class", discardbufferdata=False)
+                if result is not NO_MATCH:
+                    if not container._match_class(result[0]):
+                        return NO_MATCH
+                    result = result[1]
+                classmatched = True
+                selected = False
+            else:
+                keys.add(itemkey)
+                selected = ((key is ANY or key == itemkey) and (container.keep is None or itemkey in container.keep
+                                                                 or itemkey in container.required_args))
+            if itemkey == "class":
+                itemcodec = pystringcodec
+            else:
+                itemcodec = container.codecs_by_key.get(itemkey, container.item_codec)
+        else:
+            itemkey = k
+            selected = key is ANY or key == k
+            itemcodec = container.codecs_by_index.get(k, container.item_codec)
+
+        if selected:
+            result = yield from _select(itemcodec, readbuf, offset, path[1:], deeper)
+            if result is _DONE or (result is not NO_MATCH and not deeper):
+                return _DONE
+        elif result is None:
+            result = container._skip_item(readbuf, offset, itemkey)
+            if result is not NO_MATCH:
+                result = result[1]
+
+        if result is NO_MATCH:
+            lineno, char = readbuf.abspos(offset)
+            raise DecodeError(container, "Unexpected character or item on line %d, character %d ('%s')." % (
+                lineno, char, readbuf.peek(offset, 16)), readbuf.absoffset(offset))
+        offset = result
+        k += 1
+
+        end = container._match_item_delim(readbuf, offset)
+        if end is NO_MATCH:
+            end = container._match_end_delim(readbuf, offset)
+            if end is NO_MATCH:
+                lineno, char = readbuf.abspos(offset)
+                if isdict:
+                    raise DecodeError(container, "Unexpected character on line %d, character %d (got '%s', expected '%s' or '%s')." % (
+                        lineno, char, readbuf.peek(offset, 1), container.item_delim, container.end_delim), readbuf.abspos(offset))
+                elif offset < len(readbuf):
+                    raise DecodeError(container, "Unexpected character on line %d, character %d ('%s')." % (
+                        lineno, char, readbuf.peek(offset, 16)), offset)
+                raise UnexpectedEndOfData(container, "Unexpected end of string while decoding list.")
+            break
+        readbuf.discard(end)
+        offset = 0
+
+    if isdict:
+        container._check_required(readbuf, end, keys)
+    return end
+
+def iterquery(codec, source, path):
+    """
+    Generator that yields the values at 'path' in the object encoded in source, decoded by their own codecs
+    (item_codec, or the entries of codecs_by_index and codecs_by_key), without decoding anything else.
+
+    'path': Sequence of path elements, each of which selects the item at that index (an int) of a list decoded
+        by a ListCodec, the value of that key of a dict decoded by a DictCodec, or, if ANY, every item or value.
+        Values that do not hold what the rest of the path asks for are skipped.
+
+    Everything else is only skimmed over (see lazydecode), and reading stops as soon as the last value has
+    been produced: unless the path holds ANY, that is the value itself, so that the remainder of a stream is
+    never read (nor validated). If the whole input is read, excess data raises ExcessData as for codec.decode.
+
+    'source' is accepted in the same forms as for codec.decode.
+    """
+    readbuf = codec._readbuffer(source)
+    offset = yield from _select(codec, readbuf, 0, tuple(path), False)
+    if offset is NO_MATCH:
+        raise NoMatch(codec)
+    elif offset is _DONE:
+        return
+
+    if codec.strip_whitespace:
+        offset = skip_whitespace(readbuf, offset, False)
+    if not readbuf.atend(offset):
+        raise ExcessData(codec, readbuf.absoffset(offset))
+
+def query(codec, source, path, default=_MISSING):
+    """
+    Returns the first value at 'path' in source (see iterquery), reading no further than that value. If there
+    is none, 'default' is returned if specified, and LookupError is raised otherwise.
+    """
+    for value in iterquery(codec, source, path):
+        return value
+    if default is _MISSING:
+        raise LookupError("No value found at %r." % (list(path),))
+    return default
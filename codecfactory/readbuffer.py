@@ -1,76 +1,491 @@
 #!/usr/bin/python
+import bisect
+import codecs
+import io
+import mmap
+import os
+import regex
+from codecfactory.exc import BufferLimitExceeded
 
-__all__ = ["ReadBuffer"]
+__all__ = ["ReadBuffer", "MmapReadBuffer", "AsyncReadBuffer", "ReadPolicy", "isbinaryfile", "bytespattern"]
+
+def isbinaryfile(file):
+    """Returns True if 'file' reads or writes bytes rather than str."""
+    if isinstance(file, (io.RawIOBase, io.BufferedIOBase)):
+        return True
+    if isinstance(file, io.TextIOBase):
+        return False
+    return "b" in getattr(file, "mode", "")
+
+_bytespatterns = {}
+
+def bytespattern(pattern):
+    """
+    Returns a bytes version of a compiled str regular expression, for use on binary data. Only patterns
+    written in ASCII can be converted, and character classes such as \\d and \\w then only match ASCII.
+    Results are cached.
+    """
+    try:
+        return _bytespatterns[pattern]
+    except KeyError:
+        pass
+    try:
+        source = pattern.pattern.encode("ascii")
+        result = regex.compile(source, pattern.flags & ~(regex.UNICODE | regex.LOCALE))
+    except (UnicodeEncodeError, regex.error) as exc:
+        raise TypeError("Cannot convert pattern %r for use on binary data (%s)." % (pattern.pattern, exc))
+    _bytespatterns[pattern] = result
+    return result
+
+_bytesmethods = {}
+
+def _bytesmethod(re_method):
+    """Maps a bound method of a str pattern (e.g., pattern.match) to the same method of its bytes version."""
+    try:
+        return _bytesmethods[re_method]
+    except KeyError:
+        pass
+    pattern = getattr(re_method, "__self__", None)
+    if isinstance(getattr(pattern, "pattern", None), str):
+        result = getattr(bytespattern(pattern), re_method.__name__)
+    else:
+        result = re_method
+    _bytesmethods[re_method] = result
+    return result
+
+_bytesstrings = {}
+
+def _tobytes(string):
+    try:
+        return _bytesstrings[string]
+    except KeyError:
+        result = _bytesstrings[string] = string.encode("utf-8")
+        return result
+
+class _ShiftedMatch(object):
+    """
+    Wraps a match object obtained from the underlying buffer of a ReadBuffer so that positions are
+    reported relative to the read cursor, as though the discarded data had actually been removed.
+    """
+    __slots__ = ("_match", "_shift")
+
+    def __init__(self, match, shift):
+        self._match = match
+        self._shift = shift
+
+    def start(self, group=0):
+        start = self._match.start(group)
+        return start - self._shift if start >= 0 else start
+
+    def end(self, group=0):
+        end = self._match.end(group)
+        return end - self._shift if end >= 0 else end
+
+    def span(self, group=0):
+        return (self.start(group), self.end(group))
+
+    def __getitem__(self, group):
+        return self._match[group]
+
+    def __getattr__(self, attr):
+        return getattr(self._match, attr)
+
+    def __repr__(self):
+        return "<%s span=%r, match=%r>" % (self.__class__.__name__, self.span(), self._match.group())
+
+class ReadPolicy(object):
+    """
+    Determines how much data a ReadBuffer reads at a time.
+
+    'minchunk': Number of characters (or bytes) requested by the first read after data has been
+        discarded.
+    'maxchunk': Upper limit on the number of characters (or bytes) requested by a single read.
+    'growth': Factor by which the size of each successive read grows while nothing is discarded, i.e.,
+        while a single token (or an object decoded with discardbufferdata=False) is still incomplete.
+        This keeps the number of reads, and of regex restarts, logarithmic in the size of the token.
+    'maxbuffer': If not None, hard limit on the amount of data held (read but not yet discarded) by the
+        ReadBuffer. BufferLimitExceeded is raised if a read would exceed it.
+    """
+    def __init__(self, minchunk=1024, maxchunk=1048576, growth=2, maxbuffer=None):
+        self.minchunk = int(minchunk)
+        self.maxchunk = max(int(maxchunk), self.minchunk)
+        self.growth = growth
+        self.maxbuffer = maxbuffer
+
+    def chunksize(self, streak):
+        """Size of the next read, after 'streak' consecutive reads with no data discarded."""
+        return int(min(self.maxchunk, self.minchunk*self.growth**min(streak, 64)))
 
 class ReadBuffer(object):
     """
     Class used to wrap around a file or file-like object so that objects can be decoded as soon as possible
     witout the need to read the entire file into memory.
-    
+
     The basic idea is to read data one line at a time as it is needed for successive decode operations.
     A discard method is included so that data can be discarded when it is no longer needed.
+
+    The amount of data requested by each read is determined by 'policy' (a ReadPolicy): lines are read
+    with a size limit, so a long line is read in pieces, and the pieces grow geometrically while no data
+    is discarded.
+
+    Internally, data is held in a single buffer along with a read cursor. Discarding data only advances the
+    cursor, and the consumed prefix of the buffer is dropped (compacted) once it outgrows both the live data
+    and 'compact_watermark'. Data that is read is kept in a list of pending chunks. An access that reaches
+    into them (a regex_op window, a slice, the characters compared by string_match) copies only the data it
+    looks at, and the chunks are only joined to the buffer (dropping the consumed prefix along the way) once
+    they hold at least as much data as the live part of the buffer, or when all of the data is needed (data
+    and abspos). A live part of at most 'join_threshold' is joined right away, as copying it costs less than
+    copying pieces of it. Each other join at least doubles the live data in the buffer, so that the copying
+    done by joins is linear in the amount of data read (rather than in the number of reads times the size of
+    the buffer), however the reads and accesses are interleaved. Every offset passed to or
+    returned by the methods of this class is relative to the read cursor, so codecs never see the
+    compaction happen.
+
+    If 'file' is None, 'data' is treated as the entire input. 'index' may then be a StructIndex of data (see
+    structindex.StructIndex), which abspos uses to look up line numbers.
+
+    If 'binary' is True, or is left unspecified and 'data' is bytes or 'file' is opened in binary mode, the
+    buffer holds bytes rather than str. In binary mode, str arguments to string_match are encoded as UTF-8,
+    and str patterns passed to regex_op are swapped for their bytes versions (see bytespattern), so codecs
+    written for str data work unchanged. Codecs should only decode UTF-8 where values are produced.
+    Offsets and character positions reported by abspos are then counted in bytes.
     """
-    def __init__(self, file, data=""):
+    compact_watermark = 65536
+    regex_window = 4096
+    regex_copy_window = 256
+    join_threshold = 4096
+    regex_margin = 16
+    policy = ReadPolicy()
+
+    index = None
+
+    def __init__(self, file, data="", binary=None, policy=None, index=None):
+        if binary is None:
+            binary = isinstance(data, (bytes, bytearray)) or (not data and file is not None and isbinaryfile(file))
+        self.binary = bool(binary)
+        self._newline = b"\n" if self.binary else "\n"
+        if self.binary and isinstance(data, str):
+            data = data.encode("utf-8")
+        if policy is not None:
+            self.policy = policy
+        if index is not None:
+            self.index = index
         self._file = file
-        self.data = data
+        self._buffer = data
+        self._pos = 0
+        self._pending = []
+        self._pendingends = []
+        self._pendingsize = 0
+        self._streak = 0
         self.discarded = 0
-        self.lines_discarded = 0
-        self.discarded_on_current_line = 0
+
+        # Line numbers are resolved lazily: these describe the data that preceded self._buffer, and
+        # are only updated when a prefix of the buffer is dropped.
+        self._lines_dropped = 0
+        self._linestart_dropped = 0
+
+    @property
+    def closed(self):
+        return self._file is None or self._file.closed
+
+    @property
+    def data(self):
+        """Data that has been read, but not yet discarded. Prefer len(readbuf) and readbuf[start:end],
+        which do not copy the buffer."""
+        if self._pending:
+            self._join()
+        if self._pos:
+            return self._buffer[self._pos:]
+        return self._buffer
+
+    @data.setter
+    def data(self, data):
+        self._drop()
+        self._buffer = data
+        self._pos = 0
+        self._pending = []
+        self._pendingends = []
+        self._pendingsize = 0
+
+    def __len__(self):
+        return len(self._buffer) - self._pos + self._pendingsize
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            data, shift = self._span(start, stop)
+            return data[start + shift:stop + shift:step]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("ReadBuffer index out of range")
+        return self.charat(key)
+
+    def charat(self, offset):
+        """
+        Returns the character at offset (an int in binary mode), or None if offset is at or past the end
+        of the data that has been read so far.
+        """
+        pos = self._pos + offset
+        if pos < len(self._buffer):
+            return self._buffer[pos]
+        pos -= len(self._buffer)
+        if pos < self._pendingsize:
+            k = bisect.bisect_right(self._pendingends, pos)
+            chunk = self._pending[k]
+            return chunk[pos - self._pendingends[k] + len(chunk)]
+        return None
+
+    def peek(self, offset, count):
+        """Returns up to count characters of data starting at offset as a str, for use in error messages."""
+        data = self[offset:offset + count]
+        if self.binary:
+            return data.decode("utf-8", "replace")
+        return data
+
+    def _count_newlines(self, start, end):
+        return self._buffer.count(self._newline, start, end)
+
+    def _drop(self):
+        """Accounts for the newlines in the discarded data before it is removed from the buffer."""
+        newlines = self._count_newlines(0, self._pos)
+        if newlines:
+            self._lines_dropped += newlines
+            self._linestart_dropped = self.discarded - self._pos + self._buffer.rfind(self._newline, 0, self._pos) + 1
+
+    def _compact(self):
+        if self._pending:
+            self._join()
+        elif self._pos:
+            self._drop()
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+
+    def _join(self):
+        """Joins the pending chunks to the live data in a single copy, dropping the consumed prefix."""
+        if self._pos:
+            self._drop()
+        self._pending.insert(0, self._buffer[self._pos:])
+        self._buffer = self._newline[:0].join(self._pending)
+        self._pos = 0
+        self._pending = []
+        self._pendingends = []
+        self._pendingsize = 0
+
+    def _span(self, start, stop):
+        """
+        Returns (data, shift), where data holds the data from offset start up to offset stop (or the end of the
+        data), the data at offset k being data[k + shift]. This is the buffer itself if it holds all of that
+        data, once the pending chunks are joined to it if they are at least as large as its live part (see
+        ReadBuffer), and otherwise a copy of only that data.
+        """
+        buflen = len(self._buffer)
+        if self._pos + stop > buflen and buflen - self._pos <= max(self._pendingsize, self.join_threshold):
+            self._join()
+            buflen = len(self._buffer)
+        if self._pos + stop <= buflen:
+            return self._buffer, self._pos
+
+        start = max(self._pos + start, 0)
+        stop = self._pos + stop - buflen
+        pieces = []
+        if start < buflen:
+            pieces.append(self._buffer[start:])
+        ends = self._pendingends
+        k = bisect.bisect_right(ends, start - buflen)
+        while k < len(ends):
+            chunk = self._pending[k]
+            chunkstart = ends[k] - len(chunk)
+            pieces.append(chunk[max(start - buflen - chunkstart, 0):stop - chunkstart])
+            if ends[k] >= stop:
+                break
+            k += 1
+        return self._newline[:0].join(pieces), self._pos - start
+
+    def _append(self, data):
+        maxbuffer = self.policy.maxbuffer
+        if maxbuffer is not None and len(self) + len(data) > maxbuffer:
+            raise BufferLimitExceeded(maxbuffer, self.absoffset(len(self)))
+        self._pending.append(data)
+        self._pendingsize += len(data)
+        self._pendingends.append(self._pendingsize)
 
     def readdata(self, count=None):
-        """Called when we need to read more data from the file object and append it to self.data."""
+        """
+        Called when we need to read more data from the file object and append it to self.data.
+
+        If count is None, up to one line is read, limited in size by self.policy. Otherwise, count
+        characters are read (fewer only at the end of the file).
+        """
+        if self.closed:
+            return 0
         if count is None:
-            line = self._file.readline()
+            size = self.policy.chunksize(self._streak)
+            if self.binary and hasattr(self._file, "read1"):
+                line = self._file.read1(size)
+            else:
+                line = self._file.readline(size)
         else:
             line = self._file.read(count)
-        self.data += line
-        if line == "":
+        self._streak += 1
+        if not line:
             self._file.close()
+        else:
+            self._append(line)
         return len(line)
 
+    def readatleast(self, count):
+        """
+        Reads data (in reads sized by self.policy) until at least count more characters are available, or
+        the end of the file is reached. Returns the number of characters read.
+
+        When an incomplete token has to be rescanned from its beginning after more data is read, requesting
+        at least as much data as has already been scanned keeps the total work linear in the length of the
+        token.
+        """
+        total = 0
+        while True:
+            n = self.readdata()
+            total += n
+            if n == 0 or total >= count:
+                return total
+
     def discard(self, offset):
         """We may not necessarily want to keep all the raw data from the file, so we may periodically
         wish to discard the data once it has been decoded and processed. This is to help keep self.data
-        relatively small."""
-        tobediscarded = self.data[:offset]
-        self.data = self.data[offset:]
-        self.discarded += len(tobediscarded)
-        self.lines_discarded += tobediscarded.count("\n")
-        if "\n" in tobediscarded:
-            self.discarded_on_current_line = len(tobediscarded) - tobediscarded.rindex("\n") + 1
-        else:
-            self.discarded_on_current_line += len(tobediscarded)
+        relatively small.
+
+        Only the read cursor is moved here. Line numbers are not tracked until they are asked for (see
+        abspos)."""
+        if offset:
+            self._streak = 0
+        if self._pending and self._pos + offset > len(self._buffer):
+            # The whole buffer is discarded, so only the pending chunks are joined.
+            skipped = len(self._buffer) - self._pos
+            self.discarded += skipped
+            self._pos += skipped
+            offset -= skipped
+            self._drop()
+            self._buffer = self._newline[:0].join(self._pending)
+            self._pos = 0
+            self._pending = []
+            self._pendingends = []
+            self._pendingsize = 0
+        self.discarded += offset
+        self._pos += offset
+
+        if self._pos >= self.compact_watermark and self._pos >= len(self._buffer) - self._pos:
+            self._compact()
 
     def absoffset(self, offset):
         return self.discarded + offset
 
+    def atend(self, offset=0):
+        """Returns True if there is no data at or past offset, reading more from the file if needed."""
+        while offset >= len(self):
+            if self.closed or self.readdata() == 0:
+                return True
+        return False
+
     def abspos(self, offset):
-        lc = self.data.count("\n", 0, offset)
-        lineno = self.lines_discarded + lc + 1
+        """
+        Returns the (line, character) position of offset, both starting at 1.
+
+        This counts the newlines in the buffer up to offset, so it is meant for error reporting rather
+        than for use on every token, unless the ReadBuffer has an index.
+        """
+        if self.index is not None:
+            return self.index.abspos(self.absoffset(offset))
+
+        if self._pending:
+            self._join()
+        end = self._pos + offset
+        lc = self._count_newlines(0, end)
+        lineno = self._lines_dropped + lc + 1
         if lc:
-            char = offset - self.data.rfind("\n", 0, offset)
+            char = end - self._buffer.rfind(self._newline, 0, end)
         else:
-            char = self.discarded_on_current_line + offset + 1
+            char = self.absoffset(offset) - self._linestart_dropped + 1
         return (lineno, char)
 
+    @property
+    def lines_discarded(self):
+        return self.abspos(0)[0] - 1
+
+    @property
+    def discarded_on_current_line(self):
+        return self.abspos(0)[1] - 1
+
+    def _result(self, result, shift):
+        if result is None or not shift:
+            return result
+        return _ShiftedMatch(result, shift)
+
     def regex_op(self, re_method, pos=None, endpos=None, concurrent=None):
         """
         Special: Apply a regular expression search on the file. The support in the regex module for
         indicating a partial match allows us to determine that a match may be possible if more data is read
         from the file.
+
+        're_method' is the match, fullmatch or search method of a compiled pattern, and the result is a match
+        object or None (methods such as finditer, which return an iterator, are not supported).
+
+        Anchored methods (match and fullmatch) are confined to a window of 'regex_window' characters past pos,
+        which is doubled each time a match runs up against it, so that a large buffer does not make each call
+        cost O(len(buffer)) (the regex module may scan ahead for required literals). A search is always run
+        over all of the data that has been read, since finding no match within a window would not mean that
+        there is none past it.
+
+        Where the data to be matched reaches into data that is not yet joined to the buffer (see ReadBuffer),
+        the pattern is run over a copy of only that data, preceded by up to 'regex_margin' characters for
+        lookbehinds, and anchored methods then start with a window of 'regex_copy_window' characters, so that
+        each call copies about as much data as it matches.
         """
+        if getattr(re_method, "__name__", None) in ("match", "fullmatch"):
+            window = self.regex_window
+        else:
+            window = None
+
+        if self.binary:
+            re_method = _bytesmethod(re_method)
+
+        start = pos or 0
+        context = min(self.regex_margin, start + self._pos)
+        if self._pending:
+            if len(self._buffer) - self._pos <= max(self._pendingsize, self.join_threshold):
+                self._join()
+            elif window is not None and self._pos + start + window > len(self._buffer):
+                window = self.regex_copy_window
         while True:
-            result = re_method(self.data, pos=pos, endpos=endpos, concurrent=concurrent, partial=True)
+            total = len(self)
+            stop = total if endpos is None else min(total, endpos)
+            limit = stop if window is None else min(stop, start + window)
+            if self._pos + limit <= len(self._buffer):
+                data, shift = self._buffer, self._pos
+            else:
+                data, shift = self._span(start - context, limit)
+            result = re_method(data, pos=start + shift, endpos=limit + shift, concurrent=concurrent, partial=True)
             if result is None:
                 """No match, no possibilty of a partial match."""
                 return None
-            elif result.end() < len(self.data):
+            end = result.end() - shift
+            if end + self.regex_margin < limit:
                 """
                 A match is found, and it ends before the end of the current data.
                 result.partial == False implied.
+
+                The regex module will report a complete match whenever one exists, even if more data may
+                have allowed a longer match (e.g., an escape sequence cut off by the end of the data), so
+                the match is only trusted if it ends at least regex_margin characters before the end.
                 """
-                return result
-            elif self._file.closed or self.readdata(1024) == 0:
+                return self._result(result, shift)
+            elif limit < stop:
+                """The match ran into the end of the window, but there is more data in the buffer."""
+                window = 2*max(window, end - start)
+            elif stop < total:
+                """The match ran into endpos."""
+                return self._result(result, shift)
+            elif self.closed or self.readatleast(end - start) == 0:
                 """
                 File object is closed (or at least will be if self.readdata() is called and no data is read). At this point, the match is either complete and ends at the end of the file,
                 or it is a partial match. If the match is flagged as partial, the match could still be complete, but
@@ -78,10 +493,296 @@ class ReadBuffer(object):
                 incomplete, there is no hope of obtaining a complete match."""
                 if not result.partial:
                     """We do not need to rerun the re_method."""
-                    return result
-                return re_method(self.data, pos=pos, endpos=endpos, concurrent=concurrent, partial=False)
+                    return self._result(result, shift)
+                return self._result(re_method(data, pos=start + shift, endpos=stop + shift,
+                                              concurrent=concurrent, partial=False), shift)
 
     def string_match(self, string, offset):
-        if offset + len(string) > len(self.data) and not self._file.closed:
-            self.readdata(offset + len(string) - len(self.data))
-        return self.data[offset:].startswith(string)
+        if self.binary and isinstance(string, str):
+            string = _tobytes(string)
+        if offset + len(string) > len(self) and not self.closed:
+            self.readdata(offset + len(string) - len(self))
+        if self._pos + offset + len(string) <= len(self._buffer):
+            return self._buffer.startswith(string, self._pos + offset)
+        data, shift = self._span(offset, offset + len(string))
+        return data.startswith(string, offset + shift)
+
+    def find(self, string, offset=0):
+        """
+        Returns the offset of the first occurrence of string at or after offset, or -1 if it does not
+        occur in the data that has been read so far. No data is read from the file.
+        """
+        if self.binary and isinstance(string, str):
+            string = _tobytes(string)
+        data, shift = self._span(offset, len(self))
+        pos = data.find(string, offset + shift)
+        if pos < 0:
+            return pos
+        return pos - shift
+
+class MmapReadBuffer(ReadBuffer):
+    """
+    ReadBuffer backed by a memory-mapped file, for decoding files too large to comfortably read into memory.
+
+    'file' may be a path, a file object with a fileno() method, or an mmap object.
+
+    If 'binary' is True, the regular expressions of the codecs are run directly over the mapping, and
+    discarding data only moves the read cursor. Otherwise, the mapped data is decoded with 'encoding' in
+    blocks of 'chunksize' bytes as it is needed.
+
+    Either way, pages of the mapping that have been consumed are released back to the operating system where
+    mmap.madvise is supported, so that resident memory stays flat regardless of the size of the file.
+
+    In binary mode, 'index' may be a StructIndex of the mapped data (see ReadBuffer).
+    """
+    chunksize = 65536
+
+    def __init__(self, file, encoding="utf-8", errors="strict", chunksize=None, binary=False, index=None):
+        ReadBuffer.__init__(self, None, binary=binary, index=index)
+        self._ownsmap = not isinstance(file, mmap.mmap)
+
+        if not self._ownsmap:
+            self._map = file
+        else:
+            if isinstance(file, (str, bytes)) or hasattr(file, "__fspath__"):
+                fd = os.open(file, os.O_RDONLY)
+            else:
+                fd = os.dup(file.fileno())
+            try:
+                if os.fstat(fd).st_size:
+                    self._map = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+                else:
+                    self._map = b""
+            finally:
+                os.close(fd)
+
+        if chunksize is not None:
+            self.chunksize = int(chunksize)
+
+        self._released = 0
+
+        if self.binary:
+            self._buffer = self._map
+            self._mappos = len(self._map)
+            self._eof = True
+        else:
+            self._decoder = codecs.getincrementaldecoder(encoding)(errors)
+            self._mappos = 0
+            self._eof = False
+
+    @property
+    def closed(self):
+        return self._eof
+
+    def _release(self, end):
+        """Drop pages of the mapping before 'end' from resident memory."""
+        if not hasattr(self._map, "madvise") or not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        end -= end % mmap.PAGESIZE
+        if end - self._released >= 16*self.chunksize:
+            self._map.madvise(mmap.MADV_DONTNEED, self._released, end - self._released)
+            self._released = end
+
+    def _count_newlines(self, start, end):
+        if not self.binary:
+            return ReadBuffer._count_newlines(self, start, end)
+        # mmap objects have no count method.
+        return sum(self._map[k:min(k + self.chunksize, end)].count(b"\n")
+                   for k in range(start, end, self.chunksize))
+
+    def _compact(self):
+        if not self.binary:
+            ReadBuffer._compact(self)
+
+    def discard(self, offset):
+        ReadBuffer.discard(self, offset)
+        if self.binary:
+            self._release(self._pos)
+
+    def readdata(self, count=None):
+        """Decodes the next block(s) of the mapping and appends them to self.data. If count is specified,
+        blocks are decoded until at least count characters are read, or the end of the mapping is reached."""
+        chunks = []
+        n = 0
+        while not self._eof and (n == 0 or count is not None and n < count):
+            block = self._map[self._mappos:self._mappos + self.chunksize]
+            self._mappos += len(block)
+            chunk = self._decoder.decode(block, final=not block)
+            self._eof = not block
+            chunks.append(chunk)
+            n += len(chunk)
+
+        self._release(self._mappos)
+
+        if n:
+            self._append("".join(chunks))
+        return n
+
+    def string_match(self, string, offset):
+        if not self.binary:
+            return ReadBuffer.string_match(self, string, offset)
+        if isinstance(string, str):
+            string = _tobytes(string)
+        # mmap objects have no startswith method.
+        start = self._pos + offset
+        return self._map[start:start + len(string)] == string
+
+    def close(self):
+        self._eof = True
+        if self._ownsmap and isinstance(self._map, mmap.mmap):
+            self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class _MoreData(BaseException):
+    """
+    Raised by an AsyncReadBuffer where a ReadBuffer would read from its file, so that the decode operation can be
+    rolled back and retried once more data has been awaited (see AsyncReadBuffer).
+
+    'readahead' is False if the operation already found the data to end too soon (see BaseCodec.decodeone), rather
+    than reading ahead of a match that may be complete, so that retrying it as though the stream ended with the
+    data received so far cannot succeed.
+    """
+    def __init__(self, count=None, readahead=True):
+        self.count = count
+        self.readahead = readahead
+
+class AsyncReadBuffer(ReadBuffer):
+    """
+    ReadBuffer over an asyncio.StreamReader (or any object with a coroutine method read(n) that returns b"" at the
+    end of the stream), for decoding with adecodeone and aiterdecode (see codecfactory.aio). Data is held as bytes,
+    as for a binary file.
+
+    Codecs decode synchronously, so they cannot wait for data. Instead, a codec that needs more data than has been
+    received interrupts the decode operation, which is then rolled back to a checkpoint taken before it started,
+    and retried once fill has awaited the next read. Data discarded since the checkpoint is kept until commit is
+    called.
+    """
+    def __init__(self, reader, data=b"", policy=None):
+        ReadBuffer.__init__(self, None, data, binary=True, policy=policy)
+        self._reader = reader
+        self._eof = False
+        self._checkpoint = None
+
+        # Set while an operation is tried as though the stream ended with the data received so far.
+        self._tentative = False
+
+        # Set while a regular expression is matched (see regex_op), the only place where data is read ahead.
+        self._matching = False
+
+    @property
+    def closed(self):
+        return self._eof or self._tentative
+
+    def readdata(self, count=None):
+        if self.closed:
+            return 0
+        raise _MoreData(count)
+
+    def readatleast(self, count):
+        if self.closed:
+            return 0
+        raise _MoreData(count, self._matching)
+
+    def regex_op(self, re_method, pos=None, endpos=None, concurrent=None):
+        self._matching = True
+        try:
+            return ReadBuffer.regex_op(self, re_method, pos, endpos, concurrent)
+        finally:
+            self._matching = False
+
+    def string_match(self, string, offset):
+        if offset + len(string) > len(self) and not self.closed:
+            # More data is only needed if the data received so far matches the start of string.
+            if isinstance(string, str):
+                string = _tobytes(string)
+            if not string.startswith(self[offset:]):
+                return False
+        return ReadBuffer.string_match(self, string, offset)
+
+    def _compact(self):
+        if self._checkpoint is None:
+            ReadBuffer._compact(self)
+
+    def checkpoint(self):
+        """
+        Returns the state of the read cursor, which rollback restores, and keeps data discarded from now on in the
+        buffer until commit is called.
+        """
+        if self._pending:
+            # Joining moves the cursor, so it must not happen between checkpoint and rollback.
+            self._join()
+        self._checkpoint = (self._pos, self.discarded, self._streak)
+        return self._checkpoint
+
+    def rollback(self, state):
+        """Restores the state of the read cursor returned by checkpoint, undoing any discards since."""
+        self._pos, self.discarded, self._streak = state
+        self._checkpoint = None
+
+    def commit(self):
+        """Releases the checkpoint, so that discarded data can be dropped from the buffer."""
+        self._checkpoint = None
+        self.discard(0)
+
+    async def fill(self, count=None):
+        """
+        Awaits the next read from the stream, and appends the data that has arrived: up to policy.maxchunk bytes (or
+        count, if larger), as the read does not wait for more data than is available. Returns the data read, which
+        is empty at the end of the stream.
+        """
+        if self._eof:
+            return b""
+        data = await self._reader.read(max(self.policy.maxchunk, count or 0))
+        self._streak += 1
+        if not data:
+            self._eof = True
+        else:
+            self._append(data)
+        return data
+
+class _SharedReadBuffer(ReadBuffer):
+    """
+    ReadBuffer over the entire input, which is never copied (see MmapReadBuffer), so that it can be shared
+    with other processes and with other ReadBuffers positioned elsewhere in it (see discard).
+    """
+    def _compact(self):
+        pass
+
+def _sharedreadbuffer(data, index=None):
+    """Returns a ReadBuffer over data (a str, bytes or mmap object), which is never copied."""
+    if isinstance(data, mmap.mmap):
+        return MmapReadBuffer(data, binary=True, index=index)
+    return _SharedReadBuffer(None, data, index=index)
+
+def _opendata(source):
+    """
+    Returns (data, owned), where data is source as a str, bytes or mmap object that holds the entire input (see
+    _sharedreadbuffer), and owned is True if data is an mmap object opened here. Returns (None, False) if source
+    cannot be accessed this way.
+    """
+    if isinstance(source, (str, bytes, mmap.mmap)):
+        return source, False
+    elif isinstance(source, (bytearray, memoryview)):
+        return bytes(source), False
+
+    if isinstance(source, os.PathLike):
+        fd = os.open(source, os.O_RDONLY)
+    elif isinstance(source, (io.RawIOBase, io.BufferedIOBase)) and hasattr(source, "fileno"):
+        try:
+            fd = os.dup(source.fileno())
+        except (OSError, io.UnsupportedOperation):
+            return None, False
+    else:
+        return None, False
+
+    try:
+        if not os.fstat(fd).st_size:
+            return b"", False
+        return mmap.mmap(fd, 0, access=mmap.ACCESS_READ), True
+    finally:
+        os.close(fd)
@@ -1,5 +1,5 @@
 #!/usr/bin/python
-from codecfactory.basecodec import BaseCodec, SINGLE
+from codecfactory.basecodec import BaseCodec, SINGLE, NO_MATCH
 from codecfactory.exc import (DecodeError, NoMatch, UnexpectedEndOfData, ExcessData,
                  EncodeError, EncodeMatchError)
 import regex
@@ -19,17 +19,47 @@ class RegExCodec(BaseCodec):
         BaseCodec.__init__(self, hook=hook, unhook=unhook,
                            allowedtype=allowedtype, strip_whitespace=strip_whitespace, name=name)
 
-    def _decode(self, readbuf, offset=0, discardbufferdata=None):
+    def _firstchars(self):
+        """
+        Derives the set of possible leading characters by testing each ASCII character against the
+        pattern as a partial match. Characters outside of ASCII are not covered (see CodecSet).
+        """
+        pattern = self.regex.pattern
+        if isinstance(pattern, bytes):
+            probes = [bytes([k]) for k in range(128)]
+            empty = b""
+        else:
+            probes = [chr(k) for k in range(128)]
+            empty = ""
+
+        # A pattern that can match an empty string can be followed by anything, and lookbehinds
+        # (and \B) depend on data preceding offset, which probing cannot account for.
+        if self.regex.match(empty) is not None or "(?<=" in str(pattern) or r"\B" in str(pattern):
+            return None
+
+        return frozenset(chr(k) for k, probe in enumerate(probes)
+                         if self.regex.match(probe, partial=True) is not None)
+
+    def _trydecode(self, readbuf, offset=0, discardbufferdata=None):
         match = readbuf.regex_op(self.regex.match, pos=offset)
 
         if match is None:
-            raise NoMatch(self)
+            return NO_MATCH
 
         if self.hookmatch:
             return match, match.end()
 
+        if readbuf.binary:
+            return match.group().decode("utf-8"), match.end()
+
         return match.group(), match.end()
 
+    def _skip(self, readbuf, offset=0):
+        match = readbuf.regex_op(self.regex.match, pos=offset)
+        if match is None:
+            return NO_MATCH
+        return match.end()
+
     def _encode(self, obj, file, indent="    ", indentlevel=0):
         if not isinstance(obj, strtype):
             raise EncodeTypeError(self, obj, "Can only encode strings. Please set an unhook attribute to fix this.")
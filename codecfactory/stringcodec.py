@@ -1,9 +1,9 @@
-from codecfactory.basecodec import BaseCodec, ReadBuffer
+from codecfactory.basecodec import BaseCodec, ReadBuffer, NO_MATCH
 from codecfactory.exc import (DecodeError, NoMatch, UnexpectedEndOfData, ExcessData,
                  EncodeError, EncodeMatchError)
 import regex
 import sys
-__all__ = ["StringCodec", "pystringcodec"]
+__all__ = ["StringCodec", "EscapeTable", "makepystringcodec", "pystringcodec"]
 
 if sys.version_info.major >= 3:
     strtype = str
@@ -17,6 +17,7 @@ class StringCodec(BaseCodec):
                  escape_char_match, escape_func,
                  begin_delim='"', end_delim='"',
                  hook=None, unhook=None, allowedtype=strtype,
+                 decode_string_match_bytes=None, escape_table=None,
                  name="StringCodec"):
         """
         Codec for use in encoding/decoding strings.
@@ -38,15 +39,26 @@ class StringCodec(BaseCodec):
         'escape_func': Function used to perform replacement of characters with
         escape sequences via escape_char_match.sub.
 
+        'decode_string_match_bytes': Bytes version of decode_string_match, used when
+        decoding binary data. The matched data is decoded as UTF-8 before escape
+        sequences are replaced. If not specified, it is derived from
+        decode_string_match where possible (see readbuffer.bytespattern).
+
+        'escape_table': Translation table (see str.translate and EscapeTable) used in place of
+        escape_char_match.sub(escape_func, ...) when encoding. Only valid if escape_char_match only
+        ever matches single characters.
+
         The 'pystringcodec' is an implementation of this class that encodes/decodes
         python strings.
         """
         self.decode_string_match = decode_string_match
+        self.decode_string_match_bytes = decode_string_match_bytes
         self.unescape_char_match = unescape_char_match
         self.unescape_func = unescape_func
 
         self.escape_char_match = escape_char_match
         self.escape_func = escape_func
+        self.escape_table = escape_table
 
         self.begin_delim = begin_delim
         self.end_delim = end_delim
@@ -54,55 +66,141 @@ class StringCodec(BaseCodec):
         BaseCodec.__init__(self, hook=hook, unhook=unhook,
                            allowedtype=allowedtype, name=name)
 
-    def _decode(self, readbuf, offset, discardbufferdata=None):
-        if not readbuf.data[offset:].startswith(self.begin_delim):
-            raise NoMatch(self)
+    def _firstchars(self):
+        if len(self.begin_delim):
+            return frozenset(self.begin_delim[0])
+        return None
+
+    def _trydecode(self, readbuf, offset, discardbufferdata=None):
+        if not readbuf.string_match(self.begin_delim, offset):
+            return NO_MATCH
         offset += len(self.begin_delim)
 
-        retstring = ""
+        chunks = []
+
+        # Fast path: escape_char_match matches end_delim, escape characters, and anything that
+        # decode_string_match does not match, so if it matches nothing up to the first occurrence of
+        # end_delim, that is the string. Otherwise, what comes before its first match is taken as is.
+        end = readbuf.find(self.end_delim, offset)
+        if end >= 0:
+            raw = retstring = readbuf[offset:end]
+            if readbuf.binary:
+                try:
+                    retstring = raw.decode("utf-8")
+                except UnicodeDecodeError:
+                    end = -1
+
+        if end >= 0:
+            match = self.escape_char_match.search(retstring)
+            if match is None:
+                return retstring, end + len(self.end_delim)
+            elif match.start():
+                if readbuf.binary:
+                    chunks.append(raw[:len(retstring[:match.start()].encode("utf-8"))])
+                else:
+                    chunks.append(retstring[:match.start()])
+                offset += len(chunks[0])
+
+        if readbuf.binary and self.decode_string_match_bytes is not None:
+            decode_string_match = self.decode_string_match_bytes
+        else:
+            decode_string_match = self.decode_string_match
+
         while True:
-            match = self.decode_string_match.match(readbuf.data, pos=offset, partial=True)
+            match = readbuf.regex_op(decode_string_match.match, pos=offset)
 
             if match is None:
                 lineno, char = readbuf.abspos(offset)
                 raise DecodeError(self, "Unable to match string on line %d, character %d ('%s')." % (
-                    lineno, char, readbuf.data[offset:offset+16]), readbuf.absoffset(offset))
+                    lineno, char, readbuf.peek(offset, 16)), readbuf.absoffset(offset))
             elif match.partial:
                 raise UnexpectedEndOfData(self, "Unexpected end of data encountered while attempting to decode string.")
 
-            chunk = self.unescape_char_match.sub(self.unescape_func, match.group())
-            retstring += chunk
+            chunk = match.group()
+            chunks.append(chunk)
             offset = match.end()
 
             if len(chunk) == 0:
-                if not readbuf.data[offset:].startswith(self.end_delim):
+                if not readbuf.string_match(self.end_delim, offset):
                     lineno, char = readbuf.abspos(offset)
-                    if readbuf.data[offset:].startswith("\n"):
+                    if readbuf.string_match("\n", offset):
                         raise DecodeError(self,
                             "EOL while scanning string (line %d)." % lineno, readbuf.absoffset(offset))
                     raise DecodeError(self,
                         "Unexpected character, escape sequence, or missing end delimiter on line %d, character %d ('%s')." % (
-                    lineno, char, readbuf.data[offset:offset+2]), readbuf.absoffset(offset))
+                    lineno, char, readbuf.peek(offset, 2)), readbuf.absoffset(offset))
                 offset += len(self.end_delim)
                 break
 
+        if readbuf.binary:
+            retstring = b"".join(chunks).decode("utf-8")
+        else:
+            retstring = "".join(chunks)
+
+        return self.unescape_char_match.sub(self.unescape_func, retstring), offset
 
-        return retstring, offset
+    def _skip(self, readbuf, offset=0):
+        result = self._trydecode(readbuf, offset)
+        if result is NO_MATCH:
+            return result
+        return result[1]
         
 
     def _encode(self, string, file, indent="    ", indentlevel=0):
-        encodedstring = self.escape_char_match.sub(self.escape_func, string)
+        if self.escape_table is None:
+            encodedstring = self.escape_char_match.sub(self.escape_func, string)
+        elif self.escape_char_match.search(string) is None:
+            encodedstring = string
+        else:
+            encodedstring = string.translate(self.escape_table)
         return file.write(self.begin_delim + encodedstring + self.end_delim)
 
 
+class EscapeTable(dict):
+    maxsize = 4096
+
+    def __init__(self, escape_char_match, escape_func):
+        """
+        Translation table for str.translate that escapes single characters as
+        escape_char_match.sub(escape_func, char) would. Entries for ASCII characters are computed
+        up front, and entries for other characters the first time each is looked up, until the
+        table holds 'maxsize' entries. Characters looked up after that are escaped each time, so
+        that the table stays bounded however many distinct characters are encoded.
+        """
+        dict.__init__(self)
+        self.escape_char_match = escape_char_match
+        self.escape_func = escape_func
+        for n in range(128):
+            self[n] = escape_char_match.sub(escape_func, unichr(n))
+
+    def __missing__(self, n):
+        escaped = self.escape_char_match.sub(self.escape_func, unichr(n))
+        if len(self) < self.maxsize:
+            self[n] = escaped
+        return escaped
+
+
 escape_codes={"r": "\r", "n": "\n", "t": "\t", "a": "\a", "b": "\b", "f": "\f", "\\": "\\", "\"": "\""}
 escaped_escapes = regex.escape("".join(escape_codes.values()))
 rescape_codes = {val: key for key, val in escape_codes.items()}
 unescape_char_match = regex.compile(r"\\([%s]|x([0-f]{2})|u([0-f]{4})|U([0-f]{8}))" % regex.escape("".join(escape_codes.keys())))
-decode_string_match = regex.compile(r"(?:\\(?:[%s]|x[0-f]{2}|u[0-f]{4}|U[0-f]{8})|[^%s\x00-\x1f\x7f-\U0010ffff]){0,4096}" % (
-                                    regex.escape("".join(escape_codes.keys())), regex.escape("".join(escape_codes.values()))
-                                    ))
-escape_char_match = regex.compile(r"[%s\x00-\x1f\x7f-\U0010ffff]" % regex.escape("".join(escape_codes.values())))
+escaped_keys = regex.escape("".join(escape_codes.keys()))
+escape_sequence = r"\\(?:[%s]|x[0-f]{2}|u[0-f]{4}|U[0-f]{8})" % escaped_keys
+
+decode_string_match = regex.compile(r"(?:%s|[^%s\x00-\x1f\x7f-\U0010ffff]){0,4096}" % (escape_sequence, escaped_escapes))
+decode_string_match_bytes = regex.compile((r"(?:%s|[^%s\x00-\x1f\x7f-\xff]){0,4096}" % (
+                                    escape_sequence, escaped_escapes)).encode("ascii"))
+escape_char_match = regex.compile(r"[%s\x00-\x1f\x7f-\U0010ffff]" % escaped_escapes)
+
+# With ensure_ascii=False, only control characters (C0, DEL and C1) and surrogates are escaped.
+decode_string_match_unicode = regex.compile(r"(?:%s|[^%s\x00-\x1f\x7f-\x9f\ud800-\udfff]){0,4096}" % (
+                                            escape_sequence, escaped_escapes))
+# UTF-8 encoded characters from U+00A0 up, except surrogates.
+utf8_char = (r"\xc2[\xa0-\xbf]|[\xc3-\xdf][\x80-\xbf]|\xe0[\xa0-\xbf][\x80-\xbf]|[\xe1-\xec\xee\xef][\x80-\xbf]{2}"
+             r"|\xed[\x80-\x9f][\x80-\xbf]|\xf0[\x90-\xbf][\x80-\xbf]{2}|[\xf1-\xf3][\x80-\xbf]{3}|\xf4[\x80-\x8f][\x80-\xbf]{2}")
+decode_string_match_unicode_bytes = regex.compile((r"(?:%s|[^%s\x00-\x1f\x7f-\xff]|%s){0,4096}" % (
+                                            escape_sequence, escaped_escapes, utf8_char)).encode("ascii"))
+escape_char_match_unicode = regex.compile(r"[%s\x00-\x1f\x7f-\x9f\ud800-\udfff]" % escaped_escapes)
 
 def encode_char(match):
     char = match.group()
@@ -130,6 +228,24 @@ def decode_char(match):
         elif escape_char.startswith("U"):
             return unichr(int(Uparams, 16))
 
-pystringcodec = StringCodec(decode_string_match, unescape_char_match, decode_char,
-                 escape_char_match, encode_char,
-                 name="PythonStringCodec")
+def makepystringcodec(ensure_ascii=True, name="PythonStringCodec"):
+    """
+    Returns a StringCodec that encodes/decodes python strings.
+
+    'ensure_ascii': If True, every character outside of printable ASCII is escaped when encoding, and
+    only accepted escaped when decoding (as in pystringcodec). If False, characters from U+00A0 up
+    (except surrogates) are written and accepted as they are, and only control characters are escaped.
+    """
+    if ensure_ascii:
+        return StringCodec(decode_string_match, unescape_char_match, decode_char,
+                           escape_char_match, encode_char,
+                           decode_string_match_bytes=decode_string_match_bytes,
+                           escape_table=EscapeTable(escape_char_match, encode_char),
+                           name=name)
+    return StringCodec(decode_string_match_unicode, unescape_char_match, decode_char,
+                       escape_char_match_unicode, encode_char,
+                       decode_string_match_bytes=decode_string_match_unicode_bytes,
+                       escape_table=EscapeTable(escape_char_match_unicode, encode_char),
+                       name=name)
+
+pystringcodec = makepystringcodec()
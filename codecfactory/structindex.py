@@ -0,0 +1,246 @@
+#!/usr/bin/python
+from codecfactory.codecset import CodecSet
+from codecfactory.listcodec import ListCodec
+from codecfactory.dictcodec import DictCodec
+from codecfactory.stringcodec import StringCodec, pystringcodec
+from codecfactory.compiler import CompiledCodec
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ["StructIndex", "delimiters"]
+
+def _reachable(codec, found):
+    if any(codec is other for other in found):
+        return
+    found.append(codec)
+
+    children = []
+    if isinstance(codec, CodecSet):
+        children.extend(codec.codecs)
+    elif isinstance(codec, DictCodec):
+        children.extend([codec.key_codec, codec.item_codec, pystringcodec])
+        children.extend(codec.codecs_by_key.values())
+    elif isinstance(codec, ListCodec):
+        children.append(codec.item_codec)
+        children.extend(codec.codecs_by_index.values())
+    elif isinstance(codec, CompiledCodec):
+        children.append(codec.codec)
+
+    for child in children:
+        _reachable(child, found)
+
+def delimiters(codec):
+    """
+    Returns the delimiters of the containers and strings reachable from codec (codec included), as a tuple of
+    sets (brackets, quotes, separators): 'brackets' holds the (begin_delim, end_delim) pairs of ListCodecs and
+    DictCodecs, 'quotes' the (begin_delim, end_delim) pairs of StringCodecs, and 'separators' the item_delims
+    and key_delims of ListCodecs and DictCodecs. Returns None if a StringCodec does not escape characters with
+    a backslash.
+    """
+    found = []
+    _reachable(codec, found)
+
+    brackets = set()
+    quotes = set()
+    separators = set()
+    for child in found:
+        if isinstance(child, StringCodec):
+            if not child.unescape_char_match.pattern.startswith("\\\\"):
+                return None
+            quotes.add((child.begin_delim, child.end_delim))
+        elif isinstance(child, ListCodec):
+            brackets.add((child.begin_delim, child.end_delim))
+            separators.add(child.item_delim)
+            if isinstance(child, DictCodec):
+                separators.add(child.key_delim)
+
+    return brackets, quotes, separators
+
+class StructIndex(object):
+    """
+    Structural index of a document, computed in blocks with NumPy in the manner of the first stage of simdjson:
+    the positions of newlines, of the string delimiters that are not escaped, and of the delimiters of ListCodecs
+    and DictCodecs that lie outside of strings.
+
+    NumPy is an optional dependency of codecfactory, needed only by StructIndex: it is not installed along with
+    codecfactory, and constructing a StructIndex without it raises ImportError. Nothing else imports it, and
+    paralleldecode only uses a StructIndex when one is passed to it.
+
+    'data': The entire document, as a str, a bytes-like object or an mmap object. Positions are offsets into
+        data (characters for a str, bytes otherwise), i.e., absolute offsets as reported by a ReadBuffer that
+        holds data from its beginning.
+    'codec': The codec the document is decoded with, from which the delimiters are found (see delimiters).
+        Every delimiter must be a single character, and all strings must be delimited by the same character.
+
+    Attributes:
+    'newlines': Sorted array of the positions of newline characters.
+    'quotes': Sorted array of the positions of the string delimiters that are not escaped.
+    'positions': Sorted array of the positions of structural characters: the delimiters in quotes, and the
+        delimiters of ListCodecs and DictCodecs outside of strings.
+    'chars': Array of the characters (as ordinals) at positions.
+    'depth': Array of the nesting depth of the containers after each structural character.
+
+    Pass a StructIndex to a ReadBuffer holding data (as ReadBuffer(None, data, index=index)) so that
+    ReadBuffer.abspos looks up line numbers by binary search instead of counting newlines.
+    """
+    blocksize = 1 << 22
+
+    def __init__(self, data, codec):
+        if numpy is None:
+            raise ImportError("StructIndex requires NumPy, an optional dependency of codecfactory (pip install numpy).")
+
+        found = delimiters(codec)
+        if found is None:
+            raise ValueError("Cannot index strings that are not escaped with a backslash.")
+        brackets, quotes, separators = found
+
+        quotechars = set(begin_delim for (begin_delim, end_delim) in quotes) | set(end_delim for (begin_delim, end_delim) in quotes)
+        delims = set(separators)
+        for begin_delim, end_delim in brackets:
+            delims.update((begin_delim, end_delim))
+        delims.discard("")
+
+        if len(quotechars) > 1 or any(len(delim) != 1 for delim in delims | quotechars):
+            raise ValueError("Cannot index delimiters that are not single characters, or strings delimited by "
+                             "different characters.")
+        if any(begin_delim == end_delim for (begin_delim, end_delim) in brackets) or delims & quotechars:
+            raise ValueError("Cannot index ambiguous delimiters.")
+
+        self.length = len(data)
+        self.binary = not isinstance(data, str)
+        dtype = numpy.uint8 if self.binary else numpy.uint32
+        quote = ord(quotechars.pop()) if quotechars else None
+        delimcodes = numpy.array(sorted(ord(delim) for delim in delims), dtype=dtype)
+
+        if self.binary:
+            isdelim = numpy.zeros(256, dtype=bool)
+            isdelim[delimcodes] = True
+        else:
+            isdelim = None
+
+        newlines = []
+        quotepositions = []
+        candidates = []
+        candidatechars = []
+
+        for start in range(0, self.length, self.blocksize):
+            if self.binary:
+                block = numpy.frombuffer(data, dtype=numpy.uint8, count=min(self.blocksize, self.length - start), offset=start)
+                found = numpy.flatnonzero(isdelim[block])
+            else:
+                block = numpy.frombuffer(data[start:start + self.blocksize].encode("utf-32-le"), dtype=numpy.uint32)
+                found = numpy.flatnonzero(numpy.isin(block, delimcodes))
+
+            newlines.append(numpy.flatnonzero(block == 10) + start)
+            candidates.append(found + start)
+            candidatechars.append(block[found])
+
+            if quote is not None:
+                q = numpy.flatnonzero(block == quote)
+                # A quote is escaped if it is preceded by an odd number of backslashes. Those preceded by any are
+                # rare enough to be counted one by one.
+                preceded = q[q > 0]
+                preceded = (preceded[block[preceded - 1] == 92] + start).tolist()
+                if len(q) and q[0] == 0 and start and self._backslashes(data, start):
+                    preceded.insert(0, start)
+                q += start
+                if preceded:
+                    escaped = [k for k in preceded if self._backslashes(data, k) % 2]
+                    q = numpy.setdiff1d(q, numpy.array(escaped, dtype=q.dtype), assume_unique=True)
+                quotepositions.append(q)
+
+        empty = numpy.zeros(0, dtype=numpy.int64)
+        self.newlines = numpy.concatenate(newlines) if newlines else empty
+        self.quotes = numpy.concatenate(quotepositions) if quotepositions else empty
+        candidates = numpy.concatenate(candidates) if candidates else empty
+        candidatechars = numpy.concatenate(candidatechars) if candidatechars else numpy.zeros(0, dtype=dtype)
+
+        # Delimiters outside of strings are preceded by an even number of quotes.
+        outside = numpy.searchsorted(self.quotes, candidates) % 2 == 0
+        positions = numpy.concatenate((candidates[outside], self.quotes))
+        chars = numpy.concatenate((candidatechars[outside], numpy.full(len(self.quotes), quote or 0, dtype=dtype)))
+        order = numpy.argsort(positions, kind="stable")
+        self.positions = positions[order]
+        self.chars = chars[order]
+
+        delta = numpy.zeros(len(self.positions), dtype=numpy.int64)
+        for begin_delim, end_delim in brackets:
+            if begin_delim:
+                delta[self.chars == ord(begin_delim)] += 1
+            if end_delim:
+                delta[self.chars == ord(end_delim)] -= 1
+        self.depth = numpy.cumsum(delta)
+        self._delta = delta
+        self._quote = quote
+        self._closers = None
+
+    def _backslashes(self, data, position):
+        """Number of consecutive backslashes before position."""
+        backslash = 92 if self.binary else "\\"
+        count = 0
+        while position > count and data[position - count - 1] == backslash:
+            count += 1
+        return count
+
+    def abspos(self, offset):
+        """Returns the (line, character) position of offset, both starting at 1, as ReadBuffer.abspos does."""
+        lines = int(numpy.searchsorted(self.newlines, offset))
+        if lines:
+            return (lines + 1, offset - int(self.newlines[lines - 1]))
+        return (1, offset + 1)
+
+    def next(self, offset):
+        """Returns the position of the first structural character at or after offset, or None."""
+        k = int(numpy.searchsorted(self.positions, offset))
+        if k < len(self.positions):
+            return int(self.positions[k])
+        return None
+
+    def skip(self, offset):
+        """
+        If offset is the position of a string delimiter or of the begin_delim of a container, returns the position
+        just past the matching delimiter, or None if there is none (or if offset is anything else).
+        """
+        k = int(numpy.searchsorted(self.positions, offset))
+        if k >= len(self.positions) or self.positions[k] != offset:
+            return None
+
+        if self._delta[k] == 0:
+            if self.chars[k] != self._quote:
+                return None
+            q = int(numpy.searchsorted(self.quotes, offset))
+            if q % 2 == 0 and q + 1 < len(self.quotes):
+                return int(self.quotes[q + 1]) + 1
+            return None
+
+        if self._delta[k] < 0:
+            return None
+
+        if self._closers is None:
+            # The container opened at depth d (after its begin_delim) is closed by the first end_delim after it
+            # that leaves depth d - 1 behind.
+            closers = numpy.flatnonzero(self._delta < 0)
+            keys = self.depth[closers]*(self.length + 1) + self.positions[closers]
+            order = numpy.argsort(keys, kind="stable")
+            self._closers = closers[order], keys[order]
+
+        closers, keys = self._closers
+        depth = int(self.depth[k]) - 1
+        c = int(numpy.searchsorted(keys, depth*(self.length + 1) + offset))
+        if c < len(keys) and self.depth[closers[c]] == depth:
+            return int(self.positions[closers[c]]) + 1
+        return None
+
+    def toplevel(self, delim, start, stop=None):
+        """
+        Returns a sorted array of the positions of 'delim' between start and stop (the end of the data, if None)
+        that lie directly inside the container whose begin_delim ends just before start.
+        """
+        first = int(numpy.searchsorted(self.positions, start))
+        last = len(self.positions) if stop is None else int(numpy.searchsorted(self.positions, stop))
+        depth = int(self.depth[first - 1]) if first else 0
+        selected = (self.chars[first:last] == ord(delim)) & (self.depth[first:last] == depth)
+        return self.positions[first:last][selected]
@@ -0,0 +1,73 @@
+#!/usr/bin/python
+from codecfactory.readbuffer import isbinaryfile
+
+__all__ = ["WriteBuffer", "FragmentWriter", "fragmentwriter"]
+
+class WriteBuffer(object):
+    """
+    Class used to wrap around a binary file or file-like object (or a bytearray) so that codecs, which
+    write str data, can encode directly to it without the need for io.TextIOWrapper.
+    """
+    def __init__(self, file, encoding="utf-8", errors="strict"):
+        self._file = file
+        self.encoding = encoding
+        self.errors = errors
+
+    def write(self, data):
+        data = data.encode(self.encoding, self.errors)
+        if isinstance(self._file, bytearray):
+            self._file += data
+            return len(data)
+        return self._file.write(data)
+
+class FragmentWriter(object):
+    """
+    Class used by the encode methods of codecs to collect the str fragments they write. The fragments
+    are joined once, either when the result is requested with getvalue, or, if 'file' is specified,
+    when at least 'blocksize' characters have been collected and when flush is called, in which case
+    they are written to file in a single call.
+    """
+    blocksize = 65536
+
+    def __init__(self, file=None, blocksize=None):
+        self._file = file
+        self._fragments = []
+        self._size = 0
+        if blocksize is not None:
+            self.blocksize = int(blocksize)
+        if file is None:
+            # Nothing to flush to, so writing is just appending.
+            self.write = self._fragments.append
+
+    def write(self, data):
+        self._fragments.append(data)
+        self._size += len(data)
+        if self._size >= self.blocksize:
+            self.flush()
+        return len(data)
+
+    def getvalue(self):
+        value = "".join(self._fragments)
+        self._fragments[:] = [value]
+        return value
+
+    def flush(self):
+        """Writes the collected fragments to file."""
+        if self._file is not None and self._fragments:
+            self._file.write("".join(self._fragments))
+            del self._fragments[:]
+            self._size = 0
+
+def fragmentwriter(file):
+    """
+    Returns the FragmentWriter that encoded data meant for 'file' is written to: file itself if it is
+    a FragmentWriter, otherwise a new FragmentWriter over file (through a WriteBuffer if file is a
+    binary file object or a bytearray), or one that only collects the data if file is None.
+    """
+    if isinstance(file, FragmentWriter):
+        return file
+    elif file is None:
+        return FragmentWriter()
+    elif isinstance(file, bytearray) or isbinaryfile(file):
+        return FragmentWriter(WriteBuffer(file))
+    return FragmentWriter(file)
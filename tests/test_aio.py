@@ -0,0 +1,152 @@
+#!/usr/bin/python
+"""
+Tests for adecodeone, aiterdecode and aencode: objects must be decoded as iterdecode decodes them however the
+data is split into reads, as soon as they have arrived, and aencode must write what encode returns, in blocks,
+awaiting drain after each.
+"""
+import asyncio
+import unittest
+
+from codecfactory import (AsyncReadBuffer, FragmentWriter, ListCodec, pystringcodec, adecodeone, aiterdecode,
+                          aencode, DecodeError, NoMatch, EncodeError)
+from codecfactory.jsoncodec import jsoncodec
+
+RECORDS = [{"id": 1, "name": "café \"\\", "tags": ["a", [], {}]}, [1, -2.5, None, True], "plain", 12345, [],
+           {"nested": {"x": [[1, 2], {"y": "z" * 300}]}}]
+
+def outcome(f, *args):
+    try:
+        return "ok", f(*args)
+    except (DecodeError, NoMatch, EncodeError) as exc:
+        return type(exc).__name__, str(exc)
+
+async def feed(reader, data, size):
+    for start in range(0, len(data), size):
+        reader.feed_data(data[start:start + size])
+        await asyncio.sleep(0)
+    reader.feed_eof()
+
+async def collect(codec, data, size, spans=False):
+    """Decodes data with aiterdecode, fed to a StreamReader 'size' bytes at a time."""
+    reader = asyncio.StreamReader()
+    feeding = asyncio.ensure_future(feed(reader, data, size))
+    try:
+        return "ok", [obj async for obj in aiterdecode(codec, reader, spans)]
+    except (DecodeError, NoMatch) as exc:
+        return type(exc).__name__, str(exc)
+    finally:
+        await feeding
+
+class Writer(object):
+    """Stands in for an asyncio.StreamWriter."""
+    def __init__(self):
+        self.writes = []
+        self.drains = 0
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+
+    async def drain(self):
+        self.drains += 1
+        await asyncio.sleep(0)
+
+class Unencodable(object):
+    pass
+
+class Decode(unittest.TestCase):
+    def test_aiterdecode(self):
+        data = "".join(jsoncodec.encode(obj, indent=indent) + "\n"
+                       for obj, indent in zip(RECORDS, ["", "  "]*3)).encode("utf-8")
+        expected = list(jsoncodec.iterdecode(data, True))
+        for size in (1, 3, 50, len(data)):
+            self.assertEqual(asyncio.run(collect(jsoncodec, data, size, True)), ("ok", expected), size)
+            self.assertEqual(asyncio.run(collect(jsoncodec, data, size)), ("ok", RECORDS), size)
+
+    def test_errors(self):
+        for data in [b'[1, 2}\n', b'[1, 2', b'{"a": 1}\n{"a" 1}', b'"\\q"', b'[1] @', b'"caf\xc3']:
+            expected = outcome(lambda: list(jsoncodec.iterdecode(data)))
+            for size in (1, 4, len(data)):
+                self.assertEqual(asyncio.run(collect(jsoncodec, data, size)), expected, data)
+
+    def test_as_soon_as_arrived(self):
+        async def run():
+            reader = asyncio.StreamReader()
+            objects = aiterdecode(jsoncodec, reader)
+            reader.feed_data(b'{"a": "b"}\n[1, ')
+            self.assertEqual(await asyncio.wait_for(objects.__anext__(), 1), {"a": "b"})
+            pending = asyncio.ensure_future(objects.__anext__())
+            await asyncio.sleep(0.01)
+            self.assertFalse(pending.done())
+            reader.feed_data(b'2]\n12')
+            self.assertEqual(await asyncio.wait_for(pending, 1), [1, 2])
+            # A number is only complete once what follows it (or the end of the stream) has arrived.
+            pending = asyncio.ensure_future(objects.__anext__())
+            await asyncio.sleep(0.01)
+            self.assertFalse(pending.done())
+            reader.feed_eof()
+            self.assertEqual(await asyncio.wait_for(pending, 1), 12)
+            self.assertEqual([obj async for obj in objects], [])
+
+        asyncio.run(run())
+
+    def test_adecodeone(self):
+        async def run():
+            reader = asyncio.StreamReader()
+            readbuf = AsyncReadBuffer(reader)
+            feeding = asyncio.ensure_future(feed(reader, b'  [["x"], ["y"]] ["z"]', 2))
+            codec = ListCodec(pystringcodec)
+            first = await adecodeone(ListCodec(codec), readbuf)
+            second = await adecodeone(codec, readbuf, first[1])
+            await feeding
+            return first[0], second[0]
+
+        self.assertEqual(asyncio.run(run()), ([["x"], ["y"]], ["z"]))
+
+class Encode(unittest.TestCase):
+    def encode(self, codec, obj, **kwargs):
+        writer = Writer()
+        asyncio.run(aencode(codec, obj, writer, **kwargs))
+        return writer
+
+    def test_equivalence(self):
+        codec = ListCodec(jsoncodec)
+        for obj in RECORDS + [RECORDS * 500]:
+            for kwargs in ({}, {"indent": "\t", "indentlevel": 1}, {"indentfirstline": False}):
+                for c in (codec, jsoncodec):
+                    writer = self.encode(c, [obj], **kwargs)
+                    self.assertEqual(b"".join(writer.writes), c.encode([obj], **kwargs).encode("utf-8"))
+
+    def test_blocks(self):
+        writer = self.encode(ListCodec(jsoncodec), RECORDS * 500)
+        self.assertGreater(len(writer.writes), 1)
+        self.assertTrue(all(len(block) <= FragmentWriter.blocksize for block in writer.writes))
+        self.assertEqual(writer.drains, len(writer.writes))
+
+    def test_error(self):
+        obj = RECORDS * 500 + [Unencodable()]
+        writer = Writer()
+        with self.assertRaises(EncodeError):
+            asyncio.run(aencode(ListCodec(jsoncodec), obj, writer))
+        # The blocks encoded before the error are written.
+        expected = ListCodec(jsoncodec).encode(RECORDS * 500).encode("utf-8")
+        self.assertTrue(expected.startswith(b"".join(writer.writes)))
+        self.assertGreater(len(writer.writes), 0)
+
+    def test_cancel(self):
+        async def run():
+            writer = Writer()
+            task = asyncio.ensure_future(aencode(ListCodec(jsoncodec), RECORDS * 5000, writer))
+            while len(writer.writes) < 2:
+                await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            written = len(writer.writes)
+            await asyncio.sleep(0.05)
+            return written, len(writer.writes)
+
+        written, after = asyncio.run(run())
+        self.assertEqual(written, after)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/python
+"""
+Tests for binary mode: decoding bytes, bytes-like objects and binary files must give the same results and raise
+the same errors as decoding the same data as str, and encoding to a binary file or bytearray must write the UTF-8
+encoding of what is written to a text file.
+"""
+import io
+import unittest
+
+import regex
+
+from codecfactory import (CodecSet, ListCodec, DictCodec, RegExCodec, pystringcodec, realcodec,
+                          ReadBuffer, DecodeError, NoMatch)
+from codecfactory.readbuffer import bytespattern
+from codecfactory.jsoncodec import jsoncodec
+
+def outcome(f, *args):
+    try:
+        result = f(*args)
+        if hasattr(result, "__next__"):
+            result = list(result)
+        return "ok", result
+    except (DecodeError, NoMatch) as exc:
+        return type(exc).__name__, str(exc)
+
+def makecodec():
+    """A codec that uses every primitive of ReadBuffer: regular expressions, delimiters and string values."""
+    word = RegExCodec(regex.compile(r"[a-z_]\w*"), hook=lambda s: ("word", s), allowedtype=tuple,
+                      unhook=lambda t: t[1])
+    values = CodecSet([realcodec, pystringcodec, word])
+    values.appendCodec(ListCodec(values, begin_delim="<", end_delim=">"))
+    values.appendCodec(DictCodec(pystringcodec, values, key_delim="=>"))
+    return values
+
+VALID = ['<1, -2.5, "caf\\u00e9\\n", word_1>', '{"a" => <3/4, "\\x41">, "b" => {}}', '  <\n  1,\n  2\n>  ',
+         '"%s"' % ("\\u4e2d" * 3000), '<<>, <<"x">>>']
+MALFORMED = ['<1, 2', '<1, 2}', '{"a" 1}', '"\\q"', '<1,, 2>', '"é"', '', '<1> x', '{"a" => 1, "a" => 2}']
+
+class BinaryDecode(unittest.TestCase):
+    def sources(self, data):
+        data = data.encode("utf-8")
+        return [data, bytearray(data), memoryview(data), io.BytesIO(data), ReadBuffer(io.BytesIO(data))]
+
+    def test_equivalence(self):
+        for codec in (makecodec(), jsoncodec):
+            for data in VALID + MALFORMED:
+                expected = outcome(codec.decode, data)
+                for source in self.sources(data):
+                    got = outcome(codec.decode, source)
+                    if expected[0] == "ok" or data.isascii():
+                        self.assertEqual(got, expected, (data[:20], type(source)))
+                    else:
+                        self.assertEqual(got[0], expected[0], (data[:20], type(source)))
+
+    def test_iterdecode(self):
+        codec = makecodec()
+        data = "\n".join(VALID) + "\n"
+        expected = [codec.decode(doc) for doc in VALID]
+        for source in self.sources(data):
+            self.assertEqual(list(codec.iterdecode(source)), expected)
+
+    def test_bytespattern(self):
+        pattern = regex.compile(r"\d+(?:\.\d*)?")
+        self.assertIs(bytespattern(pattern), bytespattern(pattern))
+        self.assertEqual(bytespattern(pattern).match(b"12.5x").group(), b"12.5")
+        self.assertRaises(TypeError, bytespattern, regex.compile(r"é+"))
+
+class BinaryEncode(unittest.TestCase):
+    def test_equivalence(self):
+        codec = makecodec()
+        for obj in [[1, "café\n", ("word", "x_1")], {"中": [[], {}]}, "\U0001f600" * 1000]:
+            for kwargs in ({}, {"indent": "\t", "indentlevel": 1}):
+                text = codec.encode(obj, **kwargs)
+                expected = text.encode("utf-8")
+                out = io.BytesIO()
+                codec.encode(obj, out, **kwargs)
+                self.assertEqual(out.getvalue(), expected)
+                buf = bytearray()
+                codec.encode(obj, buf, **kwargs)
+                self.assertEqual(bytes(buf), expected)
+                self.assertEqual(codec.decode(expected), codec.decode(text))
+
+if __name__ == "__main__":
+    unittest.main()
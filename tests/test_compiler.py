@@ -0,0 +1,184 @@
+#!/usr/bin/python
+"""
+Tests for compilecodec: compiled codecs must decode and encode exactly as the codecs they were compiled from,
+and subclasses of the codecs that are specialized must keep their own methods.
+"""
+import io
+import unittest
+
+import regex
+
+from codecfactory import (CodecSet, ListCodec, DictCodec, RegExCodec, pystringcodec, intcodec, realcodec,
+                          compilecodec, KWARGS)
+from codecfactory.basecodec import NO_MATCH
+from codecfactory.compiler import CompiledCodec
+from codecfactory.jsoncodec import jsoncodec, jsoncodecsl
+
+def outcome(f, *args, **kwargs):
+    """Returns ("ok", result), or the type, message, offset and codec of the exception raised by f."""
+    try:
+        return "ok", f(*args, **kwargs)
+    except BaseException as exc:
+        return type(exc).__name__, str(exc), getattr(exc, "offset", None), getattr(exc, "codec", None)
+
+class Point(object):
+    def __init__(self, x, y=0):
+        self.x = x
+        self.y = y
+
+    def __eq__(self, other):
+        return isinstance(other, Point) and (self.x, self.y) == (other.x, other.y)
+
+def makecodecs():
+    """Returns the codecs compared with their compiled versions, by name."""
+    point = DictCodec(pystringcodec, jsoncodec, requireclasskey=True, allowedtype=Point, hook=Point,
+                      hook_mode=KWARGS, unhook=lambda p: {"x": p.x, "y": p.y}, required_args={"x"},
+                      optional_args={"y"}, allow_unknown=False)
+    schema = DictCodec(pystringcodec, jsoncodec, hook=Point, hook_mode=KWARGS, allowedtype=Point,
+                       unhook=lambda p: {"x": p.x, "y": p.y})
+    schema.addArgument("x", intcodec)
+    schema.addArgument("y", jsoncodec, required=False)
+    pair = ListCodec(jsoncodec, codecs_by_index={0: intcodec, 1: pystringcodec}, hook=tuple, allowedtype=tuple,
+                     begin_delim="(", end_delim=")")
+    strict = DictCodec(pystringcodec, jsoncodec, codecs_by_key={"n": intcodec}, required_args={"n", "m"},
+                       optional_args={"o"}, allow_unknown=False)
+    failing = ListCodec(RegExCodec(regex.compile(r"\d+"), hook=lambda s: 1 // 0), begin_delim="<", end_delim=">")
+    return [
+        ("jsoncodec", jsoncodec),
+        ("jsoncodecsl", jsoncodecsl),
+        ("realcodec", realcodec),
+        ("point", point),
+        ("schema", schema),
+        ("keep", DictCodec(pystringcodec, jsoncodec, keep={"a"}, required_args={"n"})),
+        ("mixed", CodecSet([point, pair, strict, failing, schema, jsoncodec])),
+    ]
+
+VALID = [
+    '[1, 2.5, "x", true, false, null]', '{"a": {"b": [1, {"c": []}]}, "n": 0}', '  [ 1 ,2 ]  ', '"s\\x41\\n"',
+    '-12', '3/4', '1.5e3', '[[[]], {}]', '{"class": "%s.Point", "x": 1}' % __name__, '{"x": 1, "y": [2]}',
+    '{"x": 1}', '(1, "a", [true])', '{"n": 1, "m": 2, "o": 3}', '{"a": [1, {"b": 2}], "n": 3}', '[\n  1,\n  2\n]',
+]
+
+MALFORMED = [
+    '[1, 2', '[1, 2}', '{"a" 1}', '[1,, 2]', '[1 2]', '"unterminated', '', '   ', '[1] x', '{"a": 1, "a": 2}',
+    '{"class": "%s.Point", "x": 1, "z": 0}' % __name__, '{"class": "other.Point", "x": 1}', '{"y": 1}', '{}',
+    '("a", 1)', '{"n": "1", "m": 2}', '{"n": 1}', '{"n": 1, "m": 2, "q": 1}', '<1, 2>', '{"x": "1"}',
+    '{"class" 1}', '{"a": @, "n": 1}', '[1, {"a": [2, 3}]', 'tru', '1/', '{"x": 1, "y": 2, "z": 3}',
+]
+
+OBJECTS = [[1, 2.5, "x", None], {"a": [1, {"b": True}]}, Point(1, [2, 3]), (5, "x", None), {"n": 1, "m": [2]},
+           "quote\" and \\", 3, object()]
+
+class CompiledEquivalence(unittest.TestCase):
+    """Compiled codecs against the codecs they were compiled from, on valid and malformed input."""
+    lexer = False
+
+    def sources(self, data):
+        return [data, io.StringIO(data), data.encode("utf-8"), io.BytesIO(data.encode("utf-8"))]
+
+    def test_decode(self):
+        for name, codec in makecodecs():
+            compiled = compilecodec(codec, lexer=self.lexer)
+            for data in VALID + MALFORMED:
+                for source, other in zip(self.sources(data), self.sources(data)):
+                    self.assertEqual(outcome(compiled.decode, source), outcome(codec.decode, other),
+                                     "%s: %r" % (name, source))
+
+    def test_iterdecode(self):
+        data = "\n".join(VALID) + "\n[1, 2\n"
+        for name, codec in makecodecs():
+            compiled = compilecodec(codec, lexer=self.lexer)
+            for spans in (False, True):
+                for source, other in zip(self.sources(data), self.sources(data)):
+                    expected = []
+                    outcome(lambda: expected.extend(codec.iterdecode(other, spans)))
+                    got = []
+                    outcome(lambda: got.extend(compiled.iterdecode(source, spans)))
+                    self.assertEqual(got, expected, name)
+                self.assertEqual(outcome(list, compiled.iterdecode(data, spans)),
+                                 outcome(list, codec.iterdecode(data, spans)), name)
+
+    def test_encode(self):
+        for name, codec in makecodecs():
+            compiled = compilecodec(codec, lexer=self.lexer)
+            for obj in OBJECTS:
+                for kwargs in ({}, {"indent": "\t", "indentlevel": 2}, {"indentfirstline": False}):
+                    self.assertEqual(outcome(compiled.encode, obj, **kwargs), outcome(codec.encode, obj, **kwargs),
+                                     "%s: %r" % (name, obj))
+                    got, expected = bytearray(), bytearray()
+                    outcome(compiled.encode, obj, got, **kwargs)
+                    outcome(codec.encode, obj, expected, **kwargs)
+                    self.assertEqual(got, expected)
+
+class CompiledLexerEquivalence(CompiledEquivalence):
+    """The same, with the terminals of each CodecSet fused into one regular expression."""
+    lexer = True
+
+    def test_alternatives_in_order(self):
+        # Earlier children win even where a later one would match more of the data.
+        words = RegExCodec(regex.compile(r"[a-z]+"), hook=lambda s: ("word", s))
+        short = RegExCodec(regex.compile(r"ab"), hook=lambda s: ("short", s))
+        codec = ListCodec(CodecSet([intcodec, short, words, pystringcodec, realcodec]))
+        for data in ['[1, ab, abc, "ab", 2.5, x]', '[ab]', '[1.5e3, 7]', '[abc, "unterminated]', '[@]']:
+            self.assertEqual(outcome(compilecodec(codec, lexer=True).decode, data), outcome(codec.decode, data),
+                             data)
+
+class UpperDictCodec(DictCodec):
+    """Reimplements _decode_item, which the compiled decoder of a DictCodec does not call."""
+    def _decode_item(self, readbuf, offset=0, key=None, discardbufferdata=None):
+        result = DictCodec._decode_item(self, readbuf, offset, key, discardbufferdata)
+        if result is not NO_MATCH and isinstance(result[0], str):
+            return result[0].upper(), result[1]
+        return result
+
+class CountingDictCodec(DictCodec):
+    """Counts the calls to _decode_from."""
+    calls = 0
+
+    def _decode_from(self, *args, **kwargs):
+        self.calls += 1
+        return DictCodec._decode_from(self, *args, **kwargs)
+
+class OwnDecodeCodec(ListCodec):
+    """Reimplements _trydecodeone, which must then be called as is."""
+    def _trydecodeone(self, readbuf, offset=0, discardbufferdata=None):
+        result = ListCodec._trydecodeone(self, readbuf, offset, discardbufferdata)
+        if result is NO_MATCH:
+            return result
+        return ("own", result[0]), result[1]
+
+class CompiledSubclasses(unittest.TestCase):
+    def test_reimplemented_item_method(self):
+        codec = ListCodec(UpperDictCodec(pystringcodec, jsoncodec))
+        data = '[{"a": "x", "b": [1]}, {"c": "y"}]'
+        self.assertEqual(codec.decode(data), [{"a": "X", "b": [1]}, {"c": "Y"}])
+        self.assertEqual(compilecodec(codec).decode(data), codec.decode(data))
+
+    def test_inherited_methods_run(self):
+        child = CountingDictCodec(pystringcodec, intcodec)
+        compiled = compilecodec(ListCodec(child))
+        self.assertEqual(compiled.decode('[{"a": 1}, {"b": 2}]'), [{"a": 1}, {"b": 2}])
+        self.assertEqual(child.calls, 2)
+
+    def test_no_schema_slots_for_subclasses(self):
+        # The subclass is decoded through its own methods, even with a schema that DictCodec would compile.
+        codec = UpperDictCodec(pystringcodec, jsoncodec, hook=Point, hook_mode=KWARGS)
+        codec.addArgument("x", pystringcodec)
+        codec.addArgument("y", intcodec, required=False)
+        data = '{"x": "a", "y": 2}'
+        self.assertEqual(codec.decode(data), Point("A", 2))
+        self.assertEqual(compilecodec(codec).decode(data), Point("A", 2))
+        self.assertEqual(outcome(compilecodec(codec).decode, '{"y": 2}'), outcome(codec.decode, '{"y": 2}'))
+
+    def test_reimplemented_trydecodeone(self):
+        codec = CodecSet([OwnDecodeCodec(intcodec), intcodec])
+        self.assertEqual(compilecodec(codec).decode("[1, 2]"), ("own", [1, 2]))
+        self.assertEqual(compilecodec(codec).decode("3"), 3)
+
+    def test_compiled_codec_wraps(self):
+        codec = compilecodec(jsoncodec)
+        self.assertIsInstance(codec, CompiledCodec)
+        self.assertIs(codec.codec, jsoncodec)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/python
+"""
+Tests for DictCodec: the keep= projection, which must accept and reject the same documents as decoding every
+entry (except for the contents of the lists and dicts it skips), and the validation of keys.
+"""
+import unittest
+
+from codecfactory import DictCodec, ListCodec, pystringcodec, intcodec, compilecodec, DecodeError, NoMatch, KWARGS
+from codecfactory.jsoncodec import jsoncodec
+
+def outcome(codec, data):
+    try:
+        return "ok", codec.decode(data)
+    except (DecodeError, NoMatch) as exc:
+        return type(exc).__name__, str(exc)
+
+class Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+class DictCodecKeep(unittest.TestCase):
+    def setUp(self):
+        self.full = DictCodec(pystringcodec, jsoncodec, required_args={"r"}, optional_args={"a", "b", "c"})
+        self.keep = DictCodec(pystringcodec, jsoncodec, required_args={"r"}, optional_args={"a", "b", "c"},
+                              keep={"b"})
+
+    def test_projection(self):
+        for codec in (self.keep, compilecodec(self.keep)):
+            self.assertEqual(codec.decode('{"r": 0, "a": [1, {"x": "y,}"}], "b": 2, "c": "s"}'), {"r": 0, "b": 2})
+            self.assertEqual(codec.decode('{"a": {"b": 1}, "r": null, "c": true}'), {"r": None})
+
+    def test_notify_decode(self):
+        seen = []
+        codec = DictCodec(pystringcodec, jsoncodec, keep={"b"}, notify_decode=lambda key, value: seen.append(key))
+        codec.decode('{"a": 1, "b": 2, "c": [3]}')
+        self.assertEqual(seen, ["b"])
+
+    def test_invalid_dropped_values(self):
+        # Values that are not a single token or group are rejected whether they are kept or not.
+        for data in ['{"r": 0, "a": @@@, "b": 1}', '{"r": 0, "a": tru, "b": 2}', '{"r": 0, "a": 1 2, "b": 2}',
+                     '{"r": 0, "a": [1] [2]}', '{"r": 0, "a": "x" "y"}', '{"r": 0, "a": [1, 2}', '{"r": 0, "a": }']:
+            self.assertEqual(outcome(self.full, data)[0], "DecodeError", data)
+            self.assertEqual(outcome(self.keep, data)[0], "DecodeError", data)
+            self.assertEqual(outcome(compilecodec(self.keep), data)[0], "DecodeError", data)
+
+    def test_dropped_containers_not_validated(self):
+        # The contents of the lists and dicts that are skipped are only checked for balanced delimiters.
+        data = '{"r": 0, "a": [1, @@@, {"x" 2}], "b": 1}'
+        self.assertEqual(outcome(self.full, data)[0], "DecodeError")
+        self.assertEqual(self.keep.decode(data), {"r": 0, "b": 1})
+
+    def test_keys_still_checked(self):
+        for data in ['{"r": 0, "a": 1, "a": 2}', '{"a": 1}', '{"r": 0, "z": 1}']:
+            strict = DictCodec(pystringcodec, jsoncodec, required_args={"r"}, optional_args={"a"},
+                               allow_unknown=False)
+            projected = DictCodec(pystringcodec, jsoncodec, required_args={"r"}, optional_args={"a"},
+                                  allow_unknown=False, keep=())
+            self.assertEqual(outcome(strict, data), outcome(projected, data), data)
+
+    def test_non_json_terminals(self):
+        codec = ListCodec(DictCodec(pystringcodec, intcodec, keep={"b"}))
+        self.assertEqual(codec.decode('[{"a": 1, "b": 2}, {"a": -3}]'), [{"b": 2}, {}])
+        self.assertEqual(outcome(codec, '[{"a": x, "b": 2}]')[0], "DecodeError")
+
+class DictCodecClassKey(unittest.TestCase):
+    def test_requireclasskey(self):
+        codec = DictCodec(pystringcodec, intcodec, allowedtype=Point, requireclasskey=True, hook=Point,
+                          hook_mode=KWARGS)
+        point = codec.decode('{"class": "%s.Point", "x": 1, "y": 2}' % __name__)
+        self.assertEqual((point.x, point.y), (1, 2))
+        self.assertEqual(outcome(codec, '{"x": 1, "y": 2}')[0], "DecodeError")
+        self.assertEqual(outcome(codec, '{"class": "other.Point", "x": 1, "y": 2}')[0], "NoMatch")
+        self.assertEqual(outcome(codec, '{}')[0], "DecodeError")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+"""
+Tests for iterdecode: each object must be yielded as soon as it is decoded, with spans that locate it in the input,
+and decoding must be resumable from the end of any span.
+"""
+import io
+import unittest
+
+from codecfactory import DecodeError, UnexpectedEndOfData
+from codecfactory.jsoncodec import jsoncodec
+
+RECORDS = ['{"id": 1, "tags": ["a", "b"]}', '[1, 2.5, null]', '"plain"', '{"nested": {"x": [[], {}]}}', '42',
+           '{"escaped": "\\u00e9\\n"}']
+
+class ClosingReader(io.StringIO):
+    """Fails the test if a line starting at or past 'limit' is read."""
+    def __init__(self, data, limit):
+        io.StringIO.__init__(self, data)
+        self.limit = limit
+
+    def readline(self, size=-1):
+        if self.tell() >= self.limit:
+            raise AssertionError("read past %d" % self.limit)
+        return io.StringIO.readline(self, size)
+
+class IterDecode(unittest.TestCase):
+    def test_spans(self):
+        for sep in ("\n", "  ", "\r\n\t", ""):
+            data = sep.join(RECORDS) + sep
+            for source in (data, io.StringIO(data), data.encode("utf-8"), io.BytesIO(data.encode("utf-8"))):
+                results = list(jsoncodec.iterdecode(source, spans=True))
+                self.assertEqual([obj for obj, span in results], [jsoncodec.decode(r) for r in RECORDS])
+                self.assertEqual([data[start:end] for obj, (start, end) in results], RECORDS)
+                self.assertEqual(list(jsoncodec.iterdecode(data)), [obj for obj, span in results])
+
+    def test_resume(self):
+        data = "\n".join(RECORDS).encode("utf-8")
+        spans = [span for obj, span in jsoncodec.iterdecode(data, spans=True)]
+        for k, (start, end) in enumerate(spans):
+            f = io.BytesIO(data)
+            f.seek(end)
+            rest = list(jsoncodec.iterdecode(f, spans=True))
+            self.assertEqual([obj for obj, span in rest], [jsoncodec.decode(r) for r in RECORDS[k + 1:]])
+            # Offsets then count from the position the file was seeked to.
+            self.assertEqual([(s + end, e + end) for obj, (s, e) in rest], spans[k + 1:])
+
+    def test_incremental(self):
+        # The first object is yielded before the rest of the input is read (but for the lookahead of regex_op).
+        data = "\n".join(RECORDS) + "\n" + "[" * 100000
+        source = ClosingReader(data, len("\n".join(RECORDS)) + 1)
+        self.assertEqual(next(jsoncodec.iterdecode(source)), jsoncodec.decode(RECORDS[0]))
+
+    def test_errors(self):
+        data = "\n".join(RECORDS[:3]) + '\n{"a": [1, }\n' + RECORDS[3]
+        got = []
+        with self.assertRaises(DecodeError) as cm:
+            got.extend(jsoncodec.iterdecode(io.StringIO(data)))
+        self.assertEqual(got, [jsoncodec.decode(r) for r in RECORDS[:3]])
+        self.assertEqual(cm.exception.offset, data.index("}\n{"))
+        self.assertIn("line 4", str(cm.exception))
+
+        got = []
+        with self.assertRaises(UnexpectedEndOfData):
+            got.extend(jsoncodec.iterdecode(RECORDS[0] + "\n[1, 2"))
+        self.assertEqual(got, [jsoncodec.decode(RECORDS[0])])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+#!/usr/bin/python
+"""
+Conformance tests for JSONCodecSet: decode, iterdecode and encode must give the same results (and raise the
+same exceptions) whether the json module backend is used or the data is handled by the codec engine
+(CodecSet.decode, CodecSet.iterdecode and CodecSet.encode), including on every input and configuration that
+makes the backend fall back to the engine.
+"""
+import io
+import math
+import unittest
+
+from codecfactory import CodecSet, ListCodec, DictCodec, pystringcodec, realcodec, intcodec
+from codecfactory.basecodec import SINGLE
+from codecfactory.jsoncodec import JSONCodecSet, jsoncodec, jsoncodecsl, boolcodec, nonecodec
+
+def makejson(multiline=True, skip_whitespace_between_items=True, listoptions={}, dictoptions={}):
+    """Returns a JSONCodecSet built like jsoncodec, with 'listoptions' and 'dictoptions' passed to its children."""
+    codecset = JSONCodecSet([boolcodec, nonecodec, pystringcodec, realcodec])
+    codecset.appendCodec(ListCodec(codecset, multiline=multiline,
+                                   skip_whitespace_between_items=skip_whitespace_between_items, **listoptions))
+    codecset.appendCodec(DictCodec(pystringcodec, codecset, multiline=multiline,
+                                   skip_whitespace_between_items=skip_whitespace_between_items, **dictoptions))
+    return codecset
+
+def outcome(f, *args):
+    """Returns ("ok", result) or the type, message and offset of the exception raised by f(*args)."""
+    try:
+        result = f(*args)
+        if hasattr(result, "__next__"):
+            result = list(result)
+        return "ok", result
+    except BaseException as exc:
+        return type(exc).__name__, str(exc), getattr(exc, "offset", None)
+
+def same(a, b):
+    """Compares decoded objects, with NaN equal to itself and floats told apart from ints."""
+    if type(a) is not type(b):
+        return False
+    elif isinstance(a, float):
+        return a == b or (math.isnan(a) and math.isnan(b))
+    elif isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    elif isinstance(a, dict):
+        return list(a) == list(b) and all(same(a[key], b[key]) for key in a)
+    return a == b
+
+# Documents that the json module reads the same way as the codecs.
+PLAIN = [
+    '[]', '{}', '[1, 2, 3]', '{"a": 1, "b": [true, false, null]}', '"string"', '1.5', '-12', '0',
+    '[[[]], {"x": {"y": [{}]}}]', '{"class": "name", "value": 3}', '"tab\\tnewline\\n quote\\" backslash\\\\"',
+    '"\\u0041\\u00e9"', '[1.25e3, -0.5, 12345678901234567890]', '  [ 1 ,2 ]  ', '[\n  1,\n  2\n]',
+]
+
+# Documents for which the json module gives a different result (or none), so that the codec engine must be used.
+FALLBACK = [
+    # Python-style string escapes.
+    '"\\x41"', '"\\101"', '"\\a\\b\\f\\v"', '"\\/"', '"\\ud83d\\ude00"', '"\\q"',
+    # Characters that pystringcodec only accepts escaped.
+    '"caf\u00e9"', '["\u2603"]', '"\x7f"',
+    # NaN and Infinity.
+    'NaN', 'Infinity', '-Infinity', '[NaN, 1]', '{"a": Infinity}', 'nan', 'inf',
+    # Numbers outside of JSON.
+    '1e5', '3/4', '[1/2, 2.5]', '.5', '1.', '+1', '0x10',
+    # Dicts that DictCodec reads differently.
+    '{"a": 1, "a": 2}', '{"class": 1}', '{1: 2}',
+    # Malformed documents.
+    '[1, 2', '[1, 2}', '{"a" 1}', '[1,, 2]', '[1 2]', '"unterminated', '', '   ', 'true false', '[1] x',
+]
+
+# Documents with whitespace before delimiters, which jsoncodecsl does not skip.
+WHITESPACE = ['[1 , 2]', '[1\n]', '{"a" : 1}', '{"a": 1 }', '[ 1, 2]', '[1,\n2]', '{ "a":1}']
+
+RECORDS = ['1\n2\n3\n', '{"a": 1}\n{"b": [2]}\n', '[1]\n[2, 3] [4]\n', '"x"\n"y"', '1\n"\\x41"\n2\n',
+           '{"a": 1}\n{"a": 1, "a": 2}\n', '[1]\nNaN\n[2]\n', '1\n[2,\n', '1\n2 3/4\n', '']
+
+OBJECTS = [
+    [], {}, [1, 2.5, "x", True, False, None], {"a": [1, {"b": None}], "c": "d"}, "quote\" backslash\\ tab\t",
+    "caf\u00e9 \u2603", "control \x01 \x7f", [[], {}], {"class": "name"}, {"class": 1}, (1, 2), [float("nan")],
+    [float("inf")], 1e100, -0.0, 2**70, {1: 2}, {"a": {"b": {"c": []}}}, [1.5e-7, 3.0],
+]
+
+class JSONCodecSetConformance(unittest.TestCase):
+    codecs = [("jsoncodec", jsoncodec), ("jsoncodecsl", jsoncodecsl)]
+
+    def assertSameOutcome(self, a, b, msg):
+        if a[0] == "ok" and b[0] == "ok":
+            self.assertTrue(same(a[1], b[1]), "%s: %r != %r" % (msg, a[1], b[1]))
+        else:
+            self.assertEqual(a, b, msg)
+
+    def checkdecode(self, codec, documents):
+        for text in documents:
+            for data in (text, text.encode("utf-8")):
+                msg = "decode %r with %s" % (data, codec)
+                self.assertSameOutcome(outcome(codec.decode, data), outcome(CodecSet.decode, codec, data), msg)
+
+    def checkiterdecode(self, codec, documents):
+        for text in documents:
+            for data in (text, text.encode("utf-8")):
+                for spans in (False, True):
+                    msg = "iterdecode %r with %s (spans=%s)" % (data, codec, spans)
+                    self.assertSameOutcome(outcome(codec.iterdecode, data, spans),
+                                           outcome(CodecSet.iterdecode, codec, data, spans), msg)
+
+    def checkencode(self, codec, objects):
+        for obj in objects:
+            msg = "encode %r with %s" % (obj, codec)
+            self.assertSameOutcome(outcome(codec.encode, obj), outcome(CodecSet.encode, codec, obj), msg)
+            for file in (io.StringIO(), bytearray()):
+                other = io.StringIO() if isinstance(file, io.StringIO) else bytearray()
+                a = outcome(codec.encode, obj, file)
+                b = outcome(CodecSet.encode, codec, obj, other)
+                self.assertEqual(a[0], b[0], msg)
+                if isinstance(file, io.StringIO):
+                    self.assertEqual(file.getvalue(), other.getvalue(), msg)
+                else:
+                    self.assertEqual(file, other, msg)
+
+    def test_backend_in_use(self):
+        self.assertEqual(jsoncodec._jsonbackend(), (True, True))
+        self.assertEqual(jsoncodecsl._jsonbackend(), (False, False))
+        self.assertIsNotNone(makejson()._jsonbackend())
+
+    def test_plain(self):
+        for name, codec in self.codecs:
+            self.checkdecode(codec, PLAIN)
+            self.checkiterdecode(codec, PLAIN)
+
+    def test_fallback_input(self):
+        for name, codec in self.codecs:
+            self.checkdecode(codec, FALLBACK)
+            self.checkiterdecode(codec, FALLBACK)
+
+    def test_whitespace_before_delimiters(self):
+        for name, codec in self.codecs:
+            self.checkdecode(codec, WHITESPACE)
+            self.checkiterdecode(codec, WHITESPACE)
+
+    def test_records(self):
+        for name, codec in self.codecs:
+            self.checkiterdecode(codec, RECORDS)
+
+    def test_encode(self):
+        for name, codec in self.codecs:
+            self.checkencode(codec, OBJECTS)
+            for indent in ("", "\t"):
+                for obj in OBJECTS:
+                    self.assertSameOutcome(outcome(codec.encode, obj, None, indent),
+                                           outcome(CodecSet.encode, codec, obj, None, indent), repr(obj))
+            for indentlevel in (1, 2):
+                for obj in OBJECTS:
+                    self.assertSameOutcome(outcome(codec.encode, obj, None, "  ", indentlevel),
+                                           outcome(CodecSet.encode, codec, obj, None, "  ", indentlevel), repr(obj))
+
+    def test_roundtrip(self):
+        for name, codec in self.codecs:
+            for obj in OBJECTS:
+                result = outcome(codec.encode, obj)
+                if result[0] == "ok":
+                    self.assertSameOutcome(outcome(codec.decode, result[1]),
+                                           outcome(CodecSet.decode, codec, result[1]), repr(obj))
+
+class JSONCodecSetFallbackConfigurations(JSONCodecSetConformance):
+    """Configurations that the json module cannot stand in for: the backend must not be used."""
+    codecs = [
+        ("list hook", makejson(listoptions=dict(hook=tuple))),
+        ("dict hook", makejson(dictoptions=dict(hook=lambda d: sorted(d.items())))),
+        ("notify_decode", makejson(listoptions=dict(notify_decode=lambda *args: None))),
+        ("list delimiters", makejson(listoptions=dict(begin_delim="(", end_delim=")"))),
+        ("item delimiter", makejson(listoptions=dict(item_delim=";"), dictoptions=dict(item_delim=";"))),
+        ("key delimiter", makejson(dictoptions=dict(key_delim="="))),
+        ("required args", makejson(dictoptions=dict(required_args=("a",)))),
+        ("no unknown keys", makejson(dictoptions=dict(optional_args=("a", "b"), allow_unknown=False))),
+        ("class key", makejson(dictoptions=dict(requireclasskey=True))),
+        ("keep", makejson(dictoptions=dict(keep=("a",)))),
+        ("mixed whitespace", makejson(multiline=False, skip_whitespace_between_items=True)),
+    ]
+
+    def test_backend_in_use(self):
+        for name, codec in self.codecs:
+            if name != "mixed whitespace":
+                self.assertIsNone(codec._jsonbackend(), name)
+
+    def test_set_hook(self):
+        codec = makejson()
+        codec.hook = lambda obj: ("hooked", obj)
+        codec.hook_mode = SINGLE
+        self.assertIsNone(codec._jsonbackend())
+        self.assertEqual(codec.decode("[1]"), CodecSet.decode(codec, "[1]"))
+
+    def test_terminal_changed(self):
+        codec = JSONCodecSet([boolcodec, nonecodec, pystringcodec, intcodec])
+        codec.appendCodec(ListCodec(codec))
+        codec.appendCodec(DictCodec(pystringcodec, codec))
+        self.assertIsNone(codec._jsonbackend())
+        self.checkdecode(codec, ["[1, 2]", "[1.5]"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+"""
+Tests for lazydecode: proxies must hold the same items as the objects decode returns, decoding only those that
+are accessed, and data that decode rejects for its structure must be rejected up front with the same error.
+"""
+import io
+import unittest
+
+from codecfactory import (ListCodec, DictCodec, pystringcodec, intcodec, lazydecode, LazyList, LazyDict,
+                          DecodeError, NoMatch, KWARGS)
+from codecfactory.jsoncodec import jsoncodec
+
+def outcome(f, *args):
+    """Returns ("ok", result), or the type and message (which gives the line and character) of the exception."""
+    try:
+        return "ok", f(*args)
+    except (DecodeError, NoMatch) as exc:
+        return type(exc).__name__, str(exc)
+
+class Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def __eq__(self, other):
+        return isinstance(other, Point) and (self.x, self.y) == (other.x, other.y)
+
+def materialize(obj):
+    """Materializes obj and the proxies nested in it, through the lazy method."""
+    if isinstance(obj, LazyList):
+        return obj.codec.applyhook([materialize(obj.lazy(k)) for k in range(len(obj))])
+    if isinstance(obj, LazyDict):
+        return obj.codec.applyhook(obj.codec.dicttype((key, materialize(obj.lazy(key))) for key in obj))
+    return obj
+
+DOCUMENTS = [
+    '[1, "two", [3, [4]], {"five": 5, "six": [6]}, null, []]',
+    ' {"a": {"b": {"c": [1, 2, 3]}}, "d": "e", "f": [{}]} ',
+    '[]',
+    '{}',
+    '"not a container"',
+    '[\n  {"x": 1, "y": 2},\n  {"x": 3, "y": 4}\n]',
+]
+
+class LazyDecode(unittest.TestCase):
+    def test_equivalence(self):
+        for data in DOCUMENTS:
+            expected = jsoncodec.decode(data)
+            for source in (data, data.encode("utf-8"), io.StringIO(data), io.BytesIO(data.encode("utf-8"))):
+                obj = lazydecode(jsoncodec, source)
+                if isinstance(obj, (LazyList, LazyDict)):
+                    self.assertEqual(obj.materialize(), expected)
+                    self.assertEqual(materialize(obj), expected)
+                    self.assertEqual(len(obj), len(expected))
+                else:
+                    self.assertEqual(obj, expected)
+
+    def test_on_access(self):
+        data = jsoncodec.encode([{"id": k, "vals": [k]*3} for k in range(100)])
+        obj = lazydecode(jsoncodec, data)
+        self.assertEqual(obj.decoded, 0)
+        self.assertEqual(obj[42], {"id": 42, "vals": [42]*3})
+        self.assertEqual(obj[-1]["id"], 99)
+        self.assertEqual(obj.decoded, 2)
+        self.assertEqual(obj.lazy(7)["vals"], [7]*3)
+        start, end = obj.span(7)
+        self.assertEqual(jsoncodec.decode(data[start:end]), obj[7])
+        self.assertRaises(IndexError, obj.__getitem__, 100)
+
+    def test_item_codecs(self):
+        points = ListCodec(DictCodec(pystringcodec, intcodec, hook=Point, hook_mode=KWARGS), hook=tuple)
+        schema = DictCodec(pystringcodec, jsoncodec, codecs_by_key={"p": points})
+        data = '{"p": [{"x": 1, "y": 2}, {"x": 3, "y": 4}], "q": [5]}'
+        obj = lazydecode(schema, data)
+        self.assertEqual(obj["p"], (Point(1, 2), Point(3, 4)))
+        self.assertEqual(obj.lazy("p")[1], Point(3, 4))
+        self.assertEqual(obj.materialize(), schema.decode(data))
+
+    def test_errors(self):
+        strict = DictCodec(pystringcodec, jsoncodec, required_args={"a"}, allow_unknown=False, optional_args={"b"})
+        cases = [(jsoncodec, d) for d in ['[1, 2', '[1, [2, 3}]', '{"a": 1, "a": 2}', '[1] x', '[1,, 2]', '[1, @]',
+                                          '{"a" 1}', '[{"a": [1, {"b": 2]}]', '']]
+        cases += [(strict, d) for d in ['{"b": 1}', '{"a": 1, "c": 2}', '{"a": [1, }']]
+        for codec, data in cases:
+            expected = outcome(codec.decode, data)
+            self.assertNotEqual(expected[0], "ok", data)
+            self.assertEqual(outcome(lazydecode, codec, data), expected, data)
+
+    def test_unsupported_source(self):
+        self.assertRaises(TypeError, lazydecode, jsoncodec, 42)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+"""
+Tests for MmapReadBuffer: decoding a mapped file, in binary or text mode, must give the same results and raise the
+same errors (at the same positions) as decoding the contents of the file.
+"""
+import mmap
+import os
+import tempfile
+import unittest
+
+from codecfactory import MmapReadBuffer, DecodeError, NoMatch
+from codecfactory.jsoncodec import jsoncodec
+
+DOCUMENTS = [
+    '[1, "caf\\u00e9", {"a": [2.5, true, null]}]',
+    '{"\\u00e9t\\u00e9": "\\U0001f600", "b": "%s"}' % ("x" * 3000),
+    '[\n  "one",\n  [2, [3]]\n]',
+    '"%s"' % ("\\u00e9" * 2000),
+]
+
+def outcome(f, *args):
+    try:
+        result = f(*args)
+        if hasattr(result, "__next__"):
+            result = list(result)
+        return "ok", result
+    except (DecodeError, NoMatch) as exc:
+        return type(exc).__name__, str(exc)
+
+class MmapDecode(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def write(self, data):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(data)
+
+    def readbuffers(self):
+        # Blocks of 5 bytes split multibyte characters in text mode.
+        yield MmapReadBuffer(self.path, binary=True)
+        yield MmapReadBuffer(self.path, chunksize=5)
+        yield MmapReadBuffer(self.path)
+        with open(self.path, "rb") as f:
+            yield MmapReadBuffer(f, chunksize=64)
+            yield MmapReadBuffer(f, binary=True)
+
+    def test_iterdecode(self):
+        data = "\n".join(DOCUMENTS) + "\n"
+        self.write(data)
+        expected = [jsoncodec.decode(doc) for doc in DOCUMENTS]
+        for readbuf in self.readbuffers():
+            with readbuf:
+                self.assertEqual(list(jsoncodec.iterdecode(readbuf)), expected, readbuf.binary)
+
+    def test_errors(self):
+        # Characters outside ASCII must be escaped in strings, so these are errors (and split by 5-byte blocks).
+        for data in ['[1, "é",\n  @]', '{"a": [1, 2}', '[1,\n2', '"é\\q"', '[1] [2] x', '["ab", "中文"]']:
+            self.write(data)
+            expected = outcome(jsoncodec.iterdecode, data)
+            for readbuf in self.readbuffers():
+                with readbuf:
+                    got = outcome(jsoncodec.iterdecode, readbuf)
+                if readbuf.binary:
+                    # Positions are counted in bytes, so only the type of error is compared.
+                    self.assertEqual(got[0], expected[0], data)
+                else:
+                    self.assertEqual(got, expected, data)
+
+    def test_mmap_object(self):
+        self.write(DOCUMENTS[0])
+        with open(self.path, "rb") as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with MmapReadBuffer(m, binary=True) as readbuf:
+            self.assertEqual(jsoncodec.decode(readbuf), jsoncodec.decode(DOCUMENTS[0]))
+        # The mapping belongs to the caller, so it is left open.
+        self.assertFalse(m.closed)
+        m.close()
+
+    def test_empty_file(self):
+        self.write("")
+        for readbuf in self.readbuffers():
+            with readbuf:
+                self.assertEqual(list(jsoncodec.iterdecode(readbuf)), [])
+
+    def test_discard_releases(self):
+        # Discarding through a mapped file keeps offsets, line numbers and the data past the cursor consistent.
+        data = "".join("%d\n" % k for k in range(100000))
+        self.write(data)
+        for readbuf in (MmapReadBuffer(self.path, binary=True), MmapReadBuffer(self.path, chunksize=4096)):
+            with readbuf:
+                readbuf.chunksize = 4096
+                readbuf.atend(len(data) - 1)
+                offset = data.index("99990\n")
+                readbuf.discard(offset)
+                self.assertEqual(readbuf.abspos(0), (99991, 1))
+                self.assertEqual(readbuf[:6], b"99990\n" if readbuf.binary else "99990\n")
+                self.assertTrue(readbuf.string_match("99991", 6))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+"""
+Tests for the NoMatch protocol: built-in codecs must signal that they do not match by returning NO_MATCH rather
+than raising NoMatch, and codecs that implement either _decode or _trydecode must work alongside them.
+"""
+import unittest
+
+import regex
+
+from codecfactory import (BaseCodec, CodecSet, ListCodec, DictCodec, RegExCodec, ReadBuffer, pystringcodec,
+                          intcodec, realcodec, NoMatch, DecodeError, exc)
+from codecfactory.basecodec import NO_MATCH
+from codecfactory.jsoncodec import jsoncodec
+
+class CountNoMatch(object):
+    """Context manager counting the NoMatch exceptions created."""
+    def __enter__(self):
+        self.count = 0
+        self.init = exc.NoMatch.__init__
+
+        def init(instance, *args):
+            self.count += 1
+            self.init(instance, *args)
+
+        exc.NoMatch.__init__ = init
+        return self
+
+    def __exit__(self, *args):
+        exc.NoMatch.__init__ = self.init
+
+class RaisingCodec(BaseCodec):
+    """Implements _decode only, in the style of codecs written before NO_MATCH."""
+    def _decode(self, readbuf, offset=0, discardbufferdata=None):
+        if not readbuf.string_match("@", offset):
+            raise NoMatch(self)
+        return "at", offset + 1
+
+class ReturningCodec(BaseCodec):
+    """Implements _trydecode only."""
+    def _trydecode(self, readbuf, offset=0, discardbufferdata=None):
+        if not readbuf.string_match("#", offset):
+            return NO_MATCH
+        return "hash", offset + 1
+
+class OddIntCodec(RegExCodec):
+    """Reimplements _decode over a codec whose own decoding is done in _trydecode."""
+    def _decode(self, readbuf, offset=0, discardbufferdata=None):
+        obj, offset = RegExCodec._decode(self, readbuf, offset, discardbufferdata)
+        if int(obj) % 2 == 0:
+            raise NoMatch(self)
+        return obj, offset
+
+class Protocol(unittest.TestCase):
+    def test_builtin_codecs(self):
+        codecs = [intcodec, realcodec, pystringcodec, ListCodec(intcodec), DictCodec(pystringcodec, intcodec),
+                  CodecSet([intcodec, pystringcodec]), RegExCodec(regex.compile(r"\d+"), hook=int), jsoncodec]
+        for codec in codecs:
+            with CountNoMatch() as counter:
+                self.assertIs(codec._trydecodeone(ReadBuffer(None, "  x")), NO_MATCH, codec)
+            self.assertEqual(counter.count, 0, codec)
+            self.assertRaises(NoMatch, codec.decodeone, ReadBuffer(None, "x"))
+            self.assertRaises(NoMatch, codec.decode, "x")
+
+    def test_decoding_raises_nothing(self):
+        doc = [{"id": k, "name": "item %d" % k, "vals": [k, k*0.5, None, True], "tags": {"a": "x"}} for k in range(50)]
+        data = jsoncodec.encode(doc)
+        with CountNoMatch() as counter:
+            self.assertEqual(CodecSet.decode(jsoncodec, data), doc)
+        self.assertEqual(counter.count, 0)
+
+    def test_mixed_protocols(self):
+        codec = ListCodec(CodecSet([RaisingCodec(), ReturningCodec(), intcodec]))
+        self.assertEqual(codec.decode("[@, #, 1, @]"), ["at", "hash", 1, "at"])
+        self.assertRaises(DecodeError, codec.decode, "[@, x]")
+        self.assertEqual(ReturningCodec().decode("#"), "hash")
+        self.assertRaises(NoMatch, ReturningCodec()._decode, ReadBuffer(None, "@"))
+        self.assertIs(RaisingCodec()._trydecode(ReadBuffer(None, "#")), NO_MATCH)
+
+    def test_reimplemented_decode(self):
+        # The inherited RegExCodec._trydecode must not bypass OddIntCodec._decode.
+        odd = OddIntCodec(regex.compile(r"\d+"), hook=int)
+        codec = ListCodec(CodecSet([odd, RegExCodec(regex.compile(r"\d+"), hook=lambda s: ("even", int(s)))]))
+        self.assertEqual(codec.decode("[1, 2, 3]"), [1, ("even", 2), 3])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/python
+"""
+Tests for paralleldecode: results, and the exceptions raised on malformed data, must be the same as for decode,
+whether the items are decoded by the workers or, where they cannot be, in the calling process.
+"""
+import io
+import os
+import pathlib
+import tempfile
+import threading
+import unittest
+
+from codecfactory import (ListCodec, DictCodec, pystringcodec, intcodec, paralleldecode, DecodeError, NoMatch,
+                          KWARGS)
+from codecfactory.jsoncodec import jsoncodec
+
+def outcome(f, *args, **kwargs):
+    try:
+        return "ok", f(*args, **kwargs)
+    except (DecodeError, NoMatch) as exc:
+        return type(exc).__name__, str(exc), exc.offset
+
+class Record(object):
+    """Item hook result that remembers the process that decoded it."""
+    def __init__(self, **kwargs):
+        self.fields = kwargs
+        self.pid = os.getpid()
+
+    def __eq__(self, other):
+        return isinstance(other, Record) and self.fields == other.fields
+
+class Locked(Record):
+    """Cannot be pickled, so it cannot be sent back from a worker."""
+    def __init__(self, **kwargs):
+        Record.__init__(self, **kwargs)
+        self.lock = threading.Lock()
+
+def records(n):
+    return [{"id": k, "name": "r%d, [with] {delims} \\\" ," % k, "vals": [k, [k]], "d": {"k": "}"}} for k in range(n)]
+
+class ParallelDecode(unittest.TestCase):
+    def test_equivalence(self):
+        for codec, obj in [(jsoncodec, records(300)),
+                           (DictCodec(pystringcodec, jsoncodec), {"k%d" % k: v for k, v in enumerate(records(300))}),
+                           (ListCodec(intcodec), list(range(3000)))]:
+            data = codec.encode(obj)
+            for source in (data, data.encode("utf-8"), "  %s\n" % data):
+                self.assertEqual(paralleldecode(codec, source, workers=2, chunksize=512), obj)
+
+    def test_workers(self):
+        codec = ListCodec(DictCodec(pystringcodec, intcodec, hook=Record, hook_mode=KWARGS))
+        data = ListCodec(DictCodec(pystringcodec, intcodec)).encode([{"a": k, "b": 2*k} for k in range(2000)])
+        result = paralleldecode(codec, data, workers=2, chunksize=1024)
+        self.assertEqual(result, codec.decode(data))
+        self.assertTrue(any(record.pid != os.getpid() for record in result))
+
+    def test_unpicklable_results(self):
+        codec = ListCodec(DictCodec(pystringcodec, intcodec, hook=Locked, hook_mode=KWARGS))
+        data = ListCodec(DictCodec(pystringcodec, intcodec)).encode([{"a": k} for k in range(2000)])
+        self.assertEqual(paralleldecode(codec, data, workers=2, chunksize=1024), codec.decode(data))
+
+    def test_files(self):
+        data = jsoncodec.encode(records(300)).encode("utf-8")
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            self.assertEqual(paralleldecode(jsoncodec, pathlib.Path(path), workers=2, chunksize=512), records(300))
+            with open(path, "rb") as f:
+                self.assertEqual(paralleldecode(jsoncodec, f, workers=2, chunksize=512), records(300))
+        finally:
+            os.remove(path)
+        self.assertEqual(paralleldecode(jsoncodec, io.BytesIO(data), workers=2, chunksize=512), records(300))
+
+    def test_errors(self):
+        data = jsoncodec.encode(records(300))
+        middle = data.index('"id": 150')
+        dictcodec = DictCodec(pystringcodec, jsoncodec)
+        dictdata = dictcodec.encode({"k%d" % k: k for k in range(1000)})
+        for codec, bad in [(jsoncodec, data[:middle] + "@" + data[middle + 1:]),
+                           (jsoncodec, data[:middle] + data[middle + 7:]),
+                           (jsoncodec, data + " x"),
+                           (jsoncodec, data[:-1]),
+                           (dictcodec, dictdata.replace('"k900"', '"k100"')),
+                           (dictcodec, dictdata.replace('"k900": 900', '"k900" 900'))]:
+            expected = outcome(codec.decode, bad)
+            self.assertNotEqual(expected[0], "ok")
+            self.assertEqual(outcome(paralleldecode, codec, bad, workers=2, chunksize=512), expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+"""
+Tests for iterquery and query: the values found must be those at the same path in the decoded object, the same
+errors must be raised as by decode when the data read is malformed, and reading must stop at the value found.
+"""
+import io
+import unittest
+
+from codecfactory import (DictCodec, ListCodec, pystringcodec, intcodec, ANY, iterquery, query, DecodeError,
+                          NoMatch, KWARGS)
+from codecfactory.jsoncodec import jsoncodec
+
+def select(obj, path):
+    """Reference implementation of iterquery on a decoded object."""
+    if not path:
+        yield obj
+        return
+    key, rest = path[0], path[1:]
+    if isinstance(obj, list):
+        if key is ANY:
+            for item in obj:
+                yield from select(item, rest)
+        elif isinstance(key, int) and 0 <= key < len(obj):
+            yield from select(obj[key], rest)
+    elif isinstance(obj, dict):
+        if key is ANY:
+            for value in obj.values():
+                yield from select(value, rest)
+        elif key in obj:
+            yield from select(obj[key], rest)
+
+def outcome(f, *args):
+    try:
+        result = f(*args)
+        if hasattr(result, "__next__"):
+            result = list(result)
+        return "ok", result
+    except (DecodeError, NoMatch) as exc:
+        return type(exc).__name__, str(exc)
+
+class CountingReader(io.StringIO):
+    reads = 0
+
+    def read(self, *args):
+        self.reads += 1
+        return io.StringIO.read(self, *args)
+
+    def readline(self, *args):
+        self.reads += 1
+        return io.StringIO.readline(self, *args)
+
+class Point(object):
+    def __init__(self, x, y=0):
+        self.x = x
+        self.y = y
+
+DOCUMENTS = [
+    '[1, [2, 3], {"a": [4, {"b": 5}], "c": "six"}, []]',
+    '{"a": {"b": [1, 2, {"c": 3}]}, "d": [[4], [5, 6]], "e": {}}',
+    '[[{"a": 1}, {"a": 2, "b": [3]}], [{"b": 4}]]',
+    '"scalar"',
+]
+
+PATHS = [[], [0], [1], [2, "a"], ["a", "b", 2, "c"], [ANY], [ANY, ANY], [ANY, "a"], ["d", ANY, 0], [ANY, ANY, "b"],
+         [5], ["missing"], [0, 0, 0]]
+
+class Query(unittest.TestCase):
+    def test_equivalence(self):
+        for data in DOCUMENTS:
+            obj = jsoncodec.decode(data)
+            for path in PATHS:
+                expected = list(select(obj, path))
+                for source in (data, data.encode("utf-8"), io.StringIO(data)):
+                    self.assertEqual(list(iterquery(jsoncodec, source, path)), expected, (data, path))
+
+    def test_query(self):
+        data = DOCUMENTS[1]
+        self.assertEqual(query(jsoncodec, data, ["a", "b", 1]), 2)
+        self.assertIsNone(query(jsoncodec, data, ["x"], None))
+        self.assertRaises(LookupError, query, jsoncodec, data, ["x"])
+
+    def test_stops_reading(self):
+        data = ListCodec(DictCodec(pystringcodec, intcodec)).encode([{"status": k} for k in range(20000)])
+        source = CountingReader(data)
+        self.assertEqual(query(jsoncodec, source, [10, "status"]), 10)
+        self.assertLess(source.reads, 100)
+
+    def test_errors(self):
+        for data in ['[1, 2', '{"a": 1, "a": 2}', '[1, [2, 3}]', '[1] x', '{"a": [1,,2]}', '{"a" 1}',
+                     '{"a": 1 "b": 2}']:
+            self.assertEqual(outcome(iterquery, jsoncodec, data, [ANY, ANY]), outcome(jsoncodec.decode, data), data)
+
+    def test_key_validation(self):
+        strict = DictCodec(pystringcodec, intcodec, required_args={"x"}, optional_args={"y"}, allow_unknown=False)
+        classed = DictCodec(pystringcodec, intcodec, allowedtype=Point, requireclasskey=True, hook=Point,
+                            hook_mode=KWARGS, required_args={"x"})
+        for codec in (strict, classed):
+            for data in ['{"x": 1, "x": 2}', '{"y": 1}', '{"x": 1, "z": 2}', '{}', '{"y": 1, "class": "a.B"}',
+                         '{"class": "%s.Point", "y": 1}' % __name__, '{"class": "other.Point", "x": 1}']:
+                expected = outcome(codec.decode, data)
+                if expected[0] != "ok":
+                    self.assertEqual(outcome(iterquery, codec, data, [ANY]), expected, data)
+
+if __name__ == "__main__":
+    unittest.main()
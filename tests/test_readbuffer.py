@@ -0,0 +1,101 @@
+#!/usr/bin/python
+"""
+Tests for ReadBuffer: decoding must not depend on how the data is split into reads, on whether pending chunks
+are joined or copied from, or on when the consumed prefix of the buffer is compacted.
+"""
+import io
+import unittest
+
+import regex
+
+from codecfactory import ReadBuffer, ReadPolicy, DecodeError, NoMatch
+from codecfactory.jsoncodec import jsoncodec
+
+DOCUMENTS = [
+    '[1, "a\\nb", {"key \\u00e9": [2.5, true, null]}, "%s"]' % ("x" * 300),
+    '{"a": "%s", "b": ["\\"", "\\\\", "\\t"], "c": -12}' % ("0123456789" * 50),
+    '[\n  "one",\n  "t\\x77o",\n  [3, [4, [5]]]\n]',
+    '"%s\\n%s"' % ("y" * 5000, "z" * 5000),
+]
+
+def outcome(f, *args):
+    try:
+        result = f(*args)
+        if hasattr(result, "__next__"):
+            result = list(result)
+        return "ok", result
+    except (DecodeError, NoMatch) as exc:
+        return type(exc).__name__, str(exc)
+
+def readbuffers(data):
+    """ReadBuffers over data that read it in small pieces, with and without joining the pending chunks."""
+    for size in (1, 3, 7, 64):
+        for binary in (False, True):
+            source = io.BytesIO(data.encode("utf-8")) if binary else io.StringIO(data)
+            readbuf = ReadBuffer(source, policy=ReadPolicy(minchunk=size, maxchunk=size, growth=1))
+            if size == 7:
+                # Never joined while it holds any live data, so accesses copy from the pending chunks.
+                readbuf.join_threshold = -1
+            readbuf.compact_watermark = 16
+            yield readbuf
+
+class ChunkBoundaries(unittest.TestCase):
+    def test_decode(self):
+        for data in DOCUMENTS:
+            expected = jsoncodec.decode(data)
+            for readbuf in readbuffers(data):
+                self.assertEqual(jsoncodec.decode(readbuf), expected, (data[:20], readbuf.policy.minchunk))
+
+    def test_iterdecode(self):
+        data = "\n".join(DOCUMENTS) + "\n"
+        expected = [jsoncodec.decode(doc) for doc in DOCUMENTS]
+        for readbuf in readbuffers(data):
+            self.assertEqual(list(jsoncodec.iterdecode(readbuf)), expected)
+
+    def test_errors(self):
+        for data in ['[1, 2,\n "x", @]', '["abc\\q"]', '{"a": [1, 2}', '[\n1,\n2\n', '"%s' % ("u" * 200)]:
+            expected = outcome(jsoncodec.iterdecode, data)
+            for readbuf in readbuffers(data):
+                self.assertEqual(outcome(jsoncodec.iterdecode, readbuf), expected, data)
+
+class Cursor(unittest.TestCase):
+    def test_accessors(self):
+        # Compare every accessor with the same operation on the undiscarded part of a str.
+        text = "".join("line %d: %s\n" % (k, "abc" * k) for k in range(60))
+        pattern = regex.compile(r"line (\d+): (?:abc)*\n")
+        for readbuf in readbuffers(text):
+            data = text.encode("utf-8") if readbuf.binary else text
+            needle = b"abcabc" if readbuf.binary else "abcabc"
+            readbuf.readatleast(len(text))
+            readbuf.readdata()
+            pos = 0
+            while pos < len(text):
+                rest = data[pos:]
+                self.assertEqual(len(readbuf), len(rest))
+                self.assertEqual(readbuf[:], rest)
+                self.assertEqual(readbuf[3:40], rest[3:40])
+                self.assertEqual(readbuf[-5:], rest[-5:])
+                self.assertEqual(readbuf.charat(10), rest[10])
+                self.assertIsNone(readbuf.charat(len(rest)))
+                self.assertEqual(readbuf.find("abcabc", 1), rest.find(needle, 1))
+                self.assertTrue(readbuf.string_match(rest[2:9], 2))
+                self.assertFalse(readbuf.string_match("line", 1))
+                match = readbuf.regex_op(pattern.match)
+                self.assertEqual(match.span(), (0, pattern.match(text, pos).end() - pos))
+                self.assertEqual(readbuf.abspos(0), (text.count("\n", 0, pos) + 1, 1))
+                readbuf.discard(match.end())
+                pos += match.end()
+            self.assertEqual(len(readbuf), 0)
+            self.assertEqual(readbuf.abspos(0), (61, 1))
+
+    def test_discard_into_pending(self):
+        readbuf = ReadBuffer(io.StringIO("abc\ndef\nghi\n"), policy=ReadPolicy(minchunk=4, maxchunk=4, growth=1))
+        readbuf.join_threshold = -1
+        for k in range(3):
+            readbuf.readdata()
+        readbuf.discard(6)
+        self.assertEqual((readbuf.data, readbuf.discarded, readbuf.abspos(0)), ("f\nghi\n", 6, (2, 3)))
+        self.assertEqual(readbuf.regex_op(regex.compile(r"f\n(\w+)").match).group(1), "ghi")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+"""
+Tests for ReadPolicy: the sizes of reads must grow geometrically while a token is incomplete and start over once
+data is discarded, and a ReadBuffer must never hold more than 'maxbuffer' characters.
+"""
+import io
+import unittest
+
+from codecfactory import ReadBuffer, ReadPolicy, BufferLimitExceeded, DecodeError, pystringcodec
+from codecfactory.jsoncodec import jsoncodec
+
+class RecordingReader(io.StringIO):
+    """Records the sizes requested by each read."""
+    def __init__(self, data):
+        io.StringIO.__init__(self, data)
+        self.sizes = []
+
+    def read(self, size=-1):
+        self.sizes.append(size)
+        return io.StringIO.read(self, size)
+
+    def readline(self, size=-1):
+        self.sizes.append(size)
+        return io.StringIO.readline(self, size)
+
+class Policy(unittest.TestCase):
+    def test_chunksize(self):
+        policy = ReadPolicy(minchunk=4, maxchunk=64, growth=2)
+        self.assertEqual([policy.chunksize(k) for k in range(7)], [4, 8, 16, 32, 64, 64, 64])
+        self.assertEqual(ReadPolicy(minchunk=100, maxchunk=10).maxchunk, 100)
+        self.assertEqual(ReadPolicy(minchunk=8, growth=1).chunksize(1000), 8)
+
+    def test_long_token(self):
+        # A minified document on a single line is read in growing pieces rather than all at once.
+        data = '"%s"' % ("x" * 100000)
+        source = RecordingReader(data)
+        readbuf = ReadBuffer(source, policy=ReadPolicy(minchunk=16, maxchunk=65536))
+        self.assertEqual(pystringcodec.decode(readbuf), "x" * 100000)
+        self.assertLess(len(source.sizes), 20)
+        self.assertEqual(max(source.sizes), 65536)
+        self.assertEqual(source.sizes[:3], [16, 32, 64])
+
+    def test_streak_resets(self):
+        data = "".join('{"k": %d}\n' % k for k in range(1000))
+        source = RecordingReader(data)
+        readbuf = ReadBuffer(source, policy=ReadPolicy(minchunk=16, maxchunk=65536))
+        self.assertEqual(len(list(jsoncodec.iterdecode(readbuf))), 1000)
+        self.assertLessEqual(max(source.sizes), 32)
+
+class MaxBuffer(unittest.TestCase):
+    def test_records_within_limit(self):
+        data = "".join('{"k": %d}\n' % k for k in range(1000))
+        readbuf = ReadBuffer(io.StringIO(data), policy=ReadPolicy(minchunk=16, maxbuffer=64))
+        self.assertEqual(list(jsoncodec.iterdecode(readbuf)), [{"k": k} for k in range(1000)])
+
+    def test_limit_exceeded(self):
+        data = '[1, 2, "%s"]' % ("y" * 1000)
+        for policy in (ReadPolicy(minchunk=16, maxbuffer=256), ReadPolicy(maxbuffer=256)):
+            readbuf = ReadBuffer(io.StringIO(data), policy=policy)
+            with self.assertRaises(BufferLimitExceeded) as cm:
+                jsoncodec.decode(readbuf)
+            self.assertIsInstance(cm.exception, DecodeError)
+            self.assertEqual(cm.exception.limit, 256)
+            self.assertLessEqual(len(readbuf), 256)
+            self.assertLessEqual(cm.exception.offset, 256)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/python
+"""
+Tests for StructIndex: the positions found must be those found by a scan of the data one character at a time,
+however the data is split into blocks, and decoding with an index must give the same results and errors as
+decoding without one.
+"""
+import unittest
+
+from codecfactory import (ListCodec, DictCodec, ReadBuffer, pystringcodec, intcodec, paralleldecode, DecodeError,
+                          NoMatch)
+from codecfactory.jsoncodec import jsoncodec
+
+try:
+    from codecfactory import StructIndex
+    import numpy
+except ImportError:
+    numpy = None
+
+DOCUMENTS = [
+    '[1, "a,]\\"", {"k": ["}", "\\\\"]}, "\\\\\\"", []]',
+    '{\n  "a": [1,\n 2],\n  "b\\n": {"c": "[{"}\n}\n',
+    '[%s]' % ", ".join('{"id": %d, "s": "x\\\\%s"}' % (k, "\\\"" * (k % 3)) for k in range(200)),
+    '"only \\" a string"',
+    '',
+]
+
+def scan(data):
+    """Returns the newlines, unescaped quotes and structural positions of data, one character at a time."""
+    newlines, quotes, positions = [], [], []
+    instring = escaped = False
+    for k, char in enumerate(data):
+        if char == "\n":
+            newlines.append(k)
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = instring
+        elif char == '"':
+            instring = not instring
+            quotes.append(k)
+            positions.append(k)
+        elif not instring and char in "[]{},:":
+            positions.append(k)
+    return newlines, quotes, positions
+
+def outcome(f, *args, **kwargs):
+    try:
+        return "ok", f(*args, **kwargs)
+    except (DecodeError, NoMatch) as exc:
+        return type(exc).__name__, str(exc), exc.offset
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class Index(unittest.TestCase):
+    def indexes(self, data):
+        class SmallBlocks(StructIndex):
+            blocksize = 5
+
+        for cls in (StructIndex, SmallBlocks):
+            yield cls(data, jsoncodec)
+            yield cls(data.encode("utf-8"), jsoncodec)
+
+    def test_positions(self):
+        for data in DOCUMENTS:
+            newlines, quotes, positions = scan(data)
+            for index in self.indexes(data):
+                self.assertEqual(index.newlines.tolist(), newlines, data)
+                self.assertEqual(index.quotes.tolist(), quotes, data)
+                self.assertEqual(index.positions.tolist(), positions, data)
+                self.assertEqual([chr(c) for c in index.chars.tolist()], [data[k] for k in positions])
+
+    def test_skip(self):
+        for data in DOCUMENTS:
+            for index in self.indexes(data):
+                for k in index.positions.tolist():
+                    if data[k] in '"[{' and (data[k] != '"' or index.quotes.tolist().index(k) % 2 == 0):
+                        # Whitespace between items is discarded, so the end is compared as an absolute offset.
+                        readbuf = ReadBuffer(None, data)
+                        end = readbuf.absoffset(jsoncodec._tryskip(readbuf, k))
+                        self.assertEqual(index.skip(k), end, (data, k))
+                    elif data[k] in ",:]}":
+                        self.assertIsNone(index.skip(k))
+
+    def test_abspos(self):
+        for data in DOCUMENTS:
+            for index in self.indexes(data):
+                for offset in range(0, len(data) + 1, 3):
+                    self.assertEqual(index.abspos(offset), ReadBuffer(None, data).abspos(offset))
+
+    def test_toplevel(self):
+        data = DOCUMENTS[0]
+        index = StructIndex(data, jsoncodec)
+        self.assertEqual(index.toplevel(",", 1).tolist(), [2, 11, 31, 39])
+        self.assertEqual(index.toplevel(",", 1, 20).tolist(), [2, 11])
+        self.assertEqual(index.toplevel(",", 20).tolist(), [23])
+
+    def test_decode_with_index(self):
+        codec = ListCodec(DictCodec(pystringcodec, jsoncodec))
+        data = DOCUMENTS[2]
+        bad = data.replace('"id": 150', '"id" 150')
+        for source in (data, bad, data.encode("utf-8"), bad.encode("utf-8")):
+            index = StructIndex(source, codec)
+            expected = outcome(codec.decode, source)
+            self.assertEqual(outcome(codec.decode, ReadBuffer(None, source, index=index)), expected)
+            self.assertEqual(outcome(paralleldecode, codec, source, workers=2, chunksize=256, index=index), expected)
+
+    def test_unsupported_codecs(self):
+        self.assertRaises(ValueError, StructIndex, "<<1>>", ListCodec(intcodec, begin_delim="<<", end_delim=">>"))
+        self.assertRaises(ValueError, StructIndex, "|1|", ListCodec(intcodec, begin_delim="|", end_delim="|"))
+
+if __name__ == "__main__":
+    unittest.main()